@@ -29,7 +29,7 @@ bl_info = {
 
 import bpy
 from bpy.types import Operator, AddonPreferences
-from bpy.props import StringProperty, IntProperty, BoolProperty
+from bpy.props import StringProperty, IntProperty, BoolProperty, FloatProperty
 
 if 'core' in locals():
     import imp
@@ -65,7 +65,54 @@ class ExampleAddonPreferences(AddonPreferences):
             name="Create DUPLI vert instance when count over",
             default=50,
             )
-
+    instance_tolerance = FloatProperty(
+            name="DUPLI vert rotation/scale tolerance",
+            description="Instances whose rotation and scale differ less than this share a DUPLI vert group (0 = exact)",
+            default=0.0001,
+            min=0.0,
+            precision=6,
+            )
+    geometry_cache_size = IntProperty(
+            name="Geometry cache size (MB)",
+            description="Memory used to keep packed meshes between exports",
+            default=512,
+            min=0,
+            )
+    export_threads = IntProperty(
+            name="Export threads (0 = all cores)",
+            default=0,
+            min=0,
+            )
+    stats_report = BoolProperty(
+            name="Write JSON performance report next to the MXS file",
+            default=False,
+            )
+    profile_stage = StringProperty(
+            name="cProfile stage (e.g. objects, instances, write)",
+            default="",
+            )
+    preview_threads = IntProperty(
+            name="Material preview renders at once",
+            default=2,
+            min=1,
+            max=16,
+            )
+    preview_cache_dir = StringProperty(
+            name="Material preview cache (empty = temp directory)",
+            subtype='DIR_PATH',
+            default="",
+            )
+    preview_sampling_level = FloatProperty(
+            name="Material preview sampling level",
+            default=8.0,
+            min=1.0,
+            max=50.0,
+            )
+    preview_time = FloatProperty(
+            name="Material preview time limit (sec)",
+            default=20.0,
+            min=1.0,
+            )
 
     def draw(self, context):
         layout = self.layout
@@ -73,6 +120,18 @@ class ExampleAddonPreferences(AddonPreferences):
         layout.prop(self, "camera_far_plane")
         layout.prop(self, "draw_bounds")
         layout.prop(self, "max_instance")
+        layout.prop(self, "instance_tolerance")
+        layout.label(text="MXS export options:")
+        layout.prop(self, "geometry_cache_size")
+        layout.prop(self, "export_threads")
+        layout.label(text="Performance:")
+        layout.prop(self, "stats_report")
+        layout.prop(self, "profile_stage")
+        layout.label(text="Material previews:")
+        layout.prop(self, "preview_threads")
+        layout.prop(self, "preview_cache_dir")
+        layout.prop(self, "preview_sampling_level")
+        layout.prop(self, "preview_time")
 
 
 
@@ -0,0 +1,262 @@
+__author__ = 'Martijn Berger'
+__license__ = "GPL"
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+# Headless batch conversion of MXS -> .blend and .blend -> MXS.
+#
+# Run the driver with any python 3:
+#
+#   python batch.py --blender /path/to/blender --output out/ archive/ more.mxs scene.blend
+#
+# It starts one background blender per file (blender -b -P batch.py -- --worker ...), --jobs at
+# a time, so a crash in one file never takes the others down. Every finished file is appended
+# to a JSON lines summary (timings, stage reports, failures); running the same command again
+# skips the files the summary already lists as converted.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+CONVERSIONS = {'.mxs': '.blend', '.blend': '.mxs'}
+SUMMARY_NAME = 'mxs_batch.jsonl'
+
+
+def collect_files(paths, recursive=False):
+    ''' expand directories in paths into the .mxs / .blend files they contain, sorted '''
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                files.extend(os.path.join(root, n) for n in names
+                             if os.path.splitext(n)[1].lower() in CONVERSIONS)
+                if not recursive:
+                    break
+        elif os.path.splitext(path)[1].lower() in CONVERSIONS:
+            files.append(path)
+    return sorted(set(os.path.abspath(f) for f in files))
+
+
+def output_path(source, output_dir=None):
+    base, ext = os.path.splitext(source)
+    if output_dir is not None:
+        base = os.path.join(output_dir, os.path.basename(base))
+    return base + CONVERSIONS[ext.lower()]
+
+
+def source_signature(source):
+    st = os.stat(source)
+    return [st.st_size, st.st_mtime]
+
+
+def load_summary(path):
+    ''' source -> last summary record, lines cut short by a crash are ignored '''
+    done = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                done[record['source']] = record
+    return done
+
+
+def is_converted(record, source):
+    return (record is not None and record['status'] == 'ok' and os.path.exists(record['output'])
+            and record.get('signature') == source_signature(source))
+
+
+class BatchConverter():
+    '''
+        Drives the background blender processes and keeps the summary file.
+        blender -> executable, addon -> module name the addon is installed as
+    '''
+    def __init__(self, blender, addon, summary_path, output_dir=None, jobs=0, timeout=None, log_dir=None):
+        self.blender = blender
+        self.addon = addon
+        self.summary_path = summary_path
+        self.output_dir = output_dir
+        self.jobs = jobs or os.cpu_count() or 1
+        self.timeout = timeout
+        self.log_dir = log_dir or os.path.join(os.path.dirname(summary_path), 'logs')
+
+    def pending(self, files, retry_failed=True):
+        previous = load_summary(self.summary_path)
+        todo = []
+        for source in files:
+            record = previous.get(source)
+            if is_converted(record, source):
+                continue
+            if record is not None and record['status'] != 'ok' and not retry_failed:
+                continue
+            todo.append(source)
+        return todo
+
+    def command(self, source, output, result):
+        return [self.blender, '-b', '-noaudio', '-P', os.path.abspath(__file__), '--',
+                '--worker', '--addon', self.addon, '--result', result, source, output]
+
+    def convert(self, source):
+        ''' convert one file in its own blender process, returns the summary record '''
+        output = output_path(source, self.output_dir)
+        record = {'source': source, 'output': output, 'signature': source_signature(source),
+                  'status': 'failed', 'error': None, 'wall': 0.0, 'report': None}
+        fd, result = tempfile.mkstemp(suffix='.json', prefix='mxs_batch_')
+        os.close(fd)
+        log_path = os.path.join(self.log_dir, os.path.basename(source) + '.log')
+        t1 = time.time()
+        try:
+            with open(log_path, 'w') as log:
+                proc = subprocess.run(self.command(source, output, result), stdout=log,
+                                      stderr=subprocess.STDOUT, timeout=self.timeout)
+            record['returncode'] = proc.returncode
+            with open(result) as f:
+                record.update(json.load(f))
+            if record['status'] == 'ok' and proc.returncode != 0:
+                record['status'] = 'failed'
+                record['error'] = 'blender exited with %d' % proc.returncode
+        except subprocess.TimeoutExpired:
+            record['error'] = 'timed out after %s sec.' % self.timeout
+        except ValueError: # worker died before writing its result
+            record['error'] = 'blender exited with %d, see %s' % (record['returncode'], log_path)
+        except OSError as e: # blender missing or not executable, log directory gone
+            record['error'] = 'could not run %s: %s' % (self.blender, e)
+        finally:
+            os.remove(result)
+        record['wall'] = time.time() - t1
+        record['log'] = log_path
+        return record
+
+    def run(self, files, retry_failed=True):
+        todo = self.pending(files, retry_failed)
+        os.makedirs(self.log_dir, exist_ok=True)
+        if self.output_dir is not None:
+            os.makedirs(self.output_dir, exist_ok=True)
+        print('converting %d of %d files using %d processes' % (len(todo), len(files), self.jobs))
+        failed = 0
+        t1 = time.time()
+        with ThreadPoolExecutor(self.jobs) as pool, open(self.summary_path, 'a') as summary:
+            futures = {pool.submit(self.convert, source): source for source in todo}
+            for future in as_completed(futures):
+                record = future.result()
+                # one line per file, flushed right away so a crash of the driver loses nothing
+                summary.write(json.dumps(record, sort_keys=True) + '\n')
+                summary.flush()
+                if record['status'] != 'ok':
+                    failed += 1
+                print('%-6s %7.2f sec. %s%s' % (record['status'], record['wall'], record['source'],
+                                                 ': ' + record['error'] if record['error'] else ''))
+        print('done in %.2f sec., %d failed, summary in %s' % (time.time() - t1, failed, self.summary_path))
+        return failed
+
+
+# --- inside blender -------------------------------------------------------------------------
+
+def clear_scene(bpy):
+    scene = bpy.context.scene
+    for ob in list(scene.objects):
+        scene.objects.unlink(ob)
+        bpy.data.objects.remove(ob)
+
+
+def worker(addon, source, output, result):
+    ''' runs inside a background blender, converts source to output and writes result json '''
+    import bpy
+    import addon_utils
+    import importlib
+
+    record = {'status': 'failed', 'error': None, 'report': None}
+    try:
+        addon_utils.enable(addon, default_set=True)
+        stats = importlib.import_module(addon + '.outputs.stats')
+        if source.lower().endswith('.mxs'):
+            SceneImporter = importlib.import_module(addon + '.importer.SceneImporter').SceneImporter
+            clear_scene(bpy)
+            SceneImporter().set_filename(source).load(bpy.context, import_camera=True, import_material=True,
+                                                       import_meshes=True, import_instances=True,
+                                                       apply_scale=True, handle_proxy_group=True,
+                                                       reuse_images=True, batched_meshes=True,
+                                                       deferred_meshes=False)
+            bpy.ops.wm.save_as_mainfile(filepath=output, check_existing=False)
+        else:
+            exporter = importlib.import_module(addon + '.exporter')
+            bpy.ops.wm.open_mainfile(filepath=source)
+            if os.path.exists(output):
+                os.remove(output) # save() does not report failure, the file existing afterwards does
+            exporter.save(None, bpy.context, filepath=output, pipelined=True, streaming=True)
+        report = stats.last()
+        if report is not None:
+            record['report'] = report.as_dict()
+        if os.path.exists(output):
+            record['status'] = 'ok'
+        else:
+            record['error'] = 'no output written'
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        record['error'] = '%s: %s' % (type(e).__name__, e)
+    with open(result, 'w') as f:
+        json.dump(record, f)
+
+
+# --- command line ---------------------------------------------------------------------------
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Convert MXS files to .blend and .blend files to MXS')
+    parser.add_argument('paths', nargs='+', help='files and directories to convert')
+    parser.add_argument('-o', '--output', help='output directory (default: next to each source)')
+    parser.add_argument('-j', '--jobs', type=int, default=0, help='blender processes (default: all cores)')
+    parser.add_argument('-r', '--recursive', action='store_true', help='search directories recursively')
+    parser.add_argument('--blender', default=os.environ.get('BLENDER', 'blender'), help='blender executable')
+    parser.add_argument('--addon', default=os.path.basename(os.path.dirname(os.path.abspath(__file__))),
+                        help='module name the addon is installed as')
+    parser.add_argument('--summary', help='JSON lines summary, also used to resume (default: %s in the output '
+                                          'directory or the current directory)' % SUMMARY_NAME)
+    parser.add_argument('--timeout', type=float, help='seconds before a single file is given up on')
+    parser.add_argument('--skip-failed', action='store_true', help='do not retry files that failed before')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    if args.worker:
+        source, output = args.paths
+        worker(args.addon, source, output, args.result)
+        return 0
+    summary = args.summary or os.path.join(args.output or os.getcwd(), SUMMARY_NAME)
+    files = collect_files(args.paths, args.recursive)
+    output_dir = os.path.abspath(args.output) if args.output else None
+    converter = BatchConverter(args.blender, args.addon, os.path.abspath(summary), output_dir,
+                               args.jobs, args.timeout)
+    return 1 if converter.run(files, not args.skip_failed) else 0
+
+
+if __name__ == '__main__':
+    if '--' in sys.argv: # started by blender -P, our arguments follow '--'
+        argv = sys.argv[sys.argv.index('--') + 1:]
+        # make the addon importable when running from a checkout instead of the addons directory
+        sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        main(argv)
+    else:
+        sys.exit(main(sys.argv[1:]))
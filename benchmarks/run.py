@@ -0,0 +1,326 @@
+__author__ = 'Martijn Berger'
+__license__ = "GPL"
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+# Benchmark runner, from the addon directory:
+#
+#   python -m benchmarks.run --triangles 1k,1M,10M --instances 10k,1M --json before.json
+#   python -m benchmarks.run --triangles 1k,1M,10M --instances 10k,1M --compare before.json
+#
+# Every benchmark is set up first (scene generation is not timed), then run --repeat times;
+# the fastest run is reported together with the peak resident memory above the level
+# right before it started.
+
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import numpy as np
+
+from . import standins
+from . import scenes
+
+BENCHMARKS = OrderedDict()   # name -> (scale option, setup function)
+
+
+def benchmark(name, scale):
+    ''' register setup(n) -> run() -> (items, triangles, vertices) under name, sized by scale option '''
+    def register(setup):
+        BENCHMARKS[name] = (scale, setup)
+        return setup
+    return register
+
+
+class PeakSampler():
+    ''' samples resident memory from a background thread while a benchmark runs '''
+    def __init__(self, interval=0.005):
+        from .standins import addon_module
+        self.current_rss = addon_module('outputs.memory').current_rss
+        self.interval = interval
+
+    def __enter__(self):
+        self.baseline = self.peak = self.current_rss()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.running = False
+        self.thread.join()
+        self.peak = max(self.peak, self.current_rss())
+
+    def _run(self):
+        while self.running:
+            self.peak = max(self.peak, self.current_rss())
+            time.sleep(self.interval)
+
+
+def importer_for(mxs_scene=None, **prefs):
+    SceneImporter = standins.addon_module('importer.SceneImporter').SceneImporter
+    importer = SceneImporter()
+    importer.context = sys.modules['bpy'].context
+    importer.mxs_scene = mxs_scene
+    importer.materials = {}
+    importer.prefs = SimpleNamespace(max_instance=prefs.get('max_instance', 50),
+                                     instance_tolerance=prefs.get('instance_tolerance', 0.0001),
+                                     draw_bounds=5000, camera_far_plane=1250)
+    return importer
+
+
+# --- export ---------------------------------------------------------------------------------
+
+def _export_mesh(n, warm):
+    exporter = standins.addon_module('exporter')
+    ob = scenes.mesh_objects(1, scenes.grid_mesh('grid', n))[0]
+    scene = sys.modules['bpy'].context.scene
+    if warm:
+        exporter.export_mesh(ob, scene, standins.MxsScene(), {})
+    def run():
+        if not warm:
+            exporter.geometry_cache.clear()
+        exporter.export_mesh(ob, scene, standins.MxsScene(), {})
+        return 1, len(ob.data.tessfaces) * 2, len(ob.data.vertices)
+    return run
+
+@benchmark('export_mesh', 'triangles')
+def export_mesh_cold(n):
+    ''' evaluate, pack and write one mesh, geometry cache empty '''
+    return _export_mesh(n, False)
+
+@benchmark('export_mesh_cached', 'triangles')
+def export_mesh_warm(n):
+    ''' same mesh exported again, packed buffers come from the geometry cache '''
+    return _export_mesh(n, True)
+
+@benchmark('export_mesh_data', 'triangles')
+def export_mesh_data(n):
+    ''' per element fallback used without numpy '''
+    exporter = standins.addon_module('exporter')
+    ob = scenes.mesh_objects(1, scenes.grid_mesh('grid', n))[0]
+    def run():
+        exporter.export_mesh_data(ob, ob.data, standins.MxsScene())
+        return 1, len(ob.data.tessfaces) * 2, len(ob.data.vertices)
+    return run
+
+@benchmark('export_mesh_instances', 'instances')
+def export_mesh_instances(n):
+    ''' n objects sharing one small mesh, all but the first become instancements '''
+    exporter = standins.addon_module('exporter')
+    objects = scenes.mesh_objects(n, scenes.grid_mesh('shared', 12))
+    scene = sys.modules['bpy'].context.scene
+    def run():
+        instances = {}
+        mxs_scene = standins.MxsScene()
+        for ob in objects:
+            exporter.export_mesh(ob, scene, mxs_scene, instances)
+        return n, 0, 0
+    return run
+
+
+# --- import ---------------------------------------------------------------------------------
+
+def _write_mesh_data(n, batched):
+    obj = scenes.GridObject('grid', n, materials=3)
+    def run():
+        standins.reset()
+        importer = importer_for()
+        importer.materials = {m.name: m for m in obj.materials}
+        if batched:
+            importer.write_mesh_data_batched(obj, obj.name)
+        else:
+            importer.write_mesh_data(obj, obj.name)
+        return 1, obj.num_triangles, obj.num_vertices
+    return run
+
+@benchmark('write_mesh_data', 'triangles')
+def write_mesh_data(n):
+    ''' MXS grid with 3 materials and UVs to a blender mesh, per element '''
+    return _write_mesh_data(n, False)
+
+@benchmark('write_mesh_data_batched', 'triangles')
+def write_mesh_data_batched(n):
+    ''' same conversion through the numpy path '''
+    return _write_mesh_data(n, True)
+
+def _write_instances(n, max_instance):
+    mxs_scene = scenes.InstanceScene(n)
+    def run():
+        standins.reset()
+        bpy = sys.modules['bpy']
+        importer = importer_for(mxs_scene, max_instance=max_instance)
+        importer.materials = {m.name: m for m in mxs_scene.materials}
+        importer.ob_dict = {}
+        for source in mxs_scene.sources:
+            name = importer.cleanup_name(source.getName())
+            ob = bpy.data.objects.new(name, bpy.data.meshes.new(name))
+            ob.data.vertices.add(source.num_vertices)
+            importer.ob_dict[name] = (ob, standins.Matrix.Identity(4), False)
+        importer.write_instances()
+        return n, 0, 0
+    return run
+
+@benchmark('write_instances', 'instances')
+def write_instances(n):
+    ''' every (source, material) pair is over max_instance: dupli vert groups '''
+    return _write_instances(n, 50)
+
+@benchmark('write_instances_copies', 'instances')
+def write_instances_copies(n):
+    ''' max_instance above the count: one object copy per instance '''
+    return _write_instances(n, n + 1)
+
+@benchmark('cleanup_name', 'names')
+def cleanup_name(n):
+    ''' n MXS names, about 100 per base name, many only differing in stripped suffixes '''
+    names = scenes.duplicate_names(n)
+    def run():
+        importer = importer_for()
+        for name in names:
+            importer.cleanup_name(name)
+        return n, 0, 0
+    return run
+
+@benchmark('write_hdr', 'pixels')
+def write_hdr(n):
+    ''' 2:1 environment map of about n pixels, half of it flat sky, encoded and written as RGBE '''
+    hdr = standins.addon_module('exporter.hdr')
+    height = max(1, int((n / 2) ** 0.5))
+    pixels = np.random.default_rng(0).random((height, 2 * height, 4), dtype=np.float32) * 4.0
+    pixels[:height // 2] = 0.5
+    directory = tempfile.mkdtemp(prefix='maxwell_bench_')
+    def run():
+        hdr.write_hdr(os.path.join(directory, 'environment.hdr'), pixels, flip=True)
+        return pixels.shape[0] * pixels.shape[1], 0, 0
+    return run
+
+
+# --- runner ---------------------------------------------------------------------------------
+
+def parse_scale(text):
+    ''' "1k,100k,10M" -> [1000, 100000, 10000000] '''
+    units = {'k': 1000, 'K': 1000, 'm': 1000000, 'M': 1000000}
+    values = []
+    for part in text.split(','):
+        part = part.strip()
+        if part:
+            values.append(int(float(part[:-1]) * units[part[-1]]) if part[-1] in units else int(part))
+    return values
+
+
+def measure(setup, n, repeat):
+    run = setup(n)
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        with PeakSampler() as memory:
+            t1 = time.perf_counter()
+            items, triangles, vertices = run()
+            wall = time.perf_counter() - t1
+        if best is None or wall < best['wall']:
+            best = {'wall': wall, 'items': items, 'triangles': triangles, 'vertices': vertices,
+                    'peak_memory': memory.peak - memory.baseline}
+    for key in ('items', 'triangles', 'vertices'):
+        best[key + '_per_sec'] = best[key] / best['wall'] if best['wall'] > 0 else 0.0
+    del run
+    standins.reset()
+    return best
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=standins.ADDON_PATH,
+                                       stderr=subprocess.DEVNULL).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def format_rate(rate):
+    for unit in ('', 'k', 'M'):
+        if rate < 1000.0:
+            return '%.1f%s/s' % (rate, unit)
+        rate /= 1000.0
+    return '%.1fG/s' % rate
+
+
+def print_result(result, previous=None):
+    memory = standins.addon_module('outputs.memory')
+    rate = result['triangles_per_sec'] if result['triangles'] else result['items_per_sec']
+    line = '%-26s %10d %10.4f s %12s %12s' % (result['name'], result['scale'], result['wall'],
+                                              format_rate(rate), memory.format_bytes(result['peak_memory']))
+    if previous is not None and result['wall'] > 0:
+        line += '   %5.2fx' % (previous['wall'] / result['wall'])
+    print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the importer / exporter hot paths with stand-ins')
+    parser.add_argument('--triangles', default='1k,100k,1M', help='mesh sizes, e.g. 1k,1M,10M')
+    parser.add_argument('--instances', default='1k,100k', help='instance counts, e.g. 10k,1M')
+    parser.add_argument('--names', default='100k', help='object name counts')
+    parser.add_argument('--pixels', default='64k,1M,8M', help='environment map sizes')
+    parser.add_argument('--only', default='', help='comma separated benchmark names to run')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per benchmark, the fastest is kept')
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--compare', help='results file of an earlier run to compare wall times with')
+    parser.add_argument('--list', action='store_true', help='list the benchmarks and exit')
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, (scale, setup) in BENCHMARKS.items():
+            print('%-26s %-10s %s' % (name, scale, (setup.__doc__ or '').strip()))
+        return 0
+
+    standins.install()
+    scales = {'triangles': parse_scale(args.triangles), 'instances': parse_scale(args.instances),
+              'names': parse_scale(args.names), 'pixels': parse_scale(args.pixels)}
+    only = set(filter(None, args.only.split(',')))
+    previous = {}
+    if args.compare:
+        with open(args.compare) as f:
+            previous = {(r['name'], r['scale']): r for r in json.load(f)['results']}
+
+    print('%-26s %10s %12s %12s %12s' % ('benchmark', 'scale', 'wall', 'throughput', 'peak memory'))
+    results = []
+    for name, (scale, setup) in BENCHMARKS.items():
+        if only and not name in only:
+            continue
+        for n in scales[scale]:
+            result = measure(setup, n, max(1, args.repeat))
+            result.update(name=name, scale=n)
+            results.append(result)
+            print_result(result, previous.get((name, n)))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'revision': git_revision(), 'python': platform.python_version(),
+                       'numpy': np.__version__, 'machine': platform.machine(), 'processor': platform.processor(),
+                       'cpus': os.cpu_count(), 'time': time.time(), 'results': results},
+                      f, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,239 @@
+__author__ = 'Martijn Berger'
+__license__ = "GPL"
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+# Synthetic, seeded scenes for the benchmarks. Meshes are regular grids of quads so their
+# MXS side can be computed per call instead of being held in memory, which keeps a 10M
+# triangle scene cheap to set up and out of the memory numbers.
+
+import math
+
+import numpy as np
+
+from .standins import Cvector, Cbase, Matrix, Mesh, Object
+
+
+def grid_size(triangles):
+    ''' (columns, rows) of a grid of quads with at least the given number of triangles '''
+    quads = max(1, (triangles + 1) // 2)
+    w = int(math.ceil(math.sqrt(quads)))
+    return w, int(math.ceil(quads / float(w)))
+
+
+def random_rotations(count, rng):
+    ''' count random 3x3 rotation matrices with a uniform scale in [0.5, 2) '''
+    q = rng.normal(size=(count, 4))
+    q /= np.linalg.norm(q, axis=1)[:, None]
+    w, x, y, z = q.T
+    r = np.empty((count, 3, 3))
+    r[:, 0] = np.column_stack((1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)))
+    r[:, 1] = np.column_stack((2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)))
+    r[:, 2] = np.column_stack((2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)))
+    return r * rng.uniform(0.5, 2.0, size=count)[:, None, None]
+
+
+class NullMaterial():
+    name = ''
+
+    def isNull(self):
+        return True
+
+
+class MxsMaterial():
+    def __init__(self, name):
+        self.name = name
+
+    def isNull(self):
+        return False
+
+
+class GridObject():
+    '''
+        MXS mesh object as the importer sees it: a grid of quads split into triangles,
+        every vertex has its own normal, materials alternate per quad
+    '''
+    def __init__(self, name, triangles, materials=1, uv=True):
+        self.name = name
+        self.w, self.h = grid_size(triangles)
+        self.num_triangles = self.w * self.h * 2
+        self.num_vertices = (self.w + 1) * (self.h + 1)
+        self.materials = [MxsMaterial('%s_mat%d' % (name, i)) for i in range(materials)]
+        self.uv = uv
+
+    def isNull(self):
+        return False
+
+    def isMesh(self):
+        return True
+
+    def isInstance(self):
+        return 0
+
+    def getName(self):
+        return self.name
+
+    def getNumChannelsUVW(self):
+        return 1 if self.uv else 0
+
+    def getNumTriangles(self):
+        return self.num_triangles
+
+    def getNumVertexes(self):
+        return self.num_vertices
+
+    def _corners(self, i):
+        r, c = divmod(i >> 1, self.w)
+        a = r * (self.w + 1) + c
+        d = a + self.w + 1
+        return (a, a + 1, d + 1) if i & 1 == 0 else (d + 1, d, a)
+
+    def getTriangle(self, i):
+        a, b, c = self._corners(i)
+        return a, b, c, a, b, c
+
+    def getTriangleMaterial(self, i):
+        return self.materials[(i >> 1) % len(self.materials)]
+
+    def getTriangleUVW(self, i, channel):
+        w1 = self.w + 1
+        uvw = []
+        for v in self._corners(i):
+            r, c = divmod(v, w1)
+            uvw.extend((c / float(self.w), r / float(self.h), 0.0))
+        return tuple(uvw)
+
+    def getVertex(self, i, step):
+        r, c = divmod(i, self.w + 1)
+        return Cvector(float(c), float(r), 0.0)
+
+    def getNormal(self, i, step):
+        return Cvector(0.0, 0.0, 1.0)
+
+    def getMaterial(self):
+        return self.materials[0]
+
+
+def grid_mesh(name, triangles):
+    ''' blender side of GridObject: a Mesh with quad tessfaces, loops and polygons filled in '''
+    w, h = grid_size(triangles)
+    rows, cols = np.mgrid[0:h + 1, 0:w + 1]
+    co = np.column_stack((cols.ravel(), rows.ravel(), np.zeros(cols.size))).astype(np.float32)
+    r, c = np.mgrid[0:h, 0:w]
+    a = (r * (w + 1) + c).ravel()
+    quads = np.column_stack((a, a + 1, a + w + 2, a + w + 1)).astype(np.int32)
+
+    me = Mesh(name)
+    me.vertices.add(len(co))
+    me.vertices.foreach_set("co", co.ravel())
+    me.vertices.foreach_set("normal", np.tile(np.float32([0, 0, 1]), len(co)))
+    me.tessfaces.add(len(quads))
+    me.tessfaces.foreach_set("vertices_raw", quads.ravel())
+    me.loops.add(quads.size)
+    me.loops.foreach_set("vertex_index", quads.ravel())
+    me.polygons.add(len(quads))
+    me.polygons.foreach_set("loop_total", np.full(len(quads), 4, dtype=np.int32))
+    return me
+
+
+def mesh_objects(count, me, seed=0):
+    ''' count blender objects sharing me, each with its own random world matrix '''
+    rng = np.random.RandomState(seed)
+    rotations = random_rotations(count, rng)
+    locations = rng.uniform(-100.0, 100.0, size=(count, 3))
+    objects = []
+    for i in range(count):
+        ob = Object('%s.%06d' % (me.name, i), me)
+        m = np.identity(4)
+        m[:3, :3] = rotations[i]
+        m[:3, 3] = locations[i]
+        ob.matrix_world = Matrix(m)
+        objects.append(ob)
+    return objects
+
+
+class Instance():
+    ''' MXS instance object, its base and pivot are built from the scene arrays on request '''
+    __slots__ = ('scene', 'i')
+
+    def __init__(self, scene, i):
+        self.scene = scene
+        self.i = i
+
+    def isNull(self):
+        return False
+
+    def isMesh(self):
+        return False
+
+    def isInstance(self):
+        return 1
+
+    def getInstanced(self):
+        return self.scene.sources[self.i % len(self.scene.sources)]
+
+    def getMaterial(self):
+        materials = self.scene.materials
+        return materials[self.i % len(materials)]
+
+    def getBaseAndPivot(self):
+        s = self.scene
+        x, y, z = s.rotations[s.rotation_index[self.i]].T.tolist()
+        o = s.locations[self.i].tolist()
+        base = Cbase().set(Cvector(*o), Cvector(1.0, 0.0, 0.0), Cvector(0.0, 1.0, 0.0), Cvector(0.0, 0.0, 1.0))
+        pivot = Cbase().set(Cvector(0.0, 0.0, 0.0), Cvector(*x), Cvector(*y), Cvector(*z))
+        return base, pivot
+
+
+class InstanceScene():
+    '''
+        MXS scene of count instances spread over a few source objects and materials.
+        Rotations are picked from a small pool so the dupli vert clustering finds groups.
+    '''
+    def __init__(self, count, sources=4, materials=2, rotations=16, seed=0):
+        rng = np.random.RandomState(seed)
+        self.count = count
+        self.sources = [GridObject('source%d' % i, 12) for i in range(sources)]
+        self.materials = [MxsMaterial('instance_mat%d' % i) for i in range(materials)] + [NullMaterial()]
+        self.rotations = random_rotations(rotations, rng)
+        self.rotation_index = rng.randint(0, rotations, size=count)
+        self.locations = rng.uniform(-1000.0, 1000.0, size=(count, 3))
+
+    def getObjectIterator(self):
+        for source in self.sources:
+            yield source
+        for i in range(self.count):
+            yield Instance(self, i)
+
+
+def duplicate_names(count, bases=None, seed=0):
+    '''
+        count MXS style object names drawn from a small set of base names. Most of them are
+        distinct but clean up to the same base (' [1.0.2]' / '[3]' suffixes, leading spaces),
+        the undecorated ones repeat exactly
+    '''
+    rng = np.random.RandomState(seed)
+    bases = bases or max(1, count // 100)
+    names = []
+    for i, (b, decoration) in enumerate(zip(rng.randint(0, bases, size=count).tolist(),
+                                            rng.randint(0, 4, size=count).tolist())):
+        name = 'object%d' % b
+        if decoration == 1:
+            name += ' [%d.%d.%d]' % (i % 1000, i // 1000 % 1000, i // 1000000 % 1000)
+        elif decoration == 2:
+            name += '[%d]' % (i % 1000)
+        elif decoration == 3:
+            name = ' ' * (1 + i % 3) + name
+        names.append(name)
+    return names
@@ -0,0 +1,483 @@
+__author__ = 'Martijn Berger'
+__license__ = "GPL"
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+# Lightweight stand-ins for bpy, mathutils, bpy_extras, extensions_framework and the maxwell
+# binding, just enough of them to run the importer / exporter hot paths outside blender.
+# The maxwell calls are cheap no-ops so the timings show what the addon itself costs.
+
+import os
+import sys
+import types
+import importlib
+
+from itertools import count
+
+import numpy as np
+
+ADDON_NAME = 'blender_maxwell'
+ADDON_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# --- mathutils --------------------------------------------------------------------------------
+
+class Vector():
+    def __init__(self, values=(0.0, 0.0, 0.0)):
+        self._v = np.array(values, dtype=np.float64)
+
+    x = property(lambda self: float(self._v[0]))
+    y = property(lambda self: float(self._v[1]))
+    z = property(lambda self: float(self._v[2]))
+
+    def __len__(self):
+        return len(self._v)
+
+    def __getitem__(self, i):
+        return float(self._v[i])
+
+    def __iter__(self):
+        return iter(self._v.tolist())
+
+    def __array__(self, dtype=None, copy=None):
+        return self._v if dtype is None else self._v.astype(dtype)
+
+    def __add__(self, other):
+        return Vector(self._v + np.asarray(other))
+
+    def __sub__(self, other):
+        return Vector(self._v - np.asarray(other))
+
+    def normalized(self):
+        n = np.sqrt(np.dot(self._v, self._v))
+        return Vector(self._v / n if n > 1.0e-35 else self._v * 0.0)
+
+    def cross(self, other):
+        return Vector(np.cross(self._v, np.asarray(other)))
+
+    def resized(self, n):
+        v = np.zeros(n)
+        k = min(n, len(self._v))
+        v[:k] = self._v[:k]
+        return Vector(v)
+
+
+class _Columns():
+    def __init__(self, m):
+        self._m = m
+
+    def __getitem__(self, i):
+        return Vector(self._m[:, i])
+
+    def __setitem__(self, i, value):
+        self._m[:, i] = np.asarray(tuple(value), dtype=np.float64)[:len(self._m)]
+
+
+class Matrix():
+    def __init__(self, rows=None):
+        self._m = np.identity(4) if rows is None else np.array(rows, dtype=np.float64)
+
+    @classmethod
+    def Identity(cls, n):
+        return cls(np.identity(n))
+
+    @classmethod
+    def Scale(cls, factor, n):
+        return cls(np.identity(n) * factor)
+
+    @property
+    def col(self):
+        return _Columns(self._m)
+
+    def __getitem__(self, i):
+        return Vector(self._m[i])
+
+    def __iter__(self):
+        return (Vector(r) for r in self._m)
+
+    def __len__(self):
+        return len(self._m)
+
+    def __array__(self, dtype=None, copy=None):
+        return self._m if dtype is None else self._m.astype(dtype)
+
+    def __mul__(self, other):
+        if isinstance(other, Matrix):
+            return Matrix(self._m.dot(other._m))
+        return Vector(self._m.dot(np.asarray(other)))
+
+    def copy(self):
+        return Matrix(self._m.copy())
+
+    def to_3x3(self):
+        return Matrix(self._m[:3, :3])
+
+    def to_4x4(self):
+        m = np.identity(4)
+        k = min(4, len(self._m))
+        m[:k, :k] = self._m[:k, :k]
+        return Matrix(m)
+
+    def inverted(self):
+        try:
+            return Matrix(np.linalg.inv(self._m))
+        except np.linalg.LinAlgError:
+            raise ValueError('matrix does not have an inverse')
+
+
+# --- bpy_extras -------------------------------------------------------------------------------
+
+_AXES = {'X': (1, 0, 0), 'Y': (0, 1, 0), 'Z': (0, 0, 1),
+         '-X': (-1, 0, 0), '-Y': (0, -1, 0), '-Z': (0, 0, -1)}
+
+def axis_conversion(from_forward='Y', from_up='Z', to_forward='Y', to_up='Z'):
+    ''' 3x3 matrix taking from_forward to to_forward and from_up to to_up '''
+    def basis(forward, up):
+        f = np.array(_AXES[forward], dtype=np.float64)
+        u = np.array(_AXES[up], dtype=np.float64)
+        return np.column_stack((f, u, np.cross(f, u)))
+    return Matrix(basis(to_forward, to_up).dot(basis(from_forward, from_up).T))
+
+def unpack_list(list_of_tuples):
+    flat_list = []
+    flat_list_extend = flat_list.extend
+    for t in list_of_tuples:
+        flat_list_extend(t)
+    return flat_list
+
+def unpack_face_list(list_of_tuples):
+    flat_ls = [0] * (len(list_of_tuples) * 4)
+    i = 0
+    for t in list_of_tuples:
+        if len(t) == 3:
+            if t[2] == 0:
+                t = t[1], t[2], t[0]
+        else:
+            if t[3] == 0 or t[2] == 0:
+                t = t[2], t[3], t[0], t[1]
+        flat_ls[i:i + len(t)] = t
+        i += 4
+    return flat_ls
+
+
+# --- bpy data ---------------------------------------------------------------------------------
+
+class _Element():
+    ''' one item of a _Collection, attributes are read from the collection arrays '''
+    __slots__ = ('_c', '_i')
+
+    def __init__(self, collection, i):
+        self._c = collection
+        self._i = i
+
+    def __getattr__(self, name):
+        return self._c.item(name, self._i)
+
+    def __setattr__(self, name, value):
+        if name in _Element.__slots__:
+            object.__setattr__(self, name, value)
+        else:
+            self._c.set_item(name, self._i, value)
+
+
+class _Collection():
+    '''
+        RNA collection backed by numpy arrays
+        widths -> attribute name -> number of values per element
+    '''
+    def __init__(self, widths, length=0):
+        self.widths = widths
+        self.arrays = {}
+        self.length = length
+
+    def add(self, n):
+        self.length += n
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return (_Element(self, i) for i in range(self.length))
+
+    def __getitem__(self, i):
+        if i >= self.length:
+            raise IndexError(i)
+        return _Element(self, i)
+
+    def array(self, name):
+        if not name in self.arrays:
+            shape = (self.length, self.widths[name]) if self.widths[name] > 1 else (self.length,)
+            self.arrays[name] = np.zeros(shape, dtype=np.float32)
+        return self.arrays[name]
+
+    def foreach_get(self, name, out):
+        out[:] = self.array(name).ravel()
+
+    def foreach_set(self, name, values):
+        self.arrays[name] = np.asarray(values).reshape(self.array(name).shape)
+
+    def item(self, name, i):
+        value = self.array(name)[i]
+        return tuple(value.tolist()) if self.widths[name] > 1 else value.item()
+
+    def set_item(self, name, i, value):
+        self.array(name)[i] = value
+
+
+class _TessFaces(_Collection):
+    def item(self, name, i):
+        if name == 'vertices': # triangles are stored with a zero fourth index
+            v = self.array('vertices_raw')[i].tolist()
+            return tuple(v[:3]) if v[3] == 0 else tuple(v)
+        return _Collection.item(self, name, i)
+
+
+class _UVLayers(list):
+    def __init__(self, mesh):
+        self.mesh = mesh
+
+    def new(self):
+        self.append(types.SimpleNamespace(data=_Collection({'uv_raw': 8}, len(self.mesh.tessfaces))))
+        return self[-1]
+
+
+_pointers = count(1)
+
+class Mesh():
+    def __init__(self, name):
+        self.name = name
+        self.vertices = _Collection({'co': 3, 'normal': 3})
+        self.tessfaces = _TessFaces({'vertices_raw': 4, 'material_index': 1})
+        self.loops = _Collection({'vertex_index': 1})
+        self.polygons = _Collection({'loop_total': 1})
+        self.edges = _Collection({'vertices': 2, 'crease': 1, 'bevel_weight': 1, 'use_edge_sharp': 1, 'use_seam': 1})
+        self.tessface_uv_textures = _UVLayers(self)
+        self.uv_layers = []
+        self.materials = []
+        self.shape_keys = None
+        self.users = 0
+        self._pointer = next(_pointers)
+
+    def as_pointer(self):
+        return self._pointer
+
+    def update(self, calc_edges=False):
+        pass
+
+    def validate(self):
+        return False
+
+
+class Object():
+    def __init__(self, name, data=None, type='MESH'):
+        self.name = name
+        self.data = data
+        self.type = type if data is not None else 'EMPTY'
+        self.matrix_world = Matrix()
+        self.matrix_basis = Matrix()
+        self.modifiers = []
+        self.particle_systems = []
+        self.parent = None
+        self.is_duplicator = False
+        self.draw_type = 'TEXTURED'
+        self.dupli_type = 'NONE'
+        self.dupli_group = None
+        self.select = False
+        self.material_slots = [types.SimpleNamespace(link='DATA', material=None)] if data is not None else []
+
+    def copy(self):
+        ob = Object(self.name, self.data, self.type)
+        ob.matrix_world = self.matrix_world
+        ob.matrix_basis = self.matrix_basis
+        return ob
+
+    def to_mesh(self, scene, apply_modifiers, settings):
+        return self.data
+
+
+class _IDCollection(dict):
+    def __init__(self, factory=None):
+        self.factory = factory
+
+    def new(self, name, *args):
+        item = self.factory(name, *args)
+        self[name] = item
+        return item
+
+    def remove(self, item):
+        pass
+
+    def __iter__(self):
+        return iter(list(self.values()))
+
+
+class _SceneObjects(list):
+    active = None
+
+    def link(self, ob):
+        self.append(ob)
+
+    def unlink(self, ob):
+        self.remove(ob)
+
+
+def _reset_data(bpy):
+    bpy.data = types.SimpleNamespace(meshes=_IDCollection(Mesh), objects=_IDCollection(Object),
+                                     groups=_IDCollection(), materials=_IDCollection(),
+                                     images=_IDCollection())
+    scene = types.SimpleNamespace(objects=_SceneObjects(), camera=None)
+    bpy.context = types.SimpleNamespace(scene=scene, blend_data=bpy.data, object=None,
+                                        selected_objects=[], user_preferences=None)
+
+def reset():
+    ''' empty bpy.data and the scene, call between benchmarks so objects do not pile up '''
+    _reset_data(sys.modules['bpy'])
+
+
+# --- maxwell binding --------------------------------------------------------------------------
+
+class Cvector():
+    __slots__ = ('x', 'y', 'z')
+
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.x = x
+        self.y = y
+        self.z = z
+
+
+class Cbase():
+    __slots__ = ('origin', 'x', 'y', 'z')
+
+    def __init__(self):
+        self.origin = self.x = self.y = self.z = None
+
+    def set(self, origin, x, y, z):
+        self.origin = origin
+        self.x = x
+        self.y = y
+        self.z = z
+        return self
+
+
+class MxsMesh():
+    ''' object created by the exporter, counts calls instead of storing anything '''
+    def __init__(self, name, steps=1):
+        self.name = name
+        self.calls = 0
+        self.base_pivot = None
+
+    def setVertex(self, i, step, v):
+        self.calls += 1
+
+    def setNormal(self, i, step, n):
+        self.calls += 1
+
+    def setTriangle(self, i, v1, v2, v3, n1, n2, n3):
+        self.calls += 1
+
+    def setBaseAndPivot(self, base, pivot, substep=0.0):
+        if substep == 0.0:
+            self.base_pivot = (base, pivot)
+
+
+class MxsScene():
+    def __init__(self):
+        self.objects = []
+
+    def createMesh(self, name, nv, nn, nt, steps):
+        self.objects.append(MxsMesh(name, steps))
+        return self.objects[-1]
+
+    def createInstancement(self, name, obj):
+        self.objects.append(MxsMesh(name))
+        return self.objects[-1]
+
+    def freeScene(self):
+        self.objects = []
+
+
+# --- installation -----------------------------------------------------------------------------
+
+def _module(name, **attrs):
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    sys.modules[name] = module
+    return module
+
+class _Anything():
+    ''' stands in for classes, menus and property functions nobody looks at in a benchmark '''
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __call__(self, *args, **kwargs):
+        return None
+
+    def __getattr__(self, name):
+        return _Anything()
+
+    def append(self, *args):
+        pass
+
+
+def install():
+    '''
+        Put the stand-in modules in sys.modules and register the addon package as ADDON_NAME
+        without running its __init__ (that would pull in the whole UI). Returns the package.
+    '''
+    if ADDON_NAME in sys.modules:
+        return sys.modules[ADDON_NAME]
+
+    _module('mathutils', Matrix=Matrix, Vector=Vector)
+
+    props = _module('bpy.props', **{n: _Anything() for n in ('StringProperty', 'BoolProperty', 'IntProperty',
+                                                              'FloatProperty', 'EnumProperty',
+                                                              'PointerProperty', 'CollectionProperty')})
+    bpy_types = _module('bpy.types', INFO_MT_file_import=_Anything(), INFO_MT_file_export=_Anything(),
+                        **{n: type(n, (), {}) for n in ('Operator', 'AddonPreferences', 'PropertyGroup',
+                                                        'Panel', 'RenderEngine')})
+    handlers = _module('bpy.app.handlers', persistent=lambda f: f, scene_update_post=[],
+                       load_post=[], render_pre=[], render_post=[])
+    app = _module('bpy.app', handlers=handlers, version=(2, 69, 0))
+    bpy = _module('bpy', props=props, types=bpy_types, app=app, ops=_Anything(),
+                  utils=_Anything(), path=_Anything())
+    _reset_data(bpy)
+
+    _module('bpy_extras')
+    _module('bpy_extras.io_utils', axis_conversion=axis_conversion, unpack_list=unpack_list,
+            unpack_face_list=unpack_face_list, ImportHelper=type('ImportHelper', (), {}),
+            ExportHelper=type('ExportHelper', (), {}))
+
+    class Addon():
+        def __init__(self, bl_info=None):
+            pass
+        def addon_register_class(self, cls):
+            return cls
+        def init_functions(self):
+            return (lambda: None), (lambda: None)
+
+    _module('extensions_framework', log=lambda *args, **kwargs: None, Addon=Addon,
+            declarative_property_group=object, util=_Anything())
+
+    package = _module(ADDON_NAME, MaxwellRenderAddon=Addon(), __path__=[ADDON_PATH],
+                      __file__=os.path.join(ADDON_PATH, '__init__.py'))
+    package.__package__ = ADDON_NAME
+    binding = _module(ADDON_NAME + '.maxwell', __path__=[os.path.join(ADDON_PATH, 'maxwell')])
+    binding.maxwell = _module(ADDON_NAME + '.maxwell.maxwell', Vector=Cvector, Base=Cbase, maxwell=MxsScene)
+    return package
+
+
+def addon_module(name):
+    ''' import a module of the addon, e.g. addon_module('importer.SceneImporter') '''
+    install()
+    return importlib.import_module(ADDON_NAME + '.' + name)
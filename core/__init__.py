@@ -15,18 +15,32 @@ __license__ = "GPL"
 # along with this program; if not, see <http://www.gnu.org/licenses/>.
 
 import bpy, bl_ui
+import os
+import shutil
+import tempfile
 import threading
+import time
+
+from types import SimpleNamespace
 
 __author__ = 'mberger'
 
 from .. import MaxwellRenderAddon
 
-from ..outputs import MaxwellLog
+from ..outputs import MaxwellLog, WARNING, ERROR
 
 from ..properties import render
 from ..importer import ImportMXS
-from ..exporter import ExportMXS
+from ..exporter import ExportMXS, save, hdr
 from ..ui import render_panel
+from . import process
+from .process import MaxwellProcess, find_executable, render_command
+from .viewport import ViewportSession
+from .preview import PreviewService
+from .farm import FarmJob, FarmScheduler, SeedMerge, local_nodes, DONE
+
+# 2.6x / 2.7x; newer versions dropped it and run python as sys.executable
+process.python_executable = getattr(bpy.app, 'binary_path_python', '') or process.python_executable
 
 def _register_elm(elm, required=False):
     try:
@@ -42,6 +56,26 @@ _register_elm(bl_ui.properties_render.RENDER_PT_output, required=True)
 _register_elm(bl_ui.properties_render.RENDER_PT_stamp)
 
 
+def render_size(scene):
+    scale = scene.render.resolution_percentage / 100.0
+    return (int(scene.render.resolution_x * scale), int(scene.render.resolution_y * scale))
+
+
+def export_scene(scene, mxs_path):
+    ''' export scene for rendering, returns False when that failed '''
+    context = SimpleNamespace(scene=scene, user_preferences=bpy.context.user_preferences)
+    save(None, context, filepath=mxs_path, pipelined=True, streaming=True)
+    if not os.path.exists(mxs_path):
+        MaxwellLog('render: exporting the scene failed', level=ERROR)
+        return False
+    return True
+
+
+def farm_nodes(settings):
+    threads = 0 if settings.threads_auto else settings.threads
+    return local_nodes(settings.farm_nodes, find_executable(bpy.path.abspath(settings.maxwell_path)), threads)
+
+
 
 @MaxwellRenderAddon.addon_register_class
 class RENDERENGINE_maxwell(bpy.types.RenderEngine):
@@ -52,20 +86,271 @@ class RENDERENGINE_maxwell(bpy.types.RenderEngine):
     bl_label      = 'Maxwell'
     bl_use_preview    = True
 
-    render_lock = threading.Lock()
+    render_lock = threading.Lock() # one Maxwell process at a time
 
     def update(self, data, scene):
         pass
     def render(self, scene):
-        print("RENDER")
-        pass
+        if getattr(self, 'is_preview', False):
+            self.preview_render(scene)
+            return
+        with self.render_lock:
+            workdir = tempfile.mkdtemp(prefix='maxwell_render_')
+            try:
+                if scene.maxwell_engine.cooperative:
+                    self.render_cooperative(scene, workdir)
+                else:
+                    self.render_scene(scene, workdir)
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    def render_scene(self, scene, workdir):
+        '''
+            Export scene to a temporary MXS, run the renderer on it and reload its output image
+            into the render result as the sampling level goes up, until it finishes or the user cancels
+        '''
+        settings = scene.maxwell_engine
+        width, height = render_size(scene)
+        mxs_path = os.path.join(workdir, 'scene.mxs')
+        output_path = os.path.join(workdir, 'render.png')
+
+        self.update_stats('', 'Maxwell: exporting scene')
+        if not export_scene(scene, mxs_path) or self.test_break():
+            return
+
+        threads = 0 if settings.threads_auto else settings.threads
+        command = render_command(find_executable(bpy.path.abspath(settings.maxwell_path)), mxs_path, output_path,
+                                 settings.sampling_level, settings.render_time, threads, (width, height))
+        process = MaxwellProcess(command, output_path)
+        try:
+            process.start()
+        except OSError as e:
+            MaxwellLog('render: could not start', command[0], e, level=ERROR)
+            return
+
+        cancelled = False
+        result = self.begin_result(0, 0, width, height)
+        try:
+            refreshed = 0.0
+            while process.running:
+                if self.test_break():
+                    cancelled = True
+                    process.stop()
+                    break
+                if time.time() - refreshed >= settings.refresh_interval:
+                    refreshed = time.time()
+                    self.refresh_result(process, result, settings.sampling_level)
+                time.sleep(0.1) # keep cancelling responsive without busy waiting
+            process.wait()
+            if not cancelled:
+                self.refresh_result(process, result, settings.sampling_level)
+        finally:
+            self.end_result(result)
+
+        if cancelled:
+            MaxwellLog('render: cancelled at SL %.2f after %.1f sec.' % (process.sampling_level, process.elapsed))
+        elif process.returncode != 0:
+            MaxwellLog('render: Maxwell exited with', process.returncode, '\n' + process.output(), level=ERROR)
+            self.update_stats('', 'Maxwell: render failed, see the console')
+        else:
+            MaxwellLog('render: reached SL %.2f in %.1f sec.' % (process.sampling_level, process.elapsed))
+
+    def refresh_result(self, process, result, target):
+        self.update_progress(min(1.0, process.sampling_level / target))
+        self.update_stats('', 'Maxwell: SL %.2f of %g, %.0f sec.' % (process.sampling_level, target, process.elapsed))
+        if process.image_changed():
+            try:
+                result.layers[0].load_from_file(process.output_path)
+            except Exception as e: # caught the renderer writing the image, next refresh gets it
+                MaxwellLog('render: could not load', process.output_path, e, level=WARNING, key='render: could not load')
+                process.image_mtime = None
+                return
+            self.update_result(result)
+
+    previews = None # shared by all engine instances, blender makes one per preview
+
+    @classmethod
+    def preview_service(cls, context):
+        addon_name = __name__.split('.')[0]
+        prefs = context.user_preferences.addons[addon_name].preferences
+        settings = context.scene.maxwell_engine
+        if cls.previews is None:
+            cls.previews = PreviewService(find_executable(bpy.path.abspath(settings.maxwell_path)),
+                                          bpy.path.abspath(prefs.preview_cache_dir), prefs.preview_threads)
+        cls.previews.sampling_level = prefs.preview_sampling_level
+        cls.previews.time_limit = prefs.preview_time
+        return cls.previews
+
+    @staticmethod
+    def preview_material(scene):
+        ''' material shown in a preview scene, the preview objects are called preview* '''
+        obs = sorted(scene.objects, key=lambda ob: not ob.name.startswith('preview'))
+        for ob in obs:
+            if ob.is_visible(scene) and ob.active_material is not None:
+                return ob.active_material
+        return None
+
+    def render_cooperative(self, scene, workdir):
+        '''
+            Export once, render the frame with farm_seeds different seeds on the render nodes
+            and show the average of the seeds that finished so far
+        '''
+        settings = scene.maxwell_engine
+        width, height = render_size(scene)
+        mxs_path = os.path.join(workdir, 'scene.mxs')
+
+        self.update_stats('', 'Maxwell: exporting scene')
+        if not export_scene(scene, mxs_path) or self.test_break():
+            return
+        farm = FarmScheduler(farm_nodes(settings), settings.farm_retries).start()
+        for seed in range(1, settings.farm_seeds + 1):
+            farm.submit(FarmJob(mxs_path, os.path.join(workdir, 'seed%d.png' % seed), scene.frame_current,
+                                settings.sampling_level, settings.render_time, (width, height), seed))
+        farm.finish()
+
+        merge = SeedMerge()
+        cancelled = False
+        result = self.begin_result(0, 0, width, height)
+        try:
+            while True:
+                done = farm.done
+                for job in farm.poll():
+                    if job.status == DONE:
+                        self.merge_seed(merge, job.output_path, result)
+                    elif not cancelled:
+                        MaxwellLog('render: seed', job.seed, 'failed on', job.node.name, '\n' + job.error, level=WARNING)
+                if done:
+                    break
+                if not cancelled and self.test_break():
+                    cancelled = True
+                    farm.cancel()
+                self.update_progress(farm.progress())
+                self.update_stats('', 'Maxwell: merged %d of %d seeds' % (merge.count, settings.farm_seeds))
+                time.sleep(0.1)
+        finally:
+            farm.wait()
+            self.end_result(result)
+        MaxwellLog('render: merged %d of %d seeds' % (merge.count, settings.farm_seeds))
+
+    def merge_seed(self, merge, path, result):
+        if hdr is None: # no numpy to merge with, show the newest seed
+            result.layers[0].load_from_file(path)
+            merge.count += 1
+        else:
+            image = bpy.data.images.load(path)
+            try:
+                pixels = merge.add(hdr.image_pixels(image))
+            finally:
+                bpy.data.images.remove(image)
+            result.layers[0].rect = pixels.reshape(-1, 4).tolist()
+        self.update_result(result)
 
     def preview_update(self, context, id):
-        pass
-    def preview_render(self):
-        pass
+        ''' start rendering an edited material before blender asks for its preview '''
+        if isinstance(id, bpy.types.Material):
+            self.preview_service(context).request(id, render_size(context.scene))
+
+    def preview_render(self, scene):
+        ''' show the cached preview of the material right away, otherwise wait for its render '''
+        material = self.preview_material(scene)
+        if material is None:
+            return
+        size = render_size(scene)
+        context = SimpleNamespace(scene=scene, user_preferences=bpy.context.user_preferences)
+        previews = self.preview_service(context)
+        fingerprint, path = previews.request(material, size)
+        deadline = time.time() + previews.time_limit + 5.0
+        while path is None:
+            if self.test_break() or time.time() > deadline:
+                return # a newer request replaces this one, or the renderer is not there
+            time.sleep(0.05)
+            path = previews.cached(fingerprint)
+        result = self.begin_result(0, 0, size[0], size[1])
+        try:
+            result.layers[0].load_from_file(path)
+        except Exception as e:
+            MaxwellLog('preview: could not load', path, e, level=WARNING, key='preview: could not load')
+        self.end_result(result)
+
+    viewport = None
 
     def view_update(self, context):
-        pass
+        if self.viewport is None:
+            self.viewport = ViewportSession()
+        if self.viewport.sync(context.scene):
+            self.viewport.restart(context.scene.maxwell_engine)
+            self.tag_redraw()
     def view_draw(self, context):
-        pass
\ No newline at end of file
+        if self.viewport is None:
+            return
+        if self.viewport.sync_view(context):
+            self.viewport.restart(context.scene.maxwell_engine)
+        if self.viewport.draw(context.region):
+            self.tag_redraw() # keep polling for the next refinement
+
+    def __del__(self):
+        if self.viewport is not None:
+            self.viewport.close()
+
+@MaxwellRenderAddon.addon_register_class
+class RENDER_OT_maxwell_farm(bpy.types.Operator):
+    '''Render the frame range on the render nodes, one job per frame'''
+    bl_idname = 'render.maxwell_farm'
+    bl_label = 'Render Animation on Nodes'
+
+    def execute(self, context):
+        ''' export every frame and queue it right away, the nodes start while later frames export '''
+        scene = context.scene
+        settings = scene.maxwell_engine
+        self.workdir = tempfile.mkdtemp(prefix='maxwell_farm_')
+        self.farm = FarmScheduler(farm_nodes(settings), settings.farm_retries).start()
+        self.failed = 0
+        frames = range(scene.frame_start, scene.frame_end + 1, scene.frame_step)
+        self.frames = len(frames)
+        frame_current = scene.frame_current
+        t1 = time.time()
+        try:
+            for frame in frames:
+                scene.frame_set(frame)
+                mxs_path = os.path.join(self.workdir, 'frame%04d.mxs' % frame)
+                if not export_scene(scene, mxs_path):
+                    self.failed += 1
+                    continue
+                output_path = os.path.splitext(scene.render.frame_path(frame=frame))[0] + '.png'
+                os.makedirs(os.path.dirname(output_path), exist_ok=True)
+                self.farm.submit(FarmJob(mxs_path, output_path, frame, settings.sampling_level,
+                                         settings.render_time, render_size(scene)))
+        finally:
+            scene.frame_set(frame_current)
+            self.farm.finish()
+        MaxwellLog('farm: exported %d frames in %.2f sec.' % (len(self.farm.jobs), time.time() - t1))
+
+        wm = context.window_manager
+        self.timer = wm.event_timer_add(0.5, context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self.farm.cancel()
+        elif event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+        done = self.farm.done
+        for job in self.farm.poll():
+            if job.status == DONE:
+                MaxwellLog('farm: frame', job.frame, 'rendered on', job.node.name, 'in %.1f sec.' % job.elapsed)
+            else:
+                self.failed += 1
+                MaxwellLog('farm: frame', job.frame, 'failed after', job.attempts, 'attempts\n' + job.error, level=WARNING)
+        if not done:
+            return {'PASS_THROUGH'}
+
+        context.window_manager.event_timer_remove(self.timer)
+        self.farm.wait()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+        if self.farm.cancelled:
+            self.report({'WARNING'}, 'Maxwell farm render cancelled')
+            return {'CANCELLED'}
+        if self.failed:
+            self.report({'WARNING'}, '%d of %d frames failed, see the console' % (self.failed, self.frames))
+        return {'FINISHED'}
@@ -0,0 +1,265 @@
+__author__ = 'Martijn Berger'
+__license__ = "GPL"
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+# Distributed rendering: a FarmScheduler hands render jobs (one per frame, or one per
+# cooperative seed of a frame) to a set of nodes, retries the ones that fail and reports
+# finished jobs as they come in. Like process.py nothing in here touches bpy.
+#
+# A node only needs render(job) -> bool and stop(). LocalNode runs the renderer as a local
+# process in a directory of its own, it gets the scene and returns the image by copying the
+# files the way a network node would transfer them.
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from collections import deque
+
+from .process import MaxwellProcess, render_command
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+
+class FarmJob():
+    ''' one render: frame (and seed for cooperative renders) of the scene in mxs_path '''
+    def __init__(self, mxs_path, output_path, frame, sampling_level, time_limit, resolution=None, seed=None):
+        self.mxs_path = mxs_path
+        self.output_path = output_path
+        self.frame = frame
+        self.seed = seed
+        self.sampling_level = sampling_level
+        self.time_limit = time_limit
+        self.resolution = resolution
+        self.status = QUEUED
+        self.attempts = 0
+        self.node = None
+        self.elapsed = 0.0
+        self.error = ''
+
+    def __repr__(self):
+        seed = '' if self.seed is None else ' seed %d' % self.seed
+        return '<FarmJob frame %d%s %s>' % (self.frame, seed, self.status)
+
+
+class LocalNode():
+    ''' render node running on this machine, stands in for a network node '''
+    def __init__(self, name, executable, threads=0):
+        self.name = name
+        self.executable = executable
+        self.threads = threads
+        self.workdir = tempfile.mkdtemp(prefix='maxwell_node_%s_' % name)
+        self.process = None
+        self.cancelled = False
+        self.lock = threading.Lock() # a stop() never falls between the cancel check and the launch
+
+    def render(self, job):
+        mxs_path = os.path.join(self.workdir, os.path.basename(job.mxs_path))
+        output_path = os.path.join(self.workdir, os.path.basename(job.output_path))
+        shutil.copyfile(job.mxs_path, mxs_path)
+        command = render_command(self.executable, mxs_path, output_path, job.sampling_level, job.time_limit,
+                                 self.threads, job.resolution, job.seed)
+        with self.lock:
+            if self.cancelled:
+                job.error = 'cancelled'
+                return False
+            self.process = MaxwellProcess(command, output_path)
+            try:
+                self.process.start()
+            except OSError as e:
+                job.error = str(e)
+                return False
+        self.process.wait()
+        with self.lock:
+            if self.cancelled:
+                job.error = 'cancelled'
+                return False
+        if self.process.returncode != 0 or not os.path.exists(output_path):
+            job.error = self.process.output()
+            return False
+        shutil.move(output_path, job.output_path)
+        os.remove(mxs_path)
+        return True
+
+    def stop(self):
+        with self.lock:
+            self.cancelled = True
+            if self.process is not None:
+                self.process.stop()
+
+    def close(self):
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+def local_nodes(count, executable, threads=0):
+    return [LocalNode('local%d' % i, executable, threads) for i in range(count)]
+
+
+class FarmScheduler():
+    '''
+        Runs jobs on nodes, one thread per node pulls the next queued job.
+         - a failed job is queued again until it failed retries + 1 times, preferably on
+           another node
+         - a node that fails max_failures jobs in a row is retired, when no node is left the
+           remaining jobs fail
+        Jobs can be submitted while others render. poll() returns the jobs that finished (done
+        or failed for good) since the last call, done is True once finish() was called and
+        every job finished.
+    '''
+    def __init__(self, nodes, retries=2, max_failures=3):
+        self.nodes = list(nodes)
+        self.retries = retries
+        self.max_failures = max_failures
+        self.condition = threading.Condition()
+        self.queue = deque()
+        self.finished = deque()
+        self.jobs = []
+        self.outstanding = 0
+        self.closed = False
+        self.cancelled = False
+        self.alive = len(self.nodes)
+        self.threads = [threading.Thread(target=self._work, args=(node,), name='farm ' + node.name, daemon=True)
+                        for node in self.nodes]
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def submit(self, job):
+        with self.condition:
+            self.jobs.append(job)
+            self.outstanding += 1
+            if self.alive == 0:
+                self._fail(job, 'no render nodes left')
+            else:
+                self.queue.append(job)
+            self.condition.notify_all()
+        return job
+
+    def finish(self):
+        ''' no more jobs will be submitted '''
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def cancel(self):
+        with self.condition:
+            self.cancelled = True
+            self.queue.clear()
+            self.condition.notify_all()
+        for node in self.nodes:
+            node.stop()
+
+    def wait(self):
+        for thread in self.threads:
+            thread.join()
+        for node in self.nodes:
+            if hasattr(node, 'close'):
+                node.close()
+
+    @property
+    def done(self):
+        with self.condition:
+            return self.cancelled or (self.closed and self.outstanding == 0)
+
+    def poll(self):
+        with self.condition:
+            jobs = list(self.finished)
+            self.finished.clear()
+        return jobs
+
+    def progress(self):
+        ''' fraction of the submitted jobs that finished '''
+        with self.condition:
+            return 1.0 - self.outstanding / len(self.jobs) if self.jobs else 0.0
+
+    def _fail(self, job, error=None):
+        ''' caller holds the condition '''
+        job.status = FAILED
+        if error is not None:
+            job.error = error
+        self.outstanding -= 1
+        self.finished.append(job)
+
+    def _next(self, node):
+        ''' next job for node, None when the node should stop. Caller holds the condition '''
+        while True:
+            if self.cancelled or (self.closed and self.outstanding == 0):
+                return None
+            for job in self.queue:
+                # a job that failed here waits for another node, unless this is the only one left
+                if job.node is not node or self.alive == 1:
+                    self.queue.remove(job)
+                    return job
+            self.condition.wait(0.5)
+
+    def _work(self, node):
+        failures = 0
+        while True:
+            with self.condition:
+                job = self._next(node)
+                if job is None:
+                    return
+                job.status = RUNNING
+                job.node = node
+                job.attempts += 1
+            t1 = time.time()
+            try:
+                ok = node.render(job)
+            except Exception as e: # a broken node must not take the scheduler down
+                job.error = str(e)
+                ok = False
+            job.elapsed = time.time() - t1
+            with self.condition:
+                if ok:
+                    failures = 0
+                    job.status = DONE
+                    self.outstanding -= 1
+                    self.finished.append(job)
+                elif self.cancelled:
+                    self._fail(job, 'cancelled')
+                else:
+                    failures += 1
+                    if job.attempts <= self.retries:
+                        job.status = QUEUED
+                        self.queue.append(job)
+                    else:
+                        self._fail(job)
+                    if failures >= self.max_failures:
+                        self.alive -= 1
+                        if self.alive == 0:
+                            while self.queue:
+                                self._fail(self.queue.popleft(), 'no render nodes left')
+                        self.condition.notify_all()
+                        return
+                self.condition.notify_all()
+
+
+class SeedMerge():
+    ''' running average of the images of a cooperative render, merged as they arrive '''
+    def __init__(self):
+        self.sum = None
+        self.count = 0
+
+    def add(self, pixels):
+        if self.sum is None:
+            self.sum = pixels.astype('float64')
+        else:
+            self.sum += pixels
+        self.count += 1
+        return self.sum / self.count
@@ -0,0 +1,93 @@
+__author__ = 'Martijn Berger'
+__license__ = "GPL"
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+# Stand-in for the Maxwell command line renderer, for testing the render engine without a
+# Maxwell installation:
+#
+#   MAXWELL_EXECUTABLE=/path/to/core/maxwell_standin.py blender
+#
+# Takes the same arguments as render_command() builds, prints one "SL of image" line per
+# sampling level and rewrites the output PNG each time, getting less noisy as it goes.
+# MAXWELL_STANDIN_DELAY sets the seconds per level (default 0.5), MAXWELL_STANDIN_FAIL makes
+# every render whose scene path contains its value fail, for testing retries.
+
+import os
+import random
+import struct
+import sys
+import time
+import zlib
+
+
+def write_png(path, width, height, rows):
+    ''' rows -> height bytes objects of width * 3 RGB bytes, written to a temp file and renamed '''
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+    raw = b''.join(b'\x00' + row for row in rows)
+    png = (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+           + chunk(b'IDAT', zlib.compress(raw)) + chunk(b'IEND', b''))
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(png)
+    os.replace(tmp, path) # readers never see a half written image
+
+
+def image(width, height, noise, rng):
+    rows = []
+    for y in range(height):
+        row = bytearray(width * 3)
+        for x in range(width):
+            n = rng.uniform(-noise, noise)
+            row[x * 3] = max(0, min(255, int(255 * x / max(1, width - 1) + n)))
+            row[x * 3 + 1] = max(0, min(255, int(255 * y / max(1, height - 1) + n)))
+            row[x * 3 + 2] = max(0, min(255, int(128 + n)))
+        rows.append(bytes(row))
+    return rows
+
+
+def main(argv):
+    options = {}
+    for arg in argv:
+        if arg.startswith('-') and ':' in arg:
+            key, value = arg[1:].split(':', 1)
+            options[key] = value
+    mxs = options.get('mxs', '')
+    output = options.get('o')
+    fail = os.environ.get('MAXWELL_STANDIN_FAIL')
+    if not os.path.exists(mxs) or output is None or (fail and fail in mxs):
+        print('ERROR: cannot read scene %r' % mxs)
+        return 1
+    width, height = (int(v) for v in options.get('res', '64x64').split('x'))
+    target = float(options.get('sl', 10))
+    time_limit = float(options.get('time', 60)) * 60.0
+    delay = float(os.environ.get('MAXWELL_STANDIN_DELAY', 0.5))
+    rng = random.Random(int(options.get('idcpu', 0)))
+
+    print('Maxwell stand-in rendering %s at %dx%d' % (mxs, width, height))
+    started = time.time()
+    level = 0.0
+    while level < target and time.time() - started < time_limit:
+        time.sleep(delay)
+        level = min(target, level + 1.0)
+        write_png(output, width, height, image(width, height, 128.0 / (1.0 + level), rng))
+        print('SL of image %.2f' % level)
+        sys.stdout.flush()
+    print('Render finished')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,261 @@
+__author__ = 'Martijn Berger'
+__license__ = "GPL"
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+# Material previews: one preview scene (sphere, camera, hdr_8x8 environment) is built once,
+# each request only adds the material, renders it on a small pool of renderer processes and
+# keeps the image on disk under a hash of the material settings.
+
+import hashlib
+import math
+import os
+import tempfile
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from ..maxwell import maxwell
+from ..outputs import MaxwellLog, DEBUG, WARNING
+from .. import exporter
+from .process import MaxwellProcess, render_command
+
+PREVIEW_VERSION = 1 # bump when the preview scene changes, invalidates cached images
+
+
+# what the preview depends on, bookkeeping such as users, update tags or the preview image is left out
+MATERIAL_PROPERTIES = ('use_nodes', 'diffuse_color', 'diffuse_intensity', 'diffuse_shader', 'specular_color',
+                       'specular_intensity', 'specular_hardness', 'specular_shader', 'alpha', 'use_transparency',
+                       'emit', 'ambient', 'translucency')
+NODE_VALUE_TYPES = {'BOOLEAN', 'INT', 'FLOAT', 'ENUM', 'STRING'}
+
+
+def _value(value):
+    if isinstance(value, set):
+        return tuple(sorted(value))
+    if hasattr(value, '__len__') and not isinstance(value, str):
+        return tuple(value)
+    return getattr(value, 'name', value) # datablocks (images, ...) by name
+
+
+def node_settings(node):
+    ''' the settings a node type adds to the generic Node ones (location, width, select, ...) '''
+    base = node.bl_rna.base
+    generic = {prop.identifier for prop in base.properties} if base is not None else set()
+    return [(prop.identifier, _value(getattr(node, prop.identifier))) for prop in node.bl_rna.properties
+            if not prop.identifier in generic and (prop.type in NODE_VALUE_TYPES or prop.type == 'POINTER')
+            and prop.identifier != 'rna_type']
+
+
+def material_fingerprint(material, size):
+    ''' hash of everything that changes how material previews, plus the preview size '''
+    h = hashlib.sha1()
+    values = [(name, _value(getattr(material, name))) for name in MATERIAL_PROPERTIES if hasattr(material, name)]
+    h.update(repr((PREVIEW_VERSION, tuple(size), values)).encode('utf-8'))
+    if material.use_nodes and material.node_tree is not None:
+        tree = material.node_tree
+        for node in tree.nodes:
+            inputs = [(i.identifier, _value(i.default_value)) for i in node.inputs if hasattr(i, 'default_value')]
+            h.update(repr((node.name, node.bl_idname, node.mute, node_settings(node), inputs)).encode('utf-8'))
+        for link in tree.links:
+            h.update(repr((link.from_node.name, link.from_socket.identifier,
+                           link.to_node.name, link.to_socket.identifier)).encode('utf-8'))
+    return h.hexdigest()
+
+
+def diffuse_color(material):
+    ''' base color of material: the first Diffuse BSDF input when it uses nodes, diffuse_color otherwise '''
+    if material.use_nodes and material.node_tree is not None:
+        for node in material.node_tree.nodes:
+            if node.type == 'BSDF_DIFFUSE':
+                return tuple(node.inputs['Color'].default_value)[:3]
+    return tuple(material.diffuse_color)
+
+
+def sphere(rings=24, segments=48, radius=0.5):
+    ''' UV sphere as a geometry.PackedMesh, centered on the origin '''
+    np = exporter.geometry.np
+    theta = np.linspace(0.0, math.pi, rings + 1)
+    phi = np.linspace(0.0, 2.0 * math.pi, segments, endpoint=False)
+    t, p = np.meshgrid(theta, phi, indexing='ij')
+    normals = np.column_stack(((np.sin(t) * np.cos(p)).ravel(), (np.sin(t) * np.sin(p)).ravel(),
+                               np.cos(t).ravel())).astype(np.float32)
+    r, s = np.mgrid[0:rings, 0:segments]
+    a = (r * segments + s).ravel()
+    b = (r * segments + (s + 1) % segments).ravel()
+    triangles = np.concatenate((np.column_stack((a, a + segments, b + segments)),
+                                np.column_stack((a, b + segments, b)))).astype(np.int32)
+    return exporter.geometry.PackedMesh(normals * radius, normals, triangles)
+
+
+class PreviewService():
+    '''
+        Renders material previews on a pool of renderer processes.
+         - request() returns the cached image right away when there is one
+         - a request for a material that is already being rendered is dropped (duplicate)
+         - a newer request for the same material name and size cancels the older one (stale)
+        MXS files are prepared on the calling thread, the binding is not used from the workers.
+    '''
+    def __init__(self, executable, cache_dir='', workers=2, sampling_level=8.0, time_limit=20.0):
+        self.executable = executable
+        self.cache_dir = cache_dir or os.path.join(tempfile.gettempdir(), 'maxwell_previews')
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.workdir = tempfile.mkdtemp(prefix='maxwell_preview_')
+        self.sampling_level = sampling_level
+        self.time_limit = time_limit
+        self.pool = ThreadPoolExecutor(workers)
+        self.lock = threading.Lock()
+        self.base_lock = threading.Lock() # requests may come from several threads, write the base once
+        self.pending = {}     # fingerprint -> Future
+        self.latest = {}      # (material name, size) -> fingerprint of its newest request
+        self.processes = {}   # fingerprint -> running MaxwellProcess
+        self.base_path = None
+        self.hits = 0
+        self.renders = 0
+        self.dropped = 0
+
+    def cached(self, fingerprint):
+        path = os.path.join(self.cache_dir, fingerprint + '.png')
+        return path if os.path.exists(path) else None
+
+    def request(self, material, size):
+        '''
+            returns (fingerprint, image path or None). Without a path the image is being
+            rendered, poll cached(fingerprint) for it.
+        '''
+        fingerprint = material_fingerprint(material, size)
+        path = self.cached(fingerprint)
+        if path is not None:
+            self.hits += 1
+            return fingerprint, path
+        superseded = None
+        with self.lock:
+            # icon and full size previews of one material are separate requests
+            stale = self.latest.get((material.name, tuple(size)))
+            self.latest[(material.name, tuple(size))] = fingerprint
+            if fingerprint in self.pending:
+                self.dropped += 1 # duplicate
+                return fingerprint, None
+            if stale is not None and stale != fingerprint:
+                superseded = self._cancel(stale)
+        if superseded is not None: # waits for the process, not while holding the lock
+            superseded.stop(timeout=1.0)
+        mxs_path = self._prepare(material, fingerprint, size)
+        if mxs_path is None:
+            return fingerprint, None
+        with self.lock:
+            self.pending[fingerprint] = self.pool.submit(self._render, fingerprint, mxs_path, size)
+        return fingerprint, None
+
+    def _cancel(self, fingerprint):
+        '''
+            drop a request that was superseded, caller holds the lock. Returns its running
+            MaxwellProcess (or None), the caller stops it once the lock is released
+        '''
+        future = self.pending.pop(fingerprint, None)
+        if future is not None and future.cancel():
+            self.dropped += 1
+        process = self.processes.get(fingerprint)
+        if process is not None:
+            self.dropped += 1
+        return process
+
+    def _base_scene(self):
+        ''' write the shared preview scene once: sphere, camera and hdr_8x8 lighting '''
+        with self.base_lock:
+            if self.base_path is None:
+                self.base_path = self._write_base_scene()
+            return self.base_path
+
+    def _write_base_scene(self):
+        hdr_path = os.path.join(self.workdir, 'environment.hdr')
+        exporter.write_bytes_to_file(hdr_path)
+        mxs_scene = maxwell.maxwell()
+        exporter.geometry.create_mesh(mxs_scene, 'preview', sphere())
+        camera = mxs_scene.addCamera('preview', 1, 1/100, 0.036, 0.036, 100, "Circular", 30, 8, 24, 64, 64, 1, 0)
+        camera.setStep(0, maxwell.Vector(0.0, 0.0, 3.0), maxwell.Vector(0.0, 0.0, 0.0),
+                       maxwell.Vector(0.0, 1.0, 0.0), 0.065, 5.6, 0)
+        camera.setActive()
+        try:
+            environment = mxs_scene.getEnvironment()
+            environment.setActiveSky('NONE')
+            environment.enableEnvironment(True)
+            environment.setEnvironmentLayer(0, hdr_path)
+        except AttributeError as e: # binding without IBL support, renders with the default sky
+            MaxwellLog('preview: no environment lighting', e, level=WARNING, key='preview: no environment')
+        path = os.path.join(self.workdir, 'preview_base.mxs')
+        mxs_scene.writeMXS(path)
+        mxs_scene.freeScene()
+        return path
+
+    def _prepare(self, material, fingerprint, size):
+        ''' MXS for one request: the base scene with material on the sphere '''
+        t1 = time.time()
+        mxs_scene = maxwell.maxwell()
+        try:
+            mxs_scene.readMXS(self._base_scene())
+            mxs_material = mxs_scene.createMaterial(material.name)
+            try:
+                bsdf = mxs_material.addLayer().addBSDF()
+                bsdf.getReflectance().setAttribute('color', diffuse_color(material))
+            except AttributeError as e: # binding cannot build layers, keep the default material
+                MaxwellLog('preview: default material for', material.name, e, level=DEBUG)
+            preview = mxs_scene.getObject('preview')
+            preview.setMaterial(mxs_material)
+            camera = mxs_scene.getCamera('preview')
+            camera.setResolution(*size)
+            path = os.path.join(self.workdir, fingerprint + '.mxs')
+            mxs_scene.writeMXS(path)
+        except Exception as e:
+            MaxwellLog('preview: could not prepare', material.name, e, level=WARNING, key='preview: could not prepare')
+            return None
+        finally:
+            mxs_scene.freeScene()
+        MaxwellLog('preview: prepared', material.name, 'in %.3f sec.' % (time.time() - t1), level=DEBUG)
+        return path
+
+    def _render(self, fingerprint, mxs_path, size):
+        ''' worker: render one request into the cache, the image only appears there when complete '''
+        output = os.path.join(self.workdir, fingerprint + '.png')
+        process = MaxwellProcess(render_command(self.executable, mxs_path, output, self.sampling_level,
+                                                self.time_limit / 60.0, 1, size), output)
+        with self.lock:
+            if self.pending.get(fingerprint) is None:
+                return # cancelled before we started
+            self.processes[fingerprint] = process
+        try:
+            process.start()
+            process.wait()
+            if process.returncode == 0 and os.path.exists(output):
+                os.replace(output, os.path.join(self.cache_dir, fingerprint + '.png'))
+                self.renders += 1
+            elif process.returncode != 0:
+                MaxwellLog('preview: renderer exited with', process.returncode, level=DEBUG)
+        except OSError as e:
+            MaxwellLog('preview: could not start', self.executable, e, level=WARNING, key='preview: could not start')
+        finally:
+            with self.lock:
+                self.processes.pop(fingerprint, None)
+                self.pending.pop(fingerprint, None)
+            if os.path.exists(mxs_path):
+                os.remove(mxs_path)
+
+    def close(self):
+        with self.lock:
+            processes = [self._cancel(fingerprint) for fingerprint in list(self.pending)]
+        for process in processes:
+            if process is not None:
+                process.stop(timeout=1.0)
+        self.pool.shutdown()
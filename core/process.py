@@ -0,0 +1,151 @@
+__author__ = 'Martijn Berger'
+__license__ = "GPL"
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+# Runs the Maxwell command line renderer as a child process. Nothing in here touches bpy,
+# the render engine polls a MaxwellProcess from its render thread.
+
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+
+from collections import deque
+
+# environment variable overriding the renderer executable, e.g. with core/maxwell_standin.py
+EXECUTABLE_ENV = 'MAXWELL_EXECUTABLE'
+
+# "SL of image 7.25", "SL: 7.25", ... as printed by the renderer while it refines
+SAMPLING_LEVEL = re.compile(r'\bSL\b[^0-9\n]*([0-9]+(?:\.[0-9]+)?)')
+
+
+# interpreter that runs a .py stand-in renderer. Inside blender sys.executable is blender itself,
+# core/__init__.py replaces it with blender's bundled python
+python_executable = sys.executable
+
+
+def find_executable(path=''):
+    ''' renderer to start: EXECUTABLE_ENV, then path, then maxwell on PATH '''
+    return os.environ.get(EXECUTABLE_ENV) or path or 'maxwell'
+
+
+def render_command(executable, mxs_path, output_path, sampling_level, time_limit, threads=0,
+                   resolution=None, seed=None):
+    '''
+        command line for one render
+        time_limit -> minutes, threads -> 0 lets the renderer decide
+        seed -> cooperative render id, renders with different ids can be merged
+    '''
+    if executable.endswith('.py'): # stand-in script
+        command = [python_executable, executable]
+    else:
+        command = [executable]
+    command += ['-mxs:' + mxs_path, '-o:' + output_path, '-sl:%g' % sampling_level,
+                '-time:%g' % time_limit, '-nogui', '-nowait', '-hide']
+    if threads > 0:
+        command.append('-th:%d' % threads)
+    if resolution is not None:
+        command.append('-res:%dx%d' % resolution)
+    if seed is not None:
+        command.append('-idcpu:%d' % seed)
+    return command
+
+
+class MaxwellProcess():
+    '''
+        One renderer process. start() returns immediately, a reader thread collects the
+        console output, the owner polls running / sampling_level / image_changed()
+        and calls stop() to cancel. Keeps the last lines of output for error reports.
+    '''
+    def __init__(self, command, output_path):
+        self.command = command
+        self.output_path = output_path
+        self.process = None
+        self.reader = None
+        self.sampling_level = 0.0
+        self.lines = deque(maxlen=50)
+        self.image_mtime = None
+        self.started = None
+
+    def start(self):
+        self.started = time.time()
+        self.process = subprocess.Popen(self.command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                        stdin=subprocess.DEVNULL, universal_newlines=True, bufsize=1)
+        self.reader = threading.Thread(target=self._read, name='maxwell output', daemon=True)
+        self.reader.start()
+        return self
+
+    def _read(self):
+        for line in self.process.stdout:
+            line = line.rstrip()
+            self.lines.append(line)
+            m = SAMPLING_LEVEL.search(line)
+            if m:
+                self.sampling_level = float(m.group(1))
+        self.process.stdout.close()
+
+    @property
+    def running(self):
+        return self.process is not None and self.process.poll() is None
+
+    @property
+    def returncode(self):
+        return self.process.poll() if self.process is not None else None
+
+    @property
+    def elapsed(self):
+        return time.time() - self.started if self.started is not None else 0.0
+
+    def image_changed(self):
+        ''' True when the renderer wrote a new version of the output image since the last call '''
+        try:
+            mtime = os.stat(self.output_path).st_mtime
+        except OSError:
+            return False
+        if mtime == self.image_mtime:
+            return False
+        self.image_mtime = mtime
+        return True
+
+    def terminate(self):
+        ''' ask the renderer to stop and return right away, stop() or kill() finish the job '''
+        if self.running:
+            self.process.terminate()
+
+    def kill(self):
+        if self.running:
+            self.process.kill()
+
+    def stop(self, timeout=5.0):
+        ''' terminate the renderer, kill it when it does not go within timeout seconds '''
+        if self.running:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.wait()
+
+    def wait(self):
+        if self.process is not None:
+            self.process.wait()
+        if self.reader is not None:
+            self.reader.join()
+
+    def output(self):
+        return '\n'.join(self.lines)
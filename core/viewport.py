@@ -0,0 +1,312 @@
+__author__ = 'Martijn Berger'
+__license__ = "GPL"
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+# Interactive viewport rendering. One MXS scene lives as long as the viewport render does,
+# every update only touches the maxwell objects whose blender counterparts changed.
+
+import bpy
+import bgl
+import math
+import os
+import shutil
+import tempfile
+import time
+
+from collections import Counter, defaultdict
+
+from ..maxwell import maxwell
+from ..outputs import MaxwellLog, DEBUG, WARNING
+from .. import exporter
+from ..importer import deferred
+from .process import MaxwellProcess, find_executable, render_command
+
+VIEWPORT_IMAGE = '.maxwell_viewport'
+VIEWPORT_SENSOR = 32.0 # mm, what the 3D view lens is relative to
+STOP_TIMEOUT = 5.0 # seconds a replaced render gets to exit before it is killed
+
+
+class MeshEntry():
+    ''' maxwell mesh made from one blender mesh datablock, owner's object is the mesh itself '''
+    def __init__(self, mxs_object, owner):
+        self.mxs_object = mxs_object
+        self.owner = owner
+        self.users = set()
+
+
+class ObjectEntry():
+    def __init__(self, mxs_object, data):
+        self.mxs_object = mxs_object
+        self.data = data
+
+
+class ViewportSession():
+    '''
+        Long lived MXS scene for the viewport. sync() compares the scene with what it exported
+        last time and only re-exports what changed:
+         - new objects are instanced from the already exported mesh of their datablock
+         - removed objects are hidden
+         - moved objects (is_updated) only get a new base and pivot
+         - edited geometry (is_updated_data / mesh is_updated) is re-exported once per datablock
+           and its users are re-instanced from the new mesh
+         - updated materials are counted so the render restarts, the exporter does not write
+           materials yet
+        The view (camera or free view) is synced from view_draw by sync_view, it only sets a camera step.
+        Deferred objects are loaded by sync(), dupli objects are not shown.
+        A replaced render is only asked to stop, draw() reaps it so the UI never waits for the renderer.
+    '''
+    def __init__(self):
+        self.mxs_scene = maxwell.maxwell()
+        self.meshes = {}    # mesh datablock pointer -> MeshEntry
+        self.objects = {}   # object name -> ObjectEntry
+        self.revision = 0   # makes maxwell names unique, replaced objects stay in the scene hidden
+        self.camera = None
+        self.camera_size = None
+        self.view = None
+        self.workdir = tempfile.mkdtemp(prefix='maxwell_viewport_')
+        self.renders = 0    # every render gets its own files, a replaced one may still be writing
+        self.process = None
+        self.mxs_path = None
+        self.stopping = []  # (MaxwellProcess, time terminated, mxs path) of replaced renders still exiting
+        self.image = None
+
+    def _name(self, name):
+        self.revision += 1
+        return '%s.%d' % (name, self.revision)
+
+    def _hide(self, mxs_object):
+        try:
+            mxs_object.setHide(True)
+        except AttributeError:
+            MaxwellLog('viewport: binding cannot hide objects', level=WARNING, key='viewport: cannot hide')
+
+    def _place(self, ob, mxs_object):
+        base, pivot = exporter.Matrix2CbaseNPivot(ob.matrix_world)
+        mxs_object.setBaseAndPivot(base, pivot)
+
+    def _pack(self, ob, scene):
+        cache = exporter.geometry_cache
+        key = cache.key(ob)
+        packed = cache.get(key)
+        if packed is None:
+            me = ob.to_mesh(scene, True, 'RENDER')
+            packed = exporter.geometry.pack_mesh(me)
+            bpy.data.meshes.remove(me)
+            cache.put(key, packed)
+        return packed
+
+    def _remove(self, name):
+        ''' hide the maxwell object of name, returns the datablock pointer if its mesh has to be rebuilt '''
+        entry = self.objects.pop(name)
+        self._hide(entry.mxs_object)
+        mesh = self.meshes.get(entry.data)
+        if mesh is None:
+            return None
+        mesh.users.discard(name)
+        if mesh.owner != name:
+            return None
+        if not mesh.users:
+            del self.meshes[entry.data]
+            return None
+        return entry.data # the other users are instances of the hidden owner
+
+    def _export_data(self, pointer, users, scene):
+        ''' (re)create the mesh of one datablock from its first user, instance it for the others '''
+        old = self.meshes.pop(pointer, None)
+        if old is not None:
+            self._hide(old.mxs_object)
+            for name in old.users:
+                if name in self.objects:
+                    self._hide(self.objects.pop(name).mxs_object)
+        owner = users[0]
+        mxs_object = exporter.geometry.create_mesh(self.mxs_scene, self._name(owner.name), self._pack(owner, scene))
+        if mxs_object is None:
+            MaxwellLog('viewport: could not create', owner.name, level=WARNING, key='viewport: could not create')
+            return
+        mesh = self.meshes[pointer] = MeshEntry(mxs_object, owner.name)
+        for ob in users:
+            self._add(ob, pointer, mesh, mxs_object if ob is owner else None)
+
+    def _add(self, ob, pointer, mesh, mxs_object=None):
+        if mxs_object is None:
+            mxs_object = self.mxs_scene.createInstancement(self._name(ob.name), mesh.mxs_object)
+        self._place(ob, mxs_object)
+        self.objects[ob.name] = ObjectEntry(mxs_object, pointer)
+        mesh.users.add(ob.name)
+
+    def sync(self, scene):
+        ''' bring the MXS scene up to date, returns a Counter of what changed (empty: nothing did) '''
+        t1 = time.time()
+        changes = Counter()
+        if exporter.geometry is None:
+            MaxwellLog('viewport: rendering needs numpy', level=WARNING, key='viewport: needs numpy')
+            return changes
+        # placeholders become real meshes with a new datablock, picked up as removed + added below
+        deferred.load_objects([ob for ob in scene.objects if ob.type == 'MESH' and ob.is_visible(scene)])
+        current = {}
+        users = defaultdict(list)
+        for ob in scene.objects:
+            if ob.type == 'MESH' and ob.is_visible(scene) and not ob.is_duplicator:
+                current[ob.name] = ob
+                users[ob.data.as_pointer()].append(ob)
+
+        dirty = set()
+        for name in list(self.objects):
+            ob = current.get(name)
+            if ob is None or ob.data.as_pointer() != self.objects[name].data:
+                rebuild = self._remove(name)
+                if rebuild is not None:
+                    dirty.add(rebuild)
+                changes['removed'] += 1
+
+        meshes_updated = bpy.data.meshes.is_updated
+        for pointer, obs in users.items():
+            if not pointer in self.meshes or any(ob.is_updated_data for ob in obs) \
+                    or (meshes_updated and obs[0].data.is_updated):
+                dirty.add(pointer)
+        for pointer in dirty:
+            if pointer in users:
+                self._export_data(pointer, users[pointer], scene)
+                changes['geometry'] += 1
+            else: # every user went away
+                self.meshes.pop(pointer, None)
+
+        if changes or bpy.data.objects.is_updated:
+            for name, ob in current.items():
+                entry = self.objects.get(name)
+                if entry is None:
+                    mesh = self.meshes.get(ob.data.as_pointer())
+                    if mesh is not None:
+                        self._add(ob, ob.data.as_pointer(), mesh)
+                        changes['added'] += 1
+                elif ob.is_updated and not ob.data.as_pointer() in dirty:
+                    self._place(ob, entry.mxs_object)
+                    changes['moved'] += 1
+
+        if bpy.data.materials.is_updated:
+            changes['materials'] += sum(1 for m in bpy.data.materials if m.is_updated)
+
+        if changes:
+            MaxwellLog('viewport: synced', dict(changes), 'in %.3f sec.' % (time.time() - t1), level=DEBUG)
+        return changes
+
+    def sync_view(self, context):
+        ''' update the viewport camera from the 3D view, returns True when it changed '''
+        region = context.region
+        rv3d = context.region_data
+        scene = context.scene
+        size = (region.width, region.height)
+        if rv3d.view_perspective == 'CAMERA' and scene.camera is not None and scene.camera.type == 'CAMERA':
+            matrix = scene.camera.matrix_world
+            lens = scene.camera.data.lens
+            cycles = getattr(scene.camera.data, 'cycles', None)
+            fstop = cycles.aperture_fstop if cycles else 5.6
+        else:
+            matrix = rv3d.view_matrix.inverted()
+            lens = context.space_data.lens
+            fstop = 5.6
+        view = (size, tuple(tuple(row) for row in matrix), lens, fstop)
+        if view == self.view:
+            return False
+        self.view = view
+
+        if self.camera is None or size != self.camera_size:
+            width, height = size
+            sensor_height = VIEWPORT_SENSOR * height / float(width)
+            fov = math.degrees(2.0 * math.atan(VIEWPORT_SENSOR / (2.0 * lens)))
+            self.camera = self.mxs_scene.addCamera(self._name('viewport'), 1, 1/100, VIEWPORT_SENSOR / 1000.0,
+                                                   sensor_height / 1000.0, 100, "Circular", fov, 8, 24,
+                                                   width, height, 1, 0)
+            self.camera.setActive()
+            self.camera_size = size
+        exporter.set_camera_step(self.camera, matrix, lens / 1000.0, fstop)
+        return True
+
+    def restart(self, settings):
+        ''' write the MXS scene and start rendering it, a render of an older state is told to stop first '''
+        if self.process is not None:
+            self.process.terminate()
+            self.stopping.append((self.process, time.time(), self.mxs_path))
+            self.process = None
+        if self.camera is None:
+            return
+        t1 = time.time()
+        self.renders += 1
+        mxs_path = self.mxs_path = os.path.join(self.workdir, 'viewport%d.mxs' % self.renders)
+        self.mxs_scene.writeMXS(mxs_path)
+        output_path = os.path.join(self.workdir, 'viewport%d.png' % self.renders)
+        threads = 0 if settings.threads_auto else settings.threads
+        command = render_command(find_executable(bpy.path.abspath(settings.maxwell_path)), mxs_path,
+                                 output_path, settings.viewport_sampling_level, settings.render_time,
+                                 threads, self.camera_size)
+        self.process = MaxwellProcess(command, output_path)
+        try:
+            self.process.start()
+        except OSError as e:
+            MaxwellLog('viewport: could not start', command[0], e, level=WARNING, key='viewport: could not start')
+            self.process = None
+        MaxwellLog('viewport: restarted render in %.3f sec.' % (time.time() - t1), level=DEBUG)
+
+    def _reap(self):
+        ''' forget replaced renders that exited, kill the ones that ignore terminate '''
+        stopping = []
+        for process, terminated, mxs_path in self.stopping:
+            if process.running and time.time() - terminated > STOP_TIMEOUT:
+                process.kill()
+            if process.running:
+                stopping.append((process, terminated, mxs_path))
+            else:
+                process.wait() # exited, only joins the output reader
+                if os.path.exists(mxs_path):
+                    os.remove(mxs_path)
+        self.stopping = stopping
+
+    def draw(self, region):
+        ''' draw the newest image of the running render, returns True while more are coming '''
+        self._reap()
+        if self.process is None:
+            return bool(self.stopping)
+        if self.process.image_changed():
+            if self.image is None or self.image.filepath != self.process.output_path:
+                if self.image is not None:
+                    bpy.data.images.remove(self.image)
+                self.image = bpy.data.images.load(self.process.output_path)
+                self.image.name = VIEWPORT_IMAGE
+            else:
+                self.image.reload()
+            self.image.gl_free()
+        if self.image is not None and self.image.gl_load(bgl.GL_NEAREST, bgl.GL_NEAREST) == 0:
+            bgl.glEnable(bgl.GL_TEXTURE_2D)
+            bgl.glBindTexture(bgl.GL_TEXTURE_2D, self.image.bindcode)
+            bgl.glBegin(bgl.GL_QUADS)
+            for u, v in ((0, 0), (1, 0), (1, 1), (0, 1)):
+                bgl.glTexCoord2f(u, v)
+                bgl.glVertex2f(u * region.width, v * region.height)
+            bgl.glEnd()
+            bgl.glDisable(bgl.GL_TEXTURE_2D)
+        return self.process.running or bool(self.stopping)
+
+    def close(self):
+        if self.process is not None:
+            self.process.stop()
+            self.process = None
+        for process, terminated, mxs_path in self.stopping:
+            process.stop()
+        self.stopping = []
+        if self.image is not None:
+            bpy.data.images.remove(self.image)
+            self.image = None
+        self.mxs_scene.freeScene()
+        shutil.rmtree(self.workdir, ignore_errors=True)
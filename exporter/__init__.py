@@ -14,19 +14,35 @@ __license__ = "GPL"
 # You should have received a copy of the GNU General Public License
 # along with this program; if not, see <http://www.gnu.org/licenses/>.
 
+import os
 import time
 import math
 import bpy
-import struct
 
 from mathutils import Matrix, Vector
 from bpy_extras.io_utils import ExportHelper, axis_conversion
-from ..outputs import MaxwellLog
-from bpy.props import StringProperty
+from ..outputs import MaxwellLog, DEBUG, WARNING, set_verbosity_from_scene, flush_suppressed
+from ..outputs import stats
+from ..outputs.memory import MemoryTracker
+from bpy.props import StringProperty, BoolProperty
 
 from ..maxwell import maxwell
+from ..importer import deferred
 from .. import MaxwellRenderAddon
 
+try:
+    from . import geometry, hdr, motion
+    from .cache import GeometryCache
+    from .pipeline import ExportPipeline
+except ImportError: # no numpy, use the per element path
+    geometry = None
+    hdr = None
+    motion = None
+    geometry_cache = None
+else:
+    # survives between exports, see GeometryCache
+    geometry_cache = GeometryCache()
+
 hdr_8x8 = [0x23, 0x3F, 0x52, 0x41, 0x44, 0x49, 0x41, 0x4E, 0x43, 0x45, 0x0A, 0x47, 0x41, 0x4D, 0x4D, 0x41,
            0x3D, 0x31, 0x0A, 0x45, 0x58, 0x50, 0x4F, 0x53, 0x55, 0x52, 0x45, 0x3D, 0x31, 0x0A, 0x46, 0x4F,
            0x52, 0x4D, 0x41, 0x54, 0x3D, 0x33, 0x32, 0x2D, 0x62, 0x69, 0x74, 0x5F, 0x72, 0x6C, 0x65, 0x5F,
@@ -42,10 +58,16 @@ AxisMatrix3 = axis_conversion(from_forward='Y', from_up='Z', to_forward='-Z', to
 
 AxisMatrix = AxisMatrix3.to_4x4()
 
+# maxwell environment layers filled from world textures: background, reflection, refraction, illumination
+ENVIRONMENT_LAYERS = 4
+
+# evaluated meshes at least this big are always included in the memory peak, see save()
+MEMORY_SAMPLE_VERTICES = 65536
+
 def write_bytes_to_file(file='/tmp/8x8_white.hdr', bytes=hdr_8x8):
-    with open('/tmp/8x8.hdr','wb') as f:
-        for b in bytes:
-            f.write(struct.pack('B',b))
+    ''' write a prebuilt file like hdr_8x8, hdr.write_hdr encodes images '''
+    with open(file, 'wb') as f:
+        f.write(bytearray(bytes))
 
 
 @MaxwellRenderAddon.addon_register_class
@@ -62,6 +84,30 @@ class ExportMXS(bpy.types.Operator, ExportHelper):
         options={'HIDDEN'},
     )
 
+    pipelined = BoolProperty(
+        name="Pipelined",
+        description="Pack meshes on worker threads while blender evaluates the next ones",
+        default=True,
+    )
+
+    streaming = BoolProperty(
+        name="Streaming",
+        description="Free every evaluated mesh as soon as it is handed to the MXS scene",
+        default=True,
+    )
+
+    instance_duplicates = BoolProperty(
+        name="Instance Duplicates",
+        description="Export meshes with identical geometry as instances, even when they do not share mesh data",
+        default=False,
+    )
+
+    sequence = BoolProperty(
+        name="Animation Sequence",
+        description="Export every frame of the frame range to its own MXS, static geometry is only packed once",
+        default=False,
+    )
+
     def execute(self, context):
         keywords = self.as_keywords(ignore=("axis_forward",
                                             "axis_up",
@@ -70,10 +116,16 @@ class ExportMXS(bpy.types.Operator, ExportHelper):
                                             "filter_glob",
             ))
 
+        if keywords.pop('sequence'):
+            return save_sequence(self, context, **keywords)
         return save(self, context, **keywords)
 
     def draw(self, context):
         layout = self.layout
+        layout.prop(self, "pipelined")
+        layout.prop(self, "streaming")
+        layout.prop(self, "instance_duplicates")
+        layout.prop(self, "sequence")
 
 
 menu_func = lambda self, context: self.layout.operator(ExportMXS.bl_idname, text="Export Maxwell Scene (.mxs)")
@@ -101,134 +153,469 @@ def toCvector(vec):
     '''create a Cvector type from a blender mathutils.Vector'''
     return maxwell.Vector(vec[0],vec[1],vec[2])
 
-object_cache = {}
-
-def save(operator, context, filepath=""):
+def save(operator, context, filepath="", pipelined=False, streaming=False, instance_duplicates=False):
     '''main scene exporter logic '''
+    set_verbosity_from_scene(context.scene)
     MaxwellLog('exporting mxs %r' % filepath)
 
+    addon_name = __name__.split('.')[0]
+    prefs = context.user_preferences.addons[addon_name].preferences
+    if geometry_cache is not None:
+        geometry_cache.set_budget(prefs.geometry_cache_size * 1024 * 1024)
+
     time_main = time.time()
+    report = stats.begin('export', filepath, prefs.profile_stage)
+    with report.stage('deferred'):
+        # objects imported with deferred meshes need their real geometry now
+        deferred.load_objects([o for o in context.scene.objects if o.is_visible(context.scene)])
+    memory = MemoryTracker()
     mxs_scene = maxwell.maxwell()
     #mxs_scene.setPluginID("Blender Maxwell")
     #mxs_scene.setInputDataType('YZXRH')
 
-    for o in context.scene.objects:
-        if(o.type == 'MESH' and o.is_visible(context.scene) and not o.is_duplicator):
-            me = o.to_mesh(context.scene, True, 'RENDER')
-            export_mesh(o, me, mxs_scene)
-        elif(o.type == 'CAMERA' and o.is_visible(context.scene)):
-            res = export_camera(o,mxs_scene, round(context.scene.render.resolution_x * (context.scene.render.resolution_percentage / 100)),
-                                                  round(context.scene.render.resolution_y * (context.scene.render.resolution_percentage / 100)) )
-            if(context.scene.camera.name == o.name):
-                res.setActive()
-        elif(o.type == 'EMPTY'):
-            MaxwellLog('ignore: EMPTY')
+    samples = None
+    steps = motion_steps(context.scene)
+    if steps > 1:
+        with report.stage('motion'):
+            samples = sample_motion(context.scene, steps)
+
+    # closed in the finally below, whatever happens to the export
+    pipeline = None
+    if pipelined and geometry is not None:
+        pipeline = ExportPipeline(mxs_scene, prefs.export_threads, dedup=instance_duplicates)
+
+    instances = {} # object.data -> (mxs_object, count) for this export only
+    temp_meshes = [] # evaluated meshes not freed yet when not streaming
+    def export_object(ob, base_pivot=None):
+        if pipeline is not None:
+            me = export_mesh_pipelined(ob, context.scene, pipeline, base_pivot)
         else:
-            MaxwellLog('ignoring object', o.type)
- 
-
-    print(mxs_scene.getSceneInfo())
+            me = export_mesh(ob, context.scene, mxs_scene, instances, instance_duplicates, base_pivot)
+        # while the evaluated mesh is still alive, streaming frees it right away. Reading the RSS
+        # for every one of a million dupli instances costs more than the export, big meshes always count
+        memory.tick(me is not None and len(me.vertices) >= MEMORY_SAMPLE_VERTICES)
+        if me is not None:
+            if streaming:
+                bpy.data.meshes.remove(me)
+            else:
+                temp_meshes.append(me)
+        stats.count(items=1)
 
     try:
-        ok = mxs_scene.writeMXS(filepath)
-    except Exception as e:
-        MaxwellLog(e)
-        MaxwellLog("Error saving ")
+        with report.stage('objects'):
+            for o in context.scene.objects:
+                if o.is_duplicator and o.is_visible(context.scene):
+                    export_duplis(o, context.scene, export_object)
+                    memory.sample()
+                    stats.sample()
+                if(o.type == 'MESH' and o.is_visible(context.scene) and (not o.is_duplicator or duplicator_renders_self(o))):
+                    if samples is not None and samples.moving(o.name):
+                        export_motion_mesh(o, context.scene, mxs_scene, samples, pipeline)
+                        stats.count(items=1)
+                    else:
+                        export_object(o)
+                    memory.sample()
+                    stats.sample()
+                elif(o.type == 'CAMERA' and o.is_visible(context.scene)):
+                    # through the pipeline writer: only one thread writes to the scene
+                    export_camera(o,mxs_scene, round(context.scene.render.resolution_x * (context.scene.render.resolution_percentage / 100)),
+                                               round(context.scene.render.resolution_y * (context.scene.render.resolution_percentage / 100)),
+                                  samples.matrices.get(o.name) if samples is not None else None,
+                                  context.scene.camera.name == o.name, pipeline)
+                elif(o.type == 'EMPTY'):
+                    MaxwellLog('ignore: EMPTY', level=DEBUG)
+                else:
+                    MaxwellLog('ignoring object', o.type, level=DEBUG)
+
+            while temp_meshes:
+                bpy.data.meshes.remove(temp_meshes.pop())
+
+        if pipeline is not None:
+            closing, pipeline = pipeline, None
+            with report.stage('pipeline'):
+                try:
+                    closing.close()
+                except Exception as e:
+                    MaxwellLog(e)
+                    MaxwellLog("Error exporting meshes")
+                    return {'FINISHED'}
+            MaxwellLog('pipeline wrote {} meshes and {} instances using {} workers'.format(
+                       closing.meshes, closing.instances, closing.workers))
+        memory.sample()
+
+        with report.stage('environment'):
+            export_environment(context.scene, mxs_scene, os.path.dirname(filepath))
+
+        print(mxs_scene.getSceneInfo())
+
+        with report.stage('write'):
+            try:
+                ok = mxs_scene.writeMXS(filepath)
+            except Exception as e:
+                MaxwellLog(e)
+                MaxwellLog("Error saving ")
+                return {'FINISHED'}
+
+        if ok == 0:
+            MaxwellLog("Error saving ")
+    finally:
+        if pipeline is not None: # the object loop raised, stop the writer before the scene goes
+            try:
+                pipeline.close()
+            except Exception as e:
+                MaxwellLog('pipeline:', e, level=DEBUG)
+        while temp_meshes:
+            bpy.data.meshes.remove(temp_meshes.pop())
         mxs_scene.freeScene()
-        return {'FINISHED'}
-
-
+        stats.end()
+        flush_suppressed()
 
-    if ok == 0:
-        MaxwellLog("Error saving ")
-
-    mxs_scene.freeScene()
     time_new = time.time()
     MaxwellLog('finished exporting: %r in %.4f sec.' %
             (filepath, (time_new - time_main)))
+    MaxwellLog(memory.report())
+    if geometry_cache is not None:
+        MaxwellLog('geometry cache: {hits} hits, {misses} misses, {evictions} evictions, '
+                   '{entries} entries using {bytes} of {budget} bytes'.format(**geometry_cache.stats()))
+    if prefs.stats_report:
+        report.write_json(filepath + '.export.json')
+    return {'FINISHED'}
+
+def motion_steps(scene):
+    ''' motion blur steps to export, 1 when blur is off or numpy is missing '''
+    return motion.motion_steps(scene) if motion is not None else 1
+
+def sample_motion(scene, steps):
+    ''' motion.MotionSamples of the visible meshes and cameras, see motion.sample '''
+    objects = [o for o in scene.objects if o.type in ('MESH', 'CAMERA') and o.is_visible(scene)
+               and (o.type == 'CAMERA' or not o.is_duplicator or duplicator_renders_self(o))]
+    return motion.sample(scene, objects, steps, scene.render.motion_blur_shutter, geometry_cache)
+
+def export_motion_mesh(object, scene, mxs_scene, samples, pipeline=None):
+    '''
+        export a mesh object that moves or deforms while the shutter is open, never as an instance:
+        every deformation step becomes a position step, every transform step a base and pivot substep.
+        Blender is read here, the scene is written by write_motion_mesh on the pipeline writer when
+        there is one
+    '''
+    packed_steps = samples.meshes.get(object.name)
+    if packed_steps is None:
+        key = geometry_cache.key(object)
+        packed = geometry_cache.get(key)
+        if packed is None:
+            me = object.to_mesh(scene, True, 'RENDER')
+            packed = geometry.pack_mesh(me)
+            bpy.data.meshes.remove(me)
+            geometry_cache.put(key, packed)
+        packed_steps = [packed]
+    args = (mxs_scene, object.name, packed_steps, samples, object.matrix_world.copy())
+    if pipeline is not None:
+        pipeline.submit_call(write_motion_mesh, *args)
+    else:
+        write_motion_mesh(*args)
+
+def write_motion_mesh(mxs_scene, name, packed_steps, samples, matrix):
+    ''' scene side of export_motion_mesh, drops the deformation steps of name once they are written '''
+    mxs_object = geometry.create_mesh(mxs_scene, name, packed_steps[0], len(packed_steps))
+    if mxs_object != None:
+        for step, packed in enumerate(packed_steps[1:], 1):
+            geometry.write_positions(mxs_object, packed, step)
+    samples.meshes.pop(name, None)
+    if mxs_object == None:
+        MaxwellLog('could not create', name, level=WARNING, key='could not create mesh')
+        return
+    if not samples.set_base_and_pivot(mxs_object, name, Matrix2CbaseNPivot):
+        base, pivot = Matrix2CbaseNPivot(matrix)
+        mxs_object.setBaseAndPivot(base, pivot)
+
+def sequence_path(filepath, frame):
+    ''' /path/shot.mxs, 12 -> /path/shot0012.mxs '''
+    base, ext = os.path.splitext(filepath)
+    return '%s%04d%s' % (base, frame, ext)
+
+def save_sequence(operator, context, filepath="", **keywords):
+    '''
+        export the frame range, one MXS per frame (see sequence.SequenceExporter).
+        Scenes with duplicators or without numpy are exported with save() for every frame.
+        keywords -> passed on to save() for that fallback
+    '''
+    scene = context.scene
+    set_verbosity_from_scene(scene)
+    addon_name = __name__.split('.')[0]
+    prefs = context.user_preferences.addons[addon_name].preferences
+    frames = range(scene.frame_start, scene.frame_end + 1, scene.frame_step)
+    frame_current = scene.frame_current
+    time_main = time.time()
+
+    from . import sequence
+    if geometry is None or sequence.has_duplicators(scene):
+        MaxwellLog('sequence: duplicators or no numpy, exporting every frame in full', level=WARNING)
+        try:
+            for frame in frames:
+                scene.frame_set(frame)
+                save(operator, context, sequence_path(filepath, frame), **keywords)
+        finally:
+            scene.frame_set(frame_current)
+        return {'FINISHED'}
+
+    geometry_cache.set_budget(prefs.geometry_cache_size * 1024 * 1024)
+    report = stats.begin('sequence', filepath, prefs.profile_stage)
+    with report.stage('deferred'):
+        deferred.load_objects([o for o in scene.objects if o.is_visible(scene)])
+    exporter = sequence.SequenceExporter(scene)
+    try:
+        for frame in frames:
+            with report.stage('frame %d' % frame):
+                scene.frame_set(frame)
+                exporter.export_frame(sequence_path(filepath, frame))
+    finally:
+        scene.frame_set(frame_current)
+        exporter.close()
+        stats.end()
+    flush_suppressed()
+
+    times = [seconds for frame, seconds, changes in exporter.frames]
+    if times:
+        MaxwellLog('sequence: %d frames in %.2f sec., first %.3f sec., average %.3f sec., slowest %.3f sec.' %
+                   (len(times), time.time() - time_main, times[0], sum(times) / len(times), max(times)))
+    MaxwellLog('sequence: objects', dict(exporter.classification()))
+    if prefs.stats_report and times:
+        report.write_json(sequence_path(filepath, frames[0]) + '.sequence.json')
     return {'FINISHED'}
 
 # export the given Blender camera into the maxwell scene
-def export_camera(camera, mxs_scene, res_x, res_y):
-    #figure out position, rot and look-at
-    matrix = AxisMatrix * camera.matrix_world.copy()
-    pos = (matrix.col[3])
-    direct = ((matrix.col[3] - matrix.col[2]))
-    up = matrix.col[1].to_3d().normalized()
-   
-    sensor_width = camera.data.sensor_width / 1000.0
-    sensor_height = camera.data.sensor_height / 1000.0
-    res = mxs_scene.addCamera( camera.name, 1, 1/100, sensor_width, sensor_height, 100  
-                             , "Circular" , (camera.data.angle / math.pi) * 180, 8, 24 
+def environment_images(scene):
+    ''' images of the world's enabled image textures in slot order, at most ENVIRONMENT_LAYERS '''
+    world = scene.world
+    if world is None:
+        return []
+    images = []
+    for slot in getattr(world, 'texture_slots', []):
+        texture = slot.texture if slot is not None and slot.use else None
+        image = getattr(texture, 'image', None)
+        if image is not None and image.source in ('FILE', 'GENERATED'):
+            images.append(image)
+    return images[:ENVIRONMENT_LAYERS]
+
+def export_environment(scene, mxs_scene, directory):
+    '''
+        bake the world images to HDR files in directory and use them as environment layers,
+        background, reflection, refraction and illumination in slot order
+    '''
+    images = environment_images(scene)
+    if not images:
+        return
+    if hdr is None:
+        MaxwellLog('environment: numpy is missing, world images are not exported', level=WARNING)
+        return
+    try:
+        paths = hdr.bake_images(images, directory)
+    except (OSError, ValueError) as e:
+        MaxwellLog('environment: could not bake', e, level=WARNING)
+        return
+    try:
+        environment = mxs_scene.getEnvironment()
+        environment.setActiveSky('NONE')
+        environment.enableEnvironment(True)
+        for layer, path in enumerate(paths):
+            environment.setEnvironmentLayer(layer, path)
+    except AttributeError as e: # binding without IBL support, see core.preview
+        MaxwellLog('environment: no environment lighting', e, level=WARNING, key='environment: no IBL')
+        return
+    MaxwellLog('environment:', len(paths), 'HDR maps baked to', directory, level=DEBUG)
+
+def export_camera(camera, mxs_scene, res_x, res_y, matrices=None, active=False, pipeline=None):
+    '''
+        matrices -> world matrix per motion blur step, None for the current matrix only
+        active -> make it the render camera
+        pipeline -> read blender here and write the camera on the pipeline writer, returns None then
+    '''
+    data = camera.data
+    matrices = [m.copy() for m in (matrices or [camera.matrix_world])]
+    fStop = data.cycles.aperture_fstop if data.cycles else 5.6
+    args = (mxs_scene, camera.name, matrices, data.sensor_width / 1000.0, data.sensor_height / 1000.0,
+            (data.angle / math.pi) * 180, data.lens / 1000, fStop, data.shift_x * 200.0, data.shift_y * -200.0,
+            res_x, res_y, active)
+    if pipeline is not None:
+        pipeline.submit_call(write_camera, *args)
+        return None
+    return write_camera(*args)
+
+def write_camera(mxs_scene, name, matrices, sensor_width, sensor_height, fov, focal_length, fStop,
+                 shift_x, shift_y, res_x, res_y, active):
+    ''' scene side of export_camera '''
+    res = mxs_scene.addCamera( name, len(matrices), 1/100, sensor_width, sensor_height, 100  
+                             , "Circular" , fov, 8, 24 
                              , res_x, res_y , 1  , 0 )
     if res == 0:
         MaxwellLog("Adding camera failed")
         return
     mxs_camera = res
     
-    position = toCvector(pos)
-    up_vec = toCvector(up)
-    tar_vec = toCvector(direct)
-    #set the values as step 0 for now TODO: add motion blur support
-    focal_length = camera.data.lens / 1000
-    fStop = camera.data.cycles.aperture_fstop if camera.data.cycles else 5.6
-    mxs_camera.setStep(0, position, tar_vec, up_vec, focal_length, fStop , 0)
-    shift_x,  shift_y =  camera.data.shift_x * 200.0, camera.data.shift_y * -200.0
+    for step, matrix in enumerate(matrices):
+        set_camera_step(mxs_camera, matrix, focal_length, fStop, step)
     mxs_camera.setShiftLens(shift_x,  shift_y)
+    if active:
+        mxs_camera.setActive()
     return mxs_camera
 
-def export_mesh(object, me, mxs_scene):
-
-    global object_cache
+def set_camera_step(mxs_camera, matrix_world, focal_length, fStop, step=0):
+    ''' position, target and up of a maxwell camera from a blender world matrix '''
+    #figure out position, rot and look-at
+    matrix = AxisMatrix * matrix_world.copy()
+    pos = (matrix.col[3])
+    direct = ((matrix.col[3] - matrix.col[2]))
+    up = matrix.col[1].to_3d().normalized()
+    mxs_camera.setStep(step, toCvector(pos), toCvector(direct), toCvector(up), focal_length, fStop , 0)
+
+def duplicator_renders_self(object):
+    ''' dupli verts / faces hide the duplicator, particle emitters only render when asked to '''
+    if object.type != 'MESH' or object.dupli_type in ('VERTS', 'FACES'):
+        return False
+    if len(object.particle_systems) > 0:
+        return any(p.settings.use_render_emitter for p in object.particle_systems)
+    return True
+
+def export_duplis(duplicator, scene, export_object):
+    '''
+        export everything duplicator generates (dupli verts / faces / groups and particles).
+        The world matrices of the whole dupli list are converted in one batch, every source mesh
+        is exported once and all other occurrences become instances of it through export_object
+        export_object -> callable(object, (base, pivot))
+    '''
+    try:
+        duplicator.dupli_list_create(scene, 'RENDER')
+    except TypeError: # older API without settings
+        duplicator.dupli_list_create(scene)
+    try:
+        objects = [d.object for d in duplicator.dupli_list]
+        if geometry is not None:
+            base_pivots = geometry.matrices_to_base_pivot(geometry.dupli_matrices(duplicator.dupli_list), AxisMatrix)
+        else:
+            base_pivots = [Matrix2CbaseNPivot(d.matrix) for d in duplicator.dupli_list]
+    finally:
+        duplicator.dupli_list_clear()
+
+    MaxwellLog(duplicator.name, ':', len(objects), 'dupli objects', level=DEBUG)
+    for ob, base_pivot in zip(objects, base_pivots):
+        if ob.type == 'MESH':
+            export_object(ob, base_pivot)
+
+def export_mesh(object, scene, mxs_scene, instances, dedup=False, base_pivot=None):
+    '''
+        export a mesh object, objects sharing mesh data become instances of the first one
+        instances -> object.data or geometry digest -> (mxs_object, count) for the current export
+        dedup -> also instance meshes whose evaluated geometry is identical (see geometry.packed_digest)
+        base_pivot -> (base, pivot) to place the object with instead of its matrix_world (duplis)
+        returns the evaluated mesh the caller has to free or None if to_mesh was not needed
+    '''
+    me = None
     mesh_cache_key = object.data
+    digest = None
+
+    if not mesh_cache_key in instances:
+        MaxwellLog(object, level=DEBUG)
+        MaxwellLog(object.name, level=DEBUG)
+        if geometry is not None:
+            key = geometry_cache.key(object)
+            packed = geometry_cache.get(key)
+            if packed is None:
+                me = object.to_mesh(scene, True, 'RENDER')
+                packed = geometry.pack_mesh(me)
+                geometry_cache.put(key, packed)
+            if dedup:
+                digest = geometry.packed_digest(packed)
+                if digest in instances:
+                    MaxwellLog(object.name, "has the same geometry as an exported mesh", level=DEBUG)
+                    instances[mesh_cache_key] = (instances[digest][0], 0)
+        else:
+            me = object.to_mesh(scene, True, 'RENDER')
 
-    if mesh_cache_key in object_cache:
-        MaxwellLog("Instancing {}".format(mesh_cache_key))
-        orig_mxs_object, i = object_cache[mesh_cache_key]
+    if mesh_cache_key in instances:
+        MaxwellLog("Instancing", mesh_cache_key, level=DEBUG)
+        orig_mxs_object, i = instances[mesh_cache_key]
         i += 1
         name = object.name + str(i)
-        MaxwellLog(i)
+        MaxwellLog(i, level=DEBUG)
         mxs_object = mxs_scene.createInstancement(name,orig_mxs_object)
-        object_cache[mesh_cache_key] = (orig_mxs_object, i)
+        instances[mesh_cache_key] = (orig_mxs_object, i)
+    elif geometry is not None:
+        mxs_object = export_mesh_data_bulk(object, packed, mxs_scene)
     else:
-        # some structures to keep stuff while we figure out how much it is
-        verts = {}
-        normals = {}
-        faces = []
-        for i, vertex in enumerate(me.vertices):
-            #print(i,": ", vertex.co)
-            verts[i] = maxwell.Vector(x= vertex.co[0], y= vertex.co[1], z= vertex.co[2])
-            normals[i] = toCvector(Vector((vertex.normal[0],vertex.normal[1],vertex.normal[2])).normalized())
-
-        for i, face in enumerate(me.tessfaces):
-            faces.append((face.vertices[0],face.vertices[1],face.vertices[2]))
-            if(len(face.vertices) == 4):
-                faces.append((face.vertices[2],face.vertices[3],face.vertices[0]))
-
-        MaxwellLog(object)
-        MaxwellLog(object.name)
-        #create actual maxwell object
-        mxs_object = mxs_scene.createMesh(object.name, len(verts), len(normals),len(faces),1)
-
-        MaxwellLog(mxs_object)
-        if mxs_object != None:
-            #dump in stuff into the object
-            for i, v in verts.items():
-                mxs_object.setVertex(i, 0, v)
-
-            for i, n in normals.items():
-                mxs_object.setNormal(i, 0, n)
-
-            for i, f in enumerate(faces):
-                mxs_object.setTriangle(i, f[0], f[1], f[2], f[0], f[1], f[2])
-        else:
-            MaxwellLog('could not create {}'.format(object.name))
+        mxs_object = export_mesh_data(object, me, mxs_scene)
 
-    base, pivot = Matrix2CbaseNPivot(object.matrix_world)
+    base, pivot = base_pivot or Matrix2CbaseNPivot(object.matrix_world)
     mxs_object.setBaseAndPivot(base,pivot)
-    if not mesh_cache_key in object_cache:
-        object_cache[mesh_cache_key] = (mxs_object, 0)
-
-
-
-      
+    if not mesh_cache_key in instances:
+        instances[mesh_cache_key] = (mxs_object, 0)
+        if digest is not None:
+            instances[digest] = (mxs_object, 0)
+    return me
+
+def export_mesh_pipelined(object, scene, pipeline, base_pivot=None):
+    '''
+        same as export_mesh but all maxwell calls are left to the pipeline writer,
+        only evaluation and the array copy happen here. The returned mesh can be freed
+        right away since the pipeline works on copies.
+    '''
+    base, pivot = base_pivot or Matrix2CbaseNPivot(object.matrix_world)
+    source = object.data.as_pointer()
+    if pipeline.has_source(source):
+        MaxwellLog("Instancing", object.data, level=DEBUG)
+        pipeline.submit_instance(object.name, source, base, pivot)
+        return None
+
+    key = geometry_cache.key(object)
+    packed = geometry_cache.get(key)
+    if packed is not None:
+        pipeline.submit_packed(object.name, source, packed, base, pivot)
+    else:
+        me = object.to_mesh(scene, True, 'RENDER')
+        pipeline.submit_arrays(object.name, source, geometry.mesh_arrays(me), base, pivot,
+                               lambda packed: geometry_cache.put(key, packed))
+        return me
+    return None
+
+def export_mesh_data_bulk(object, packed, mxs_scene):
+    ''' vectorized version of export_mesh_data, takes a geometry.PackedMesh '''
+    mxs_object = geometry.create_mesh(mxs_scene, object.name, packed)
+
+    MaxwellLog(mxs_object, level=DEBUG)
+    if mxs_object == None:
+        MaxwellLog('could not create', object.name, level=WARNING, key='could not create mesh')
+    return mxs_object
+
+def export_mesh_data(object, me, mxs_scene):
+    ''' per element fallback for export_mesh_data_bulk '''
+    # some structures to keep stuff while we figure out how much it is
+    verts = {}
+    normals = {}
+    faces = []
+    for i, vertex in enumerate(me.vertices):
+        #print(i,": ", vertex.co)
+        verts[i] = maxwell.Vector(x= vertex.co[0], y= vertex.co[1], z= vertex.co[2])
+        normals[i] = toCvector(Vector((vertex.normal[0],vertex.normal[1],vertex.normal[2])).normalized())
+
+    for i, face in enumerate(me.tessfaces):
+        faces.append((face.vertices[0],face.vertices[1],face.vertices[2]))
+        if(len(face.vertices) == 4):
+            faces.append((face.vertices[2],face.vertices[3],face.vertices[0]))
+
+    #create actual maxwell object
+    mxs_object = mxs_scene.createMesh(object.name, len(verts), len(normals),len(faces),1)
+
+    MaxwellLog(mxs_object, level=DEBUG)
+    if mxs_object != None:
+        stats.count(triangles=len(faces), vertices=len(verts))
+        #dump in stuff into the object
+        for i, v in verts.items():
+            mxs_object.setVertex(i, 0, v)
+
+        for i, n in normals.items():
+            mxs_object.setNormal(i, 0, n)
+
+        for i, f in enumerate(faces):
+            mxs_object.setTriangle(i, f[0], f[1], f[2], f[0], f[1], f[2])
+    else:
+        MaxwellLog('could not create', object.name, level=WARNING, key='could not create mesh')
+    return mxs_object
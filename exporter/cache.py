@@ -0,0 +1,297 @@
+__author__ = 'Martijn Berger'
+__license__ = "GPL"
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import threading
+
+from collections import OrderedDict
+
+import numpy as np
+
+# modifiers whose result depends on state we do not fingerprint (poses, other meshes, ...)
+UNCACHEABLE_MODIFIERS = {'ARMATURE', 'MESH_DEFORM', 'SURFACE_DEFORM', 'PARTICLE_SYSTEM', 'CLOTH',
+                         'SOFT_BODY', 'FLUID_SIMULATION', 'DYNAMIC_PAINT', 'OCEAN', 'EXPLODE'}
+
+# enum values of modifier settings that work relative to the world, e.g. Displace texture coordinates
+WORLD_SPACE_VALUES = {'GLOBAL', 'OBJECT'}
+
+# RNA that changes without changing the result: user counts, update tags, preview images
+VOLATILE_PROPERTIES = {'rna_type', 'users', 'use_fake_user', 'is_updated', 'is_updated_data', 'is_evaluated',
+                       'tag', 'is_library_indirect', 'library', 'preview', 'select', 'show_expanded',
+                       'show_viewport', 'show_in_editmode', 'show_on_cage'}
+
+
+def packed_nbytes(packed):
+    return sum(buf.nbytes for buf in packed if buf is not None)
+
+
+def _is_texture(value):
+    rna = getattr(value, 'bl_rna', None)
+    while rna is not None:
+        if rna.identifier == 'Texture':
+            return True
+        rna = rna.base
+    return False
+
+
+def _object_values(ob, seen):
+    '''
+        what a modifier sees of a referenced object (Boolean operand, Shrinkwrap target, Array cap,
+        Curve deform curve, ...): its world matrix, the contents of its data and its own modifiers.
+        None when that cannot be fingerprinted
+    '''
+    if ob.type == 'ARMATURE' or ob.name in seen:
+        return None
+    if ob.parent and ob.parent.type == 'ARMATURE':
+        return None
+    if ob.type == 'MESH':
+        data = geometry_fingerprint(ob.data, modifier_inputs(ob)[1])
+    elif ob.type in ('CURVE', 'SURFACE', 'FONT'):
+        data = curve_fingerprint(ob.data)
+    elif ob.type == 'EMPTY':
+        data = None
+    else:
+        return None
+    mods = modifier_fingerprint(ob, seen | {ob.name})
+    if mods is None:
+        return None
+    return (ob.name, tuple(tuple(r) for r in ob.matrix_world), data, mods)
+
+
+def _texture_values(tex, seen):
+    ''' settings of a referenced texture, its image by file; None for images edited in blender '''
+    values = _rna_values(tex, seen)
+    if values is None:
+        return None
+    image = getattr(tex, 'image', None)
+    if image is not None:
+        if image.is_dirty or image.source not in ('FILE', 'SEQUENCE', 'MOVIE'):
+            return None
+        values.append(('image', image.filepath, image.source))
+        if image.source != 'FILE' and hasattr(tex, 'image_user'):
+            values.append(('image_user', tex.image_user.frame_current, tex.image_user.frame_offset))
+    return (tex.name, values)
+
+
+def _rna_values(struct, seen=frozenset()):
+    '''
+        Flatten the RNA properties of struct (a modifier) into something hashable.
+        Referenced objects, curves and textures contribute what they hold, other datablocks their
+        name. Bookkeeping properties (VOLATILE_PROPERTIES) are left out.
+        returns None when the struct depends on something we cannot fingerprint
+    '''
+    values = []
+    for prop in struct.bl_rna.properties:
+        ident = prop.identifier
+        if ident in VOLATILE_PROPERTIES or prop.type == 'COLLECTION':
+            continue
+        try:
+            value = getattr(struct, ident)
+        except AttributeError:
+            continue
+        if prop.type == 'POINTER':
+            if value is None:
+                values.append((ident, None))
+                continue
+            if hasattr(value, 'matrix_world'):
+                value = _object_values(value, seen)
+            elif _is_texture(value):
+                value = _texture_values(value, seen)
+            elif hasattr(value, 'splines'):
+                value = curve_fingerprint(value)
+            else:
+                value = getattr(value, 'name', repr(value))
+            if value is None:
+                return None
+            values.append((ident, value))
+        elif isinstance(value, set):
+            values.append((ident, tuple(sorted(value))))
+        elif getattr(prop, 'is_array', False) or getattr(prop, 'array_length', 0) > 0:
+            values.append((ident, tuple(value)))
+        else:
+            values.append((ident, value))
+    return values
+
+
+def modifier_fingerprint(object, seen=frozenset()):
+    ''' hash of the render visible modifier stack, None if it cannot be cached '''
+    h = hashlib.md5()
+    for mod in object.modifiers:
+        if not mod.show_render:
+            continue
+        if mod.type in UNCACHEABLE_MODIFIERS:
+            return None
+        values = _rna_values(mod, seen | {object.name})
+        if values is None:
+            return None
+        h.update(repr((mod.type, values)).encode('utf-8'))
+    return h.hexdigest()
+
+
+def modifier_inputs(object):
+    '''
+        (transform, vertex_groups): whether the render visible modifiers read the world matrix
+        of object (they reference another object or work in global / object coordinates) and
+        whether they read vertex group weights
+    '''
+    transform = vertex_groups = False
+    for mod in object.modifiers:
+        if not mod.show_render:
+            continue
+        for prop in mod.bl_rna.properties:
+            value = getattr(mod, prop.identifier, None)
+            if prop.type == 'POINTER':
+                transform |= value is not None and hasattr(value, 'matrix_world')
+            elif prop.type == 'ENUM' and isinstance(value, str):
+                transform |= value in WORLD_SPACE_VALUES
+            elif prop.type == 'STRING' and 'vertex_group' in prop.identifier:
+                vertex_groups |= bool(value)
+    return transform, vertex_groups
+
+
+def curve_fingerprint(cu):
+    ''' hash of a curve datablock: its settings and every control point '''
+    h = hashlib.md5()
+    h.update(repr([(prop.identifier, getattr(cu, prop.identifier)) for prop in cu.bl_rna.properties
+                   if prop.type in ('BOOLEAN', 'INT', 'FLOAT', 'ENUM')
+                   and not prop.identifier in VOLATILE_PROPERTIES
+                   and not getattr(prop, 'is_array', False)]).encode('utf-8'))
+    for spline in cu.splines:
+        h.update(repr((spline.type, spline.use_cyclic_u, spline.use_endpoint_u, spline.order_u,
+                       spline.resolution_u)).encode('utf-8'))
+        points = np.empty(len(spline.points) * 4, dtype=np.float32)
+        spline.points.foreach_get("co", points)
+        h.update(points.tobytes())
+        for attr in ('co', 'handle_left', 'handle_right'):
+            co = np.empty(len(spline.bezier_points) * 3, dtype=np.float32)
+            spline.bezier_points.foreach_get(attr, co)
+            h.update(co.tobytes())
+    return h.hexdigest()
+
+
+def _hash_elements(h, collection, attr, dtype, size=1):
+    values = np.empty(len(collection) * size, dtype=dtype)
+    collection.foreach_get(attr, values)
+    h.update(values.tobytes())
+
+
+def geometry_fingerprint(me, vertex_groups=False):
+    '''
+        hash of the (unevaluated) mesh datablock: coordinates, topology, edge flags and weights,
+        UVs and shape key values. vertex_groups -> also hash every vertex group weight, only
+        needed when a modifier reads them and slow: there is no foreach_get for them
+    '''
+    h = hashlib.md5()
+    _hash_elements(h, me.vertices, "co", np.float32, 3)
+    _hash_elements(h, me.loops, "vertex_index", np.int32)
+    _hash_elements(h, me.polygons, "loop_total", np.int32)
+    # read by subsurf (creases), edge split and split normals (sharp), bevel and unwrapping modifiers
+    _hash_elements(h, me.edges, "vertices", np.int32, 2)
+    for attr in ("crease", "bevel_weight"):
+        _hash_elements(h, me.edges, attr, np.float32)
+    for attr in ("use_edge_sharp", "use_seam"):
+        _hash_elements(h, me.edges, attr, bool)
+    for layer in me.uv_layers: # UV displacement, UV warp, ...
+        h.update(layer.name.encode('utf-8'))
+        _hash_elements(h, layer.data, "uv", np.float32, 2)
+    if hasattr(me, 'calc_normals_split'): # what the split normals depend on
+        _hash_elements(h, me.polygons, "use_smooth", bool)
+        h.update(repr((me.use_auto_smooth, me.auto_smooth_angle, getattr(me, 'has_custom_normals', False))).encode('utf-8'))
+    if vertex_groups:
+        h.update(repr([(v.index, [(g.group, g.weight) for g in v.groups]) for v in me.vertices if len(v.groups)])
+                 .encode('utf-8'))
+    if me.shape_keys:
+        keys = me.shape_keys
+        h.update(repr((keys.use_relative, keys.eval_time,
+                       [(k.name, k.value, k.mute) for k in keys.key_blocks])).encode('utf-8'))
+    return h.hexdigest()
+
+
+class GeometryCache():
+    '''
+        LRU cache of PackedMesh buffers shared between exports.
+        Keys are (datablock pointer, datablock name, modifier fingerprint, geometry fingerprint,
+        world matrix when the modifiers depend on it) so an edit to the mesh, its modifiers or
+        what they reference (other meshes, curves, textures) simply produces a new key, stale
+        entries age out once the memory budget is exceeded.
+        get / put may be called from different threads (see pipeline.ExportPipeline)
+    '''
+    def __init__(self, budget=512 * 1024 * 1024):
+        self.budget = budget
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def key(self, object):
+        ''' cache key for the evaluated mesh of object, None when it should not be cached '''
+        if object.parent and object.parent.type == 'ARMATURE':
+            return None
+        mods = modifier_fingerprint(object)
+        if mods is None:
+            return None
+        transform, vertex_groups = modifier_inputs(object)
+        matrix = tuple(tuple(r) for r in object.matrix_world) if transform else None
+        return (object.data.as_pointer(), object.data.name, mods,
+                geometry_fingerprint(object.data, vertex_groups), matrix)
+
+    def get(self, key):
+        with self.lock:
+            if key is None or not key in self.entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key, packed):
+        if key is None:
+            return
+        nbytes = packed_nbytes(packed)
+        if nbytes > self.budget:
+            return
+        for buf in packed: # entries are shared between exports
+            if buf is not None:
+                buf.flags.writeable = False
+        with self.lock:
+            if key in self.entries:
+                self.size -= packed_nbytes(self.entries.pop(key))
+            self.entries[key] = packed
+            self.size += nbytes
+            self._evict()
+
+    def _evict(self):
+        ''' drop least recently used entries until we are within budget, caller holds the lock '''
+        while self.size > self.budget and self.entries:
+            _, packed = self.entries.popitem(last=False)
+            self.size -= packed_nbytes(packed)
+            self.evictions += 1
+
+    def set_budget(self, budget):
+        with self.lock:
+            self.budget = budget
+            self._evict()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'entries': len(self.entries), 'bytes': self.size, 'budget': self.budget}
@@ -0,0 +1,252 @@
+__author__ = 'Martijn Berger'
+__license__ = "GPL"
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+# Vectorized mesh packing for the exporter. Everything in here works on plain
+# NumPy arrays so it can be used without touching bpy or the maxwell binding.
+
+import hashlib
+
+from collections import namedtuple
+
+import numpy as np
+
+from ..maxwell import maxwell
+from ..outputs import stats
+
+# number of elements converted to python objects at a time when feeding the MXS object
+BATCH_SIZE = 65536
+
+# normal_triangles -> normal indices per triangle corner, None: vertex i uses normal i
+PackedMesh = namedtuple('PackedMesh', ['vertices', 'normals', 'triangles', 'normal_triangles'])
+PackedMesh.__new__.__defaults__ = (None,)
+
+# split normals closer than 1 / NORMAL_QUANTIZE per component share one entry of the normal table
+NORMAL_QUANTIZE = (1 << 20) - 1
+
+
+def mesh_arrays(me):
+    '''
+        Copy vertex positions, vertex normals, raw tessface indices and split normals out of a blender mesh
+        returns (co (V,3) float32, normal (V,3) float32, faces (F,4) int32, split (F,4,3) float32 or None)
+    '''
+    split = split_normals(me)
+    nv = len(me.vertices)
+    nf = len(me.tessfaces)
+    co = np.empty(nv * 3, dtype=np.float32)
+    no = np.empty(nv * 3, dtype=np.float32)
+    faces = np.empty(nf * 4, dtype=np.int32)
+    me.vertices.foreach_get("co", co)
+    me.vertices.foreach_get("normal", no)
+    me.tessfaces.foreach_get("vertices_raw", faces)
+    return co.reshape(-1, 3), no.reshape(-1, 3), faces.reshape(-1, 4), split
+
+
+def split_normals(me):
+    '''
+        per tessface corner normals as an (F,4,3) array, None when blender is too old to compute
+        them or every face is smooth without auto smooth (the vertex normals are the same then)
+    '''
+    if not hasattr(me, 'calc_normals_split'):
+        return None
+    smooth = np.empty(len(me.polygons), dtype=bool)
+    me.polygons.foreach_get("use_smooth", smooth)
+    if smooth.all() and not me.use_auto_smooth:
+        return None
+    me.calc_normals_split()
+    me.calc_tessface() # tessface split normals are filled from the loop normals here
+    split = np.empty(len(me.tessfaces) * 12, dtype=np.float32)
+    me.tessfaces.foreach_get("split_normals", split)
+    return split.reshape(-1, 4, 3)
+
+
+def normalize(n):
+    '''
+        Normalize an (N,3) float32 array the same way mathutils.Vector.normalized() does,
+        zero length vectors stay zero
+    '''
+    n = np.asarray(n, dtype=np.float32)
+    sq = n * n # products in single precision, accumulated in double like dot_vn_vn
+    d = sq[:, 2].astype(np.float64) + sq[:, 1] + sq[:, 0]
+    ok = d > 1.0e-35
+    d_sqrt = np.sqrt(d).astype(np.float32)
+    scale = np.zeros(len(n), dtype=np.float32)
+    scale[ok] = np.float32(1.0) / d_sqrt[ok]
+    return n * scale[:, None]
+
+
+def triangle_corners(faces):
+    '''
+        (T,3) indices into the flattened (F*4) tessface corners, one row per triangle.
+        Quads become (0,1,2) and (2,3,0), triangles are recognized by a zero fourth index
+        (blender never stores a quad that way)
+    '''
+    faces = np.asarray(faces, dtype=np.int32)
+    base = np.arange(len(faces), dtype=np.int32)[:, None] * 4
+    corners = np.empty((len(faces), 2, 3), dtype=np.int32)
+    corners[:, 0] = base + (0, 1, 2)
+    corners[:, 1] = base + (2, 3, 0)
+    keep = np.ones((len(faces), 2), dtype=bool)
+    keep[:, 1] = faces[:, 3] != 0
+    return corners[keep]
+
+
+def triangulate(faces):
+    ''' split (F,4) tessface indices into (T,3) triangles, see triangle_corners '''
+    faces = np.asarray(faces, dtype=np.int32)
+    return faces.ravel()[triangle_corners(faces)]
+
+
+def deduplicate_normals(normals):
+    '''
+        (N,3) normals -> (table (K,3), index (N,)) with normals[i] ~ table[index[i]].
+        Components are quantized to NORMAL_QUANTIZE steps and packed into one int64 key per
+        normal, so np.unique sorts plain integers
+    '''
+    normals = normalize(normals)
+    q = np.rint((normals.astype(np.float64) + 1.0) * (NORMAL_QUANTIZE / 2.0)).astype(np.int64)
+    keys = (q[:, 0] << 42) | (q[:, 1] << 21) | q[:, 2]
+    unique, first, index = np.unique(keys, return_index=True, return_inverse=True)
+    return normals[first], index.astype(np.int32).ravel()
+
+
+def pack_arrays(co, no, faces, split=None):
+    '''
+        pack raw mesh arrays into a PackedMesh ready to be written to an MXS object.
+        With split normals the normals are a deduplicated table indexed per triangle corner
+    '''
+    co = np.ascontiguousarray(co, dtype=np.float32)
+    if split is None:
+        return PackedMesh(co, normalize(no), triangulate(faces))
+    corners = triangle_corners(faces)
+    table, index = deduplicate_normals(np.asarray(split, dtype=np.float32).reshape(-1, 3)[corners.ravel()])
+    return PackedMesh(co, table, np.asarray(faces, dtype=np.int32).ravel()[corners], index.reshape(-1, 3))
+
+
+def same_topology(a, b):
+    '''
+        True when PackedMesh b can be written over a as a new position step: same vertices,
+        triangles and normal layout. The normal tables may differ, see conform_normals
+    '''
+    if a.vertices.shape != b.vertices.shape or not np.array_equal(a.triangles, b.triangles):
+        return False
+    if a.normal_triangles is None or b.normal_triangles is None:
+        return a.normal_triangles is b.normal_triangles
+    return a.normal_triangles.shape == b.normal_triangles.shape
+
+
+def conform_normals(reference, packed):
+    '''
+        packed with the normal table layout of reference (same_topology), so write_positions
+        can write it over the mesh created from reference. The deduplicated table is ordered
+        by value and changes with every deformation: entry k becomes the average of the new
+        normals of the corners that used entry k in reference
+    '''
+    if packed.normal_triangles is None:
+        return packed
+    index = reference.normal_triangles.ravel()
+    corners = packed.normals[packed.normal_triangles.ravel()].astype(np.float64)
+    table = np.column_stack([np.bincount(index, corners[:, axis], minlength=len(reference.normals))
+                             for axis in range(3)])
+    return PackedMesh(packed.vertices, normalize(table), reference.triangles, reference.normal_triangles)
+
+
+def pack_mesh(me):
+    ''' convenience wrapper: mesh_arrays + pack_arrays '''
+    return pack_arrays(*mesh_arrays(me))
+
+
+def packed_digest(packed):
+    '''
+        Hash of the packed vertex, normal and index buffers. Meshes with equal digests have
+        identical local geometry and can be exported as instances of each other.
+    '''
+    h = hashlib.sha1()
+    for buf in packed:
+        if buf is None:
+            continue
+        h.update(str(buf.shape).encode('ascii'))
+        h.update(np.ascontiguousarray(buf))
+    return h.hexdigest()
+
+
+def dupli_matrices(dupli_list):
+    ''' world matrices of all items of an object's dupli_list as an (N,4,4) row major array '''
+    m = np.empty(len(dupli_list) * 16, dtype=np.float32)
+    dupli_list.foreach_get("matrix", m)
+    return m.reshape(-1, 4, 4).transpose(0, 2, 1) # RNA hands out column major
+
+
+def matrices_to_base_pivot(matrices, axis_matrix):
+    '''
+        Batched Matrix2CbaseNPivot for an (N,4,4) array of world matrices,
+        returns a list of (base, pivot) maxwell.Base pairs
+    '''
+    m = np.matmul(np.asarray(axis_matrix, dtype=np.float64), np.asarray(matrices, dtype=np.float64))
+    Vector = maxwell.Vector
+    Base = maxwell.Base
+    result = []
+    for o, x, y, z in zip(m[:, :3, 3].tolist(), m[:, :3, 0].tolist(), m[:, :3, 1].tolist(), m[:, :3, 2].tolist()):
+        base = Base().set(Vector(0, 0, 0), Vector(1, 0, 0), Vector(0, 1, 0), Vector(0, 0, 1))
+        base.origin = Vector(*o)
+        pivot = Base().set(Vector(0, 0, 0), Vector(*x), Vector(*y), Vector(*z))
+        result.append((base, pivot))
+    return result
+
+
+def create_mesh(mxs_scene, name, packed, steps=1):
+    '''
+        create a maxwell mesh object named name from a PackedMesh, returns None on failure
+        steps -> position steps for deformation motion blur, packed is written as step 0
+    '''
+    mxs_object = mxs_scene.createMesh(name, len(packed.vertices), len(packed.normals), len(packed.triangles), steps)
+    if mxs_object != None:
+        write_packed(mxs_object, packed)
+        stats.count(triangles=len(packed.triangles), vertices=len(packed.vertices))
+    return mxs_object
+
+
+def write_positions(mxs_object, packed, step=0):
+    ''' vertices and normals of a PackedMesh as position step of a maxwell object '''
+    Vector = maxwell.Vector
+    setVertex = mxs_object.setVertex
+    setNormal = mxs_object.setNormal
+
+    for start in range(0, len(packed.vertices), BATCH_SIZE):
+        for i, (x, y, z) in enumerate(packed.vertices[start:start + BATCH_SIZE].tolist(), start):
+            setVertex(i, step, Vector(x, y, z))
+
+    for start in range(0, len(packed.normals), BATCH_SIZE):
+        for i, (x, y, z) in enumerate(packed.normals[start:start + BATCH_SIZE].tolist(), start):
+            setNormal(i, step, Vector(x, y, z))
+
+
+def write_packed(mxs_object, packed, step=0):
+    '''
+        Feed a PackedMesh into a maxwell object created with createMesh.
+        Without normal_triangles vertex i uses normal i, same as the per element exporter.
+    '''
+    write_positions(mxs_object, packed, step)
+    setTriangle = mxs_object.setTriangle
+    if packed.normal_triangles is None:
+        for start in range(0, len(packed.triangles), BATCH_SIZE):
+            for i, (a, b, c) in enumerate(packed.triangles[start:start + BATCH_SIZE].tolist(), start):
+                setTriangle(i, a, b, c, a, b, c)
+        return
+    for start in range(0, len(packed.triangles), BATCH_SIZE):
+        end = start + BATCH_SIZE
+        for i, ((a, b, c), (na, nb, nc)) in enumerate(zip(packed.triangles[start:end].tolist(),
+                                                          packed.normal_triangles[start:end].tolist()), start):
+            setTriangle(i, a, b, c, na, nb, nc)
@@ -0,0 +1,178 @@
+__author__ = 'Martijn Berger'
+__license__ = "GPL"
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+# Radiance HDR (RGBE) writer for baking environment maps. Pixels are converted and run length
+# encoded as arrays, blocks of scanlines at a time, and go to disk through one buffered writelines.
+
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+HEADER = b'#?RADIANCE\nGAMMA=1\nEXPOSURE=1\nFORMAT=32-bit_rle_rgbe\n\n-Y %d +X %d\n'
+
+# shortest run worth encoding as a run, longest run and literal the format allows
+MIN_RUN = 4
+MAX_RUN = 127
+MAX_LITERAL = 128
+
+# pixels converted and encoded at a time, and the file buffer
+STRIP_PIXELS = 1 << 18
+WRITE_BUFFER = 1 << 22
+
+
+def float_to_rgbe(pixels):
+    ''' (height, width, 3 or 4) floats -> (height, width, 4) uint8 RGBE, alpha is dropped '''
+    rgb = np.asarray(pixels, dtype=np.float32)[..., :3]
+    brightest = rgb.max(axis=-1)
+    mantissa, exponent = np.frexp(brightest)
+    visible = brightest > 1e-32
+    scale = np.zeros_like(brightest)
+    np.divide(mantissa * 256.0, brightest, out=scale, where=visible)
+    rgbe = np.empty(rgb.shape[:-1] + (4,), dtype=np.uint8)
+    rgbe[..., :3] = np.clip(rgb * scale[..., None], 0, 255)
+    rgbe[..., 3] = np.where(visible, exponent + 128, 0)
+    return rgbe
+
+
+def _exclusive_cumsum(a):
+    out = np.zeros(len(a), dtype=np.int64)
+    np.cumsum(a[:-1], out=out[1:])
+    return out
+
+
+def encode_scanlines(rgbe):
+    '''
+        adaptive run length encoding of a (height, width, 4) RGBE image, width 8 to 32767.
+        Every scanline is 2, 2, width and its four channels one after the other, each a mix of
+        runs (128 + length, value) and literals (length, values...).
+    '''
+    height, width = rgbe.shape[:2]
+    # one sequence per scanline channel, in file order
+    sequences = np.ascontiguousarray(rgbe.transpose(0, 2, 1)).reshape(-1, width)
+    flat = sequences.ravel()
+    n = flat.size
+
+    # runs of equal values, never crossing a sequence, split at MAX_RUN
+    change = np.empty(sequences.shape, dtype=bool)
+    change[:, 0] = True
+    np.not_equal(sequences[:, 1:], sequences[:, :-1], out=change[:, 1:])
+    run_start = np.flatnonzero(change)
+    run_length = np.diff(np.append(run_start, n))
+    chunks = (run_length + MAX_RUN - 1) // MAX_RUN
+    chunk_index = np.arange(chunks.sum()) - np.repeat(_exclusive_cumsum(chunks), chunks)
+    chunk_start = np.repeat(run_start, chunks) + chunk_index * MAX_RUN
+    chunk_length = np.minimum(np.repeat(run_length, chunks) - chunk_index * MAX_RUN, MAX_RUN)
+
+    is_run = chunk_length >= MIN_RUN
+    runs = chunk_start[is_run]
+    runs_length = chunk_length[is_run]
+
+    # the rest are literal bytes, grouped into literals of at most MAX_LITERAL within a sequence
+    literal = np.ones(n, dtype=bool)
+    covered = np.repeat(runs, runs_length) + (np.arange(runs_length.sum())
+                                              - np.repeat(_exclusive_cumsum(runs_length), runs_length))
+    literal[covered] = False
+    literal_bytes = np.flatnonzero(literal)
+    group = np.ones(len(literal_bytes), dtype=bool)
+    group[1:] = (literal_bytes[1:] != literal_bytes[:-1] + 1) | (literal_bytes[1:] % width == 0)
+    group_start = np.flatnonzero(group)
+    within = np.arange(len(literal_bytes)) - np.repeat(group_start, np.diff(np.append(group_start, len(literal_bytes))))
+    token = within % MAX_LITERAL == 0
+    literals = literal_bytes[token]
+    literals_length = np.diff(np.append(np.flatnonzero(token), len(literal_bytes)))
+
+    # lay out the tokens in file order, four header bytes before every scanline
+    starts = np.concatenate((runs, literals))
+    sizes = np.concatenate((np.full(len(runs), 2, dtype=np.int64), literals_length + 1))
+    order = np.argsort(starts, kind='stable')
+    offsets = np.empty(len(starts), dtype=np.int64)
+    offsets[order] = _exclusive_cumsum(sizes[order]) + 4 * (starts[order] // (4 * width) + 1)
+
+    out = np.empty(int(sizes.sum()) + 4 * height, dtype=np.uint8)
+    first = order[np.searchsorted(starts[order], np.arange(height) * 4 * width)]
+    line = offsets[first] - 4
+    out[line] = 2
+    out[line + 1] = 2
+    out[line + 2] = width >> 8
+    out[line + 3] = width & 0xff
+
+    run_offsets = offsets[:len(runs)]
+    out[run_offsets] = 128 + runs_length
+    out[run_offsets + 1] = flat[runs]
+
+    literal_offsets = offsets[len(runs):]
+    out[literal_offsets] = literals_length
+    owner = np.cumsum(token) - 1
+    out[literal_offsets[owner] + 1 + (literal_bytes - literals[owner])] = flat[literal_bytes]
+    return out
+
+
+def encode(pixels, flip=False):
+    '''
+        HDR file for pixels as a list of byte strings: header, then blocks of scanlines.
+        Encoding STRIP_PIXELS at a time keeps the index arrays small for 16k maps.
+        flip -> pixels are bottom row first, like blender images
+    '''
+    height, width = np.shape(pixels)[:2]
+    if flip:
+        pixels = pixels[::-1]
+    rle = 8 <= width <= 0x7fff # run length encoding is not allowed at other widths
+    rows = max(1, STRIP_PIXELS // width)
+    parts = [HEADER % (height, width)]
+    for y in range(0, height, rows):
+        rgbe = float_to_rgbe(pixels[y:y + rows])
+        parts.append(encode_scanlines(rgbe) if rle else rgbe.ravel())
+    return parts
+
+
+def write_hdr(filepath, pixels, flip=False):
+    ''' write pixels to filepath in one buffered write, through a temp file so a failed bake leaves no half file '''
+    parts = encode(pixels, flip)
+    tmp = filepath + '.tmp'
+    with open(tmp, 'wb', buffering=WRITE_BUFFER) as f:
+        f.writelines(parts)
+    os.replace(tmp, filepath)
+    return filepath
+
+
+def image_pixels(image):
+    ''' (height, width, 4) float32 pixels of a blender image, call from the main thread '''
+    width, height = image.size
+    pixels = np.empty(width * height * 4, dtype=np.float32) # always RGBA
+    try:
+        image.pixels.foreach_get(pixels)
+    except AttributeError: # older blender, goes through a list of python floats
+        pixels[:] = image.pixels[:]
+    return pixels.reshape(height, width, 4)
+
+
+def write_hdrs(maps, workers=0):
+    '''
+        write several environment maps at once
+        maps -> [(filepath, pixels, flip)], returns the file paths in the same order
+    '''
+    workers = min(len(maps), workers or os.cpu_count() or 1) or 1
+    with ThreadPoolExecutor(workers) as pool:
+        return list(pool.map(lambda m: write_hdr(*m), maps))
+
+
+def bake_images(images, directory, workers=0):
+    ''' blender images -> HDR files named after them in directory, pixels are read here, encoded in parallel '''
+    maps = [(os.path.join(directory, os.path.splitext(image.name)[0] + '.hdr'), image_pixels(image), True)
+            for image in images]
+    return write_hdrs(maps, workers)
@@ -0,0 +1,147 @@
+__author__ = 'Martijn Berger'
+__license__ = "GPL"
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+# Motion blur sampling. The scene is moved to every sub-frame of the shutter once, and at each
+# one the world matrices of all objects and the deformed meshes of the objects that changed
+# are read. Objects that turn out not to move are dropped, the rest are written as maxwell
+# steps by the exporter, which drops their meshes once written.
+
+import math
+
+import bpy
+import numpy as np
+
+from . import geometry
+from ..outputs import MaxwellLog, DEBUG, WARNING
+
+
+def motion_steps(scene):
+    ''' number of motion blur steps the render settings ask for, 1 without motion blur '''
+    if not scene.render.use_motion_blur:
+        return 1
+    return max(1, scene.render.motion_blur_samples)
+
+
+def may_deform(object):
+    ''' objects whose evaluated mesh can change between frames: modifiers or shape keys '''
+    return len(object.modifiers) > 0 or getattr(object.data, 'shape_keys', None) is not None
+
+
+class MotionSamples():
+    '''
+        Per step world matrices (objects and cameras) and deformed PackedMeshes (deforming
+        objects only) of everything that moves while the shutter is open.
+        Step 0 is the current frame, the last step is shutter frames later.
+    '''
+    def __init__(self, steps, shutter):
+        self.steps = steps
+        self.shutter = shutter
+        self.matrices = {}  # object name -> [Matrix] per step
+        self.meshes = {}    # object name -> [PackedMesh] per step, until the exporter wrote it
+        self.no_substeps = False
+
+    def moving(self, name):
+        return name in self.matrices or name in self.meshes
+
+    def times(self):
+        ''' step times relative to the shutter, 0 .. 1 '''
+        if self.steps == 1:
+            return [0.0]
+        return [i / float(self.steps - 1) for i in range(self.steps)]
+
+    def set_base_and_pivot(self, mxs_object, name, axis_matrix_to_base_pivot):
+        ''' place mxs_object at every step, or at step 0 when name does not move '''
+        matrices = self.matrices.get(name)
+        if matrices is None:
+            return False
+        for t, matrix in zip(self.times(), matrices):
+            base, pivot = axis_matrix_to_base_pivot(matrix)
+            if t == 0.0:
+                mxs_object.setBaseAndPivot(base, pivot)
+                continue
+            if self.no_substeps:
+                break
+            try:
+                mxs_object.setBaseAndPivot(base, pivot, t)
+            except TypeError: # binding without transform substeps
+                MaxwellLog('motion blur: object transform steps are not supported', level=WARNING)
+                self.no_substeps = True
+        return True
+
+
+def _evaluate(ob, scene):
+    me = ob.to_mesh(scene, True, 'RENDER')
+    try:
+        return geometry.pack_mesh(me)
+    finally:
+        bpy.data.meshes.remove(me)
+
+
+def sample(scene, objects, steps, shutter, cache=None):
+    '''
+        MotionSamples for objects (meshes and cameras) over steps sub-frames, shutter frames long.
+        Changes the frame steps - 1 times in total and restores it afterwards.
+        A mesh is only evaluated at the steps where its cache key differs from step 0, or at every
+        step when it has none (armatures, simulations), so static meshes with modifiers cost a
+        fingerprint per step instead of a to_mesh.
+        cache -> GeometryCache for the keys, it also gets the step 0 meshes that were evaluated
+    '''
+    motion = MotionSamples(steps, shutter)
+    frame = scene.frame_current
+    deforming = [ob for ob in objects if ob.type == 'MESH' and may_deform(ob)]
+    matrices = {ob.name: [] for ob in objects}
+    keys = {ob.name: [] for ob in deforming}
+    meshes = {ob.name: {} for ob in deforming} # step -> PackedMesh, missing steps equal step 0
+    try:
+        for step, t in enumerate(motion.times()):
+            if t > 0.0:
+                time = frame + t * shutter
+                scene.frame_set(int(math.floor(time)), time - math.floor(time))
+            for ob in objects:
+                matrices[ob.name].append(ob.matrix_world.copy())
+            for ob in deforming:
+                key = cache.key(ob) if cache is not None else None
+                keys[ob.name].append(key)
+                if key is None or key != keys[ob.name][0]:
+                    meshes[ob.name][step] = _evaluate(ob, scene)
+    finally:
+        scene.frame_set(frame)
+
+    for ob in deforming:
+        evaluated = meshes[ob.name]
+        if evaluated and not 0 in evaluated: # changed later on, the frame is back at step 0
+            evaluated[0] = _evaluate(ob, scene)
+            if cache is not None:
+                cache.put(keys[ob.name][0], evaluated[0])
+
+    for name, steps_matrices in matrices.items():
+        first = steps_matrices[0]
+        if any(m != first for m in steps_matrices[1:]):
+            motion.matrices[name] = steps_matrices
+    for name, evaluated in meshes.items():
+        if len(evaluated) < 2:
+            continue
+        first = evaluated[0]
+        packed_steps = [evaluated.get(step, first) for step in range(steps)]
+        evaluated.clear()
+        if not all(geometry.same_topology(first, p) for p in packed_steps[1:]):
+            MaxwellLog('motion blur:', name, 'changes topology, not blurring its deformation', level=DEBUG)
+            continue
+        if any(not np.array_equal(p.vertices, first.vertices) for p in packed_steps[1:]):
+            motion.meshes[name] = [first] + [geometry.conform_normals(first, p) for p in packed_steps[1:]]
+    MaxwellLog('motion blur: %d steps, %d moving and %d deforming objects' %
+               (steps, len(motion.matrices), len(motion.meshes)), level=DEBUG)
+    return motion
@@ -0,0 +1,143 @@
+__author__ = 'Martijn Berger'
+__license__ = "GPL"
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+import os
+import queue
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from . import geometry
+from ..outputs import MaxwellLog, WARNING
+
+
+class ExportPipeline():
+    '''
+        Three stage mesh export
+         - the caller (main thread, the only one allowed to touch bpy) evaluates meshes
+           and copies the raw arrays out with geometry.mesh_arrays
+         - a thread pool packs them (triangulate / normalize, numpy releases the GIL)
+         - a single writer thread feeds the packed buffers to the maxwell scene in submission order,
+           it is the only thread writing to the scene until close(): cameras and other writes go
+           through submit_call
+        The queue between the caller and the writer is bounded so at most max_pending meshes
+        are held in memory at any time, submit_* blocks when it is full.
+        With dedup the workers also hash the packed buffers and the writer turns meshes
+        with identical geometry into instances of the first one.
+    '''
+    def __init__(self, mxs_scene, workers=0, max_pending=0, dedup=False):
+        self.mxs_scene = mxs_scene
+        self.dedup = dedup
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = ThreadPoolExecutor(self.workers)
+        self.queue = queue.Queue(max_pending or self.workers * 2)
+        self.sources = {}       # source key -> instance count, only used from the caller
+        self.mxs_objects = {}   # source key -> maxwell object, only used from the writer
+        self.digests = {}       # geometry digest -> (maxwell object, instance count), writer only
+        self.error = None
+        self.meshes = 0
+        self.instances = 0
+        self.writer = threading.Thread(target=self._write_loop, name='mxs writer', daemon=True)
+        self.writer.start()
+
+    def has_source(self, source):
+        return source in self.sources
+
+    def submit_arrays(self, name, source, arrays, base, pivot, on_packed=None):
+        '''
+            arrays -> (co, normal, faces, split) as returned by geometry.mesh_arrays
+            on_packed -> optional callback receiving the PackedMesh, called on the writer thread
+        '''
+        self.sources[source] = 0
+        future = self.pool.submit(self._pack, arrays)
+        self._put(('mesh', name, source, future, base, pivot, on_packed))
+
+    def submit_packed(self, name, source, packed, base, pivot):
+        self.sources[source] = 0
+        future = self.pool.submit(self._digest, packed)
+        self._put(('mesh', name, source, future, base, pivot, None))
+
+    def submit_instance(self, name, source, base, pivot):
+        ''' instance of an earlier submitted source, named like export_mesh does '''
+        self.sources[source] += 1
+        self._put(('instance', name + str(self.sources[source]), source, None, base, pivot, None))
+
+    def submit_call(self, write, *args):
+        ''' any other scene write (cameras, motion blur meshes), runs write(*args) on the writer in order '''
+        self._put(('call', write, args))
+
+    def close(self):
+        ''' wait for all pending work, re-raises the first error of the writer '''
+        self.queue.put(None)
+        self.writer.join()
+        self.pool.shutdown()
+        if self.error is not None:
+            raise self.error
+
+    def _pack(self, arrays):
+        return self._digest(geometry.pack_arrays(*arrays))
+
+    def _digest(self, packed):
+        return packed, geometry.packed_digest(packed) if self.dedup else None
+
+    def _put(self, job):
+        if self.error is not None:
+            raise self.error
+        self.queue.put(job)
+
+    def _write_loop(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            if self.error is not None:
+                continue # keep draining so the caller never blocks on a full queue
+            try:
+                if job[0] == 'call':
+                    job[1](*job[2])
+                else:
+                    self._write(*job)
+            except Exception as e:
+                self.error = e
+
+    def _write(self, kind, name, source, future, base, pivot, on_packed):
+        if kind == 'instance':
+            if not source in self.mxs_objects:
+                MaxwellLog('could not instance', name, 'source was not created', level=WARNING, key='could not instance')
+                return
+            mxs_object = self.mxs_scene.createInstancement(name, self.mxs_objects[source])
+            self.instances += 1
+        else:
+            packed, digest = future.result()
+            if on_packed is not None:
+                on_packed(packed)
+            if digest in self.digests:
+                orig_mxs_object, i = self.digests[digest]
+                i += 1
+                self.digests[digest] = (orig_mxs_object, i)
+                self.mxs_objects[source] = orig_mxs_object
+                mxs_object = self.mxs_scene.createInstancement(name + str(i), orig_mxs_object)
+                self.instances += 1
+            else:
+                mxs_object = geometry.create_mesh(self.mxs_scene, name, packed)
+                if mxs_object == None:
+                    MaxwellLog('could not create', name, level=WARNING, key='could not create mesh')
+                    return
+                self.mxs_objects[source] = mxs_object
+                if digest is not None:
+                    self.digests[digest] = (mxs_object, 0)
+                self.meshes += 1
+        mxs_object.setBaseAndPivot(base, pivot)
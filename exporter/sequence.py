@@ -0,0 +1,222 @@
+__author__ = 'Martijn Berger'
+__license__ = "GPL"
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+# Animation sequence export: one MXS scene is kept for the whole frame range and written
+# once per frame. Geometry is packed and created in the first frame only, later frames move
+# objects whose matrix changed and rewrite the positions of objects whose mesh deformed.
+# Imported by save_sequence once the exporter module is complete.
+
+import time
+
+from collections import Counter
+
+import bpy
+import numpy as np
+
+from ..maxwell import maxwell
+from ..outputs import MaxwellLog, DEBUG, WARNING
+from ..outputs import stats
+from . import geometry
+from .motion import may_deform
+from . import Matrix2CbaseNPivot, export_camera, set_camera_step, duplicator_renders_self, geometry_cache
+
+STATIC, TRANSFORM, DEFORMING = 'static', 'transform', 'deforming'
+
+
+class SequenceObject():
+    def __init__(self, mxs_object, matrix, packed=None, key=None):
+        self.mxs_object = mxs_object
+        self.matrix = matrix
+        self.packed = packed    # last evaluated mesh, kept for objects that may deform
+        self.key = key          # geometry_cache key of packed, None when it cannot tell changes
+        self.kind = STATIC
+        self.hidden = False
+
+
+class SequenceExporter():
+    '''
+        Exports a frame range into one MXS file per frame.
+         - static objects are packed and created once, objects sharing mesh data are instances
+         - transform only objects get a new base and pivot when their matrix changed
+         - objects with modifiers or shape keys are evaluated again when their cache key changed
+           (or has none: armatures, simulations), changed positions are written into the
+           existing maxwell mesh; a topology change replaces the mesh
+         - objects that become invisible are hidden, cameras get a new step 0
+        Objects are classified as static / transform / deforming by what they did so far,
+        see classification().
+    '''
+    def __init__(self, scene):
+        self.scene = scene
+        self.mxs_scene = maxwell.maxwell()
+        self.objects = {}   # object name -> SequenceObject
+        self.sources = {}   # mesh data pointer -> maxwell mesh of static objects, for instancing
+        self.cameras = {}   # camera name -> maxwell camera
+        self.names = set()  # maxwell object names in use, replaced meshes stay in the scene hidden
+        self.revision = 0
+        self.frames = []    # (frame, seconds, Counter) per exported frame
+
+    def _pack(self, ob):
+        key = geometry_cache.key(ob)
+        packed = geometry_cache.get(key)
+        if packed is None:
+            me = ob.to_mesh(self.scene, True, 'RENDER')
+            try:
+                packed = geometry.pack_mesh(me)
+            finally:
+                bpy.data.meshes.remove(me)
+            geometry_cache.put(key, packed)
+        return packed
+
+    def _evaluate(self, ob):
+        ''' the current deformed mesh, packed by the caller only when its cache key changed '''
+        me = ob.to_mesh(self.scene, True, 'RENDER')
+        try:
+            return geometry.pack_mesh(me)
+        finally:
+            bpy.data.meshes.remove(me)
+
+    def _name(self, name):
+        unique = name
+        while unique in self.names:
+            self.revision += 1
+            unique = '%s.%d' % (name, self.revision)
+        self.names.add(unique)
+        return unique
+
+    def _hide(self, entry, hide):
+        if entry.hidden == hide:
+            return
+        try:
+            entry.mxs_object.setHide(hide)
+            entry.hidden = hide
+        except AttributeError:
+            MaxwellLog('sequence: binding cannot hide objects', level=WARNING, key='sequence: cannot hide')
+
+    def _add(self, ob, changes):
+        key = None
+        if may_deform(ob):
+            key = geometry_cache.key(ob)
+            packed = self._evaluate(ob)
+            mxs_object = geometry.create_mesh(self.mxs_scene, self._name(ob.name), packed)
+        else:
+            packed = None
+            source = self.sources.get(ob.data.as_pointer())
+            if source is not None:
+                mxs_object = self.mxs_scene.createInstancement(self._name(ob.name), source)
+            else:
+                mxs_object = geometry.create_mesh(self.mxs_scene, self._name(ob.name), self._pack(ob))
+                if mxs_object != None:
+                    self.sources[ob.data.as_pointer()] = mxs_object
+        if mxs_object == None:
+            MaxwellLog('could not create', ob.name, level=WARNING, key='could not create mesh')
+            return
+        base, pivot = Matrix2CbaseNPivot(ob.matrix_world)
+        mxs_object.setBaseAndPivot(base, pivot)
+        self.objects[ob.name] = SequenceObject(mxs_object, ob.matrix_world.copy(), packed, key)
+        changes['added'] += 1
+
+    def _update(self, ob, entry, changes):
+        if entry.hidden:
+            self._hide(entry, False)
+            changes['shown'] += 1
+        if ob.matrix_world != entry.matrix:
+            entry.matrix = ob.matrix_world.copy()
+            base, pivot = Matrix2CbaseNPivot(entry.matrix)
+            entry.mxs_object.setBaseAndPivot(base, pivot)
+            if entry.kind == STATIC:
+                entry.kind = TRANSFORM
+            changes['moved'] += 1
+        if entry.packed is None:
+            return
+        key = geometry_cache.key(ob)
+        if key is not None and key == entry.key:
+            return # same mesh, modifiers and shape key values as last frame
+        packed = self._evaluate(ob)
+        old = entry.packed
+        if geometry.same_topology(old, packed):
+            packed = geometry.conform_normals(old, packed)
+            entry.key = key
+            if np.array_equal(packed.vertices, old.vertices) and np.array_equal(packed.normals, old.normals):
+                return
+            geometry.write_positions(entry.mxs_object, packed)
+            stats.count(vertices=len(packed.vertices))
+            entry.packed = packed
+            entry.kind = DEFORMING
+            changes['deformed'] += 1
+            return
+        # topology changed, the maxwell mesh cannot be resized: replace it
+        self._hide(entry, True)
+        del self.objects[ob.name]
+        self._add(ob, Counter())
+        if ob.name in self.objects:
+            self.objects[ob.name].kind = DEFORMING
+        changes['replaced'] += 1
+
+    def _cameras(self):
+        scene = self.scene
+        scale = scene.render.resolution_percentage / 100
+        for ob in scene.objects:
+            if ob.type != 'CAMERA' or not ob.is_visible(scene):
+                continue
+            mxs_camera = self.cameras.get(ob.name)
+            if mxs_camera is None:
+                mxs_camera = self.cameras[ob.name] = export_camera(ob, self.mxs_scene,
+                                                                   round(scene.render.resolution_x * scale),
+                                                                   round(scene.render.resolution_y * scale))
+            else:
+                fStop = ob.data.cycles.aperture_fstop if ob.data.cycles else 5.6
+                set_camera_step(mxs_camera, ob.matrix_world, ob.data.lens / 1000, fStop)
+            if scene.camera is not None and scene.camera.name == ob.name and mxs_camera is not None:
+                mxs_camera.setActive()
+
+    def export_frame(self, filepath):
+        ''' bring the scene up to the current frame and write it to filepath, returns the Counter of changes '''
+        t1 = time.time()
+        scene = self.scene
+        changes = Counter()
+        visible = set()
+        for ob in scene.objects:
+            if ob.type == 'MESH' and ob.is_visible(scene) and (not ob.is_duplicator or duplicator_renders_self(ob)):
+                visible.add(ob.name)
+                entry = self.objects.get(ob.name)
+                if entry is None:
+                    self._add(ob, changes)
+                else:
+                    self._update(ob, entry, changes)
+                stats.sample()
+        for name, entry in self.objects.items():
+            if not name in visible and not entry.hidden:
+                self._hide(entry, True)
+                changes['hidden'] += 1
+        self._cameras()
+
+        if self.mxs_scene.writeMXS(filepath) == 0:
+            MaxwellLog('sequence: error saving', filepath, level=WARNING)
+        seconds = time.time() - t1
+        self.frames.append((scene.frame_current, seconds, changes))
+        MaxwellLog('sequence: frame %d in %.3f sec.' % (scene.frame_current, seconds), dict(changes), level=DEBUG)
+        return changes
+
+    def classification(self):
+        ''' Counter of static / transform / deforming objects over the frames exported so far '''
+        return Counter(entry.kind for entry in self.objects.values())
+
+    def close(self):
+        self.mxs_scene.freeScene()
+
+
+def has_duplicators(scene):
+    return any(ob.is_duplicator and ob.is_visible(scene) for ob in scene.objects)
@@ -25,14 +25,70 @@ from bpy_extras.io_utils import unpack_list, unpack_face_list
 from ..maxwell import maxwell
 
 from .util import *
-from ..outputs import MaxwellLog
+from . import deferred
+from ..outputs import MaxwellLog, DEBUG, WARNING, set_verbosity_from_scene, flush_suppressed
+from ..outputs import stats
 
+try:
+    import numpy as np
+except ImportError: # batched mesh conversion is not available
+    np = None
 
-def translate_material(mat, basepath):
+
+class ImageCache():
+    """
+        Per import cache of texture images keyed by (absolute path, mtime), so a texture shared
+        by many materials is loaded once. Paths that fail to load are remembered and not probed again.
+        reuse_existing -> also hand out images that are already loaded in the blend file
+    """
+    def __init__(self, reuse_existing=True):
+        self.reuse_existing = reuse_existing
+        self.images = {}
+        self.missing = set()
+        self.existing = None
+        self.hits = 0
+        self.loads = 0
+
+    def existing_images(self):
+        if self.existing is None:
+            self.existing = {}
+            for image in bpy.data.images:
+                if image.source == 'FILE' and image.filepath:
+                    self.existing[os.path.normpath(bpy.path.abspath(image.filepath))] = image
+        return self.existing
+
+    def load(self, path):
+        path = os.path.normpath(os.path.abspath(path))
+        if path in self.missing:
+            return None
+        try:
+            key = (path, os.path.getmtime(path))
+        except OSError:
+            self.missing.add(path)
+            return None
+        if key in self.images:
+            self.hits += 1
+            return self.images[key]
+        image = self.existing_images().get(path) if self.reuse_existing else None
+        if image is None:
+            try:
+                image = bpy.data.images.load(path)
+            except RuntimeError:
+                self.missing.add(path)
+                return None
+            self.loads += 1
+        self.images[key] = image
+        return image
+
+
+def translate_material(mat, basepath, images=None):
     """
         mat -> refrence to the maxwell material
         basepath -> string that references filepath where we look for referenced texture files
+        images -> ImageCache shared between the materials of one import
     """
+    if images is None:
+        images = ImageCache(reuse_existing=False)
     bmat = bpy.data.materials.new(mat.name)
     r, g, b = 0.7, 0.7, 0.7
     textures = {}
@@ -51,17 +107,14 @@ def translate_material(mat, basepath):
                 tex_path = attr
             if tex_path:
                 tex = str(tex_path,'UTF-8').replace("\\","/")
-                MaxwellLog("LOADING: {}".format(tex))
+                MaxwellLog("LOADING:", tex, level=DEBUG)
                 tp = basepath + "/" + tex
-                try:
-                    i = bpy.data.images.load(tp)
-                except RuntimeError:
-                    i = None
+                i = images.load(tp)
                 if i:
                     textures[tex] = i
     bmat.diffuse_color = (r, g, b)
     if len(textures) > 0:
-        MaxwellLog(textures)
+        MaxwellLog(textures, level=DEBUG)
         bmat.use_nodes = True
         if bpy.app.version > (2,66,2): #pynodes merge ?
             n = bmat.node_tree.nodes.new('ShaderNodeTexImage')
@@ -78,7 +131,7 @@ def translate_material(mat, basepath):
 class SceneImporter():
     def __init__(self):
         self.filepath = '/tmp/untitled.mxs'
-        self.name_mapping = {}
+        self.names = NameAllocator()
 
     def set_filename(self, filename):
         self.filepath = filename
@@ -126,6 +179,7 @@ class SceneImporter():
         faces = []
         normals = []
         vert_norm = {}
+        corner_norm = [] # normal ids per face corner, in blender corner order
         mats = {}
         mat_index = []
         uvs = []
@@ -146,9 +200,11 @@ class SceneImporter():
               mat_index.append(0)
             if v3 == 0: # eeekadoodle dance
                 faces.append((v2, v3, v1))
+                corner_norm.append((n2, n3, n1))
                 zero_face_start = True
             else:
                 faces.append((v1, v2, v3))
+                corner_norm.append((n1, n2, n3))
                 zero_face_start = False
             vert_norm[v1] = n1
             vert_norm[v2] = n2
@@ -182,7 +238,7 @@ class SceneImporter():
             for k in mats_sorted.keys():
                 me.materials.append(self.materials[k])
         else:
-            MaxwellLog("WARNING OBJECT {} HAS NO MATERIAL".format(obj.getName()))
+            MaxwellLog("WARNING OBJECT", obj.getName(), "HAS NO MATERIAL", level=WARNING, key="WARNING OBJECT ... HAS NO MATERIAL")
 
         me.vertices.foreach_set("co", unpack_list(verts))
         me.vertices.foreach_set("normal",  unpack_list(normals))
@@ -195,32 +251,143 @@ class SceneImporter():
 
         me.update(calc_edges=True)    # Update mesh with new data
         me.validate()
+        corners = set((v, n) for f, c in zip(faces, corner_norm) for v, n in zip(f, c))
+        if len(corners) > len(vert_norm): # some vertex has more than one normal: hard edges
+            table = {}
+            for v, ni in corners:
+                if not ni in table:
+                    n = obj.getNormal(ni, 0)
+                    table[ni] = (n.x, n.y, n.z)
+            for i, f in enumerate(faces):
+                if f[2] == 0: # unpack_face_list rotates these once more
+                    c = corner_norm[i]
+                    corner_norm[i] = (c[1], c[2], c[0])
+            self.set_split_normals(me, [table[n] for c in corner_norm for n in c])
+        stats.count(triangles=obj.getNumTriangles(), vertices=len(verts))
+        return me, len(verts)
+
+    def set_split_normals(self, me, corner_normals):
+        '''
+            custom split normals from one normal per triangle corner, for blender versions that
+            have them. Skipped when validate() removed faces and the corners no longer line up
+        '''
+        if not hasattr(me, 'normals_split_custom_set') or len(me.loops) != len(corner_normals):
+            return False
+        me.polygons.foreach_set("use_smooth", [True] * len(me.polygons))
+        me.use_auto_smooth = True
+        me.normals_split_custom_set(corner_normals)
+        return True
+
+
+    def write_mesh_data_batched(self, obj, name):
+        '''
+            Same result as write_mesh_data but triangles, materials and UVs are collected in
+            preallocated numpy arrays and handed to blender with foreach_set
+        '''
+        uv_layer_count = obj.getNumChannelsUVW()
+        num_tris = obj.getNumTriangles()
+        tris = np.empty((num_tris, 6), dtype=np.int32)
+        mat_index = np.zeros(num_tris, dtype=np.int32)
+        uvw = np.zeros((num_tris if uv_layer_count > 0 else 0, 9), dtype=np.float64)
+        mats = {}
+
+        getTriangle = obj.getTriangle
+        getTriangleMaterial = obj.getTriangleMaterial
+        getTriangleUVW = obj.getTriangleUVW
+        for i in range(num_tris):
+            tris[i] = getTriangle(i)
+            mat = getTriangleMaterial(i)
+            if not mat.isNull():
+                mat_name = mat.name
+                if not mat_name in mats:
+                    mats[mat_name] = len(mats)
+                mat_index[i] = mats[mat_name]
+            if uv_layer_count > 0:
+                uvw[i] = getTriangleUVW(i, 0)
+
+        tri_verts = tris[:, :3]
+        tri_norms = tris[:, 3:]
+
+        # eeekadoodle dance, rotate (v1, v2, 0) to (v2, 0, v1)
+        zero = tri_verts[:, 2] == 0
+        faces = np.zeros((num_tris, 4), dtype=np.int32)
+        faces[:, :3] = tri_verts
+        faces[zero, :3] = tri_verts[zero][:, [1, 2, 0]]
+        again = faces[:, 2] == 0 # degenerate triangles, unpack_face_list rotates these once more
+        faces[again, :3] = faces[again][:, [1, 2, 0]]
+        corner_norms = tri_norms.copy()
+        corner_norms[zero] = corner_norms[zero][:, [1, 2, 0]]
+        corner_norms[again] = corner_norms[again][:, [1, 2, 0]]
+
+        uvs = np.zeros((num_tris, 4, 2), dtype=np.float64)
+        if uv_layer_count > 0:
+            corners = uvw.reshape(-1, 3, 3)[:, :, :2] * (1.0, -1.0)
+            corners[zero] = corners[zero][:, [1, 2, 0]]
+            uvs[:, :3] = corners
+
+        # last normal seen for a vertex wins, like the vert_norm dict does
+        flat_verts = tri_verts.ravel()[::-1]
+        flat_norms = tri_norms.ravel()[::-1]
+        max_vertex = int(flat_verts.max()) if num_tris > 0 else 0
+        used, last = np.unique(flat_verts, return_index=True)
+        vert_norm = np.zeros(max_vertex + 1, dtype=np.int32)
+        vert_norm[used] = flat_norms[last]
+
+        getVertex = obj.getVertex
+        verts = np.empty((max_vertex + 1, 3), dtype=np.float64)
+        for i in range(max_vertex + 1):
+            vert = getVertex(i, 0)
+            verts[i] = vert.x, vert.y, vert.z
+
+        # only fetch each distinct normal once, the corners index the same table
+        getNormal = obj.getNormal
+        normal_ids, corner_index = np.unique(corner_norms, return_inverse=True)
+        corner_index = corner_index.reshape(-1, 3)
+        normal_table = np.empty((len(normal_ids), 3), dtype=np.float64)
+        for j, ni in enumerate(normal_ids.tolist()):
+            n = getNormal(ni, 0)
+            normal_table[j] = n.x, n.y, n.z
+        vertex_index = np.searchsorted(normal_ids, vert_norm).clip(0, max(0, len(normal_ids) - 1))
+        normals = normal_table[vertex_index] if len(normal_ids) else np.zeros((max_vertex + 1, 3))
+        # vertices with more than one distinct normal are on hard edges
+        pairs = np.unique(faces[:, :3].astype(np.int64) * max(1, len(normal_ids)) + corner_index)
+        split = len(pairs) > len(np.unique(faces[:, :3]))
+
+        me = bpy.data.meshes.new(name)
+        me.vertices.add(len(verts))
+        me.tessfaces.add(num_tris)
+        if len(mats) >= 1:
+            mats_sorted = OrderedDict(sorted(mats.items(), key=lambda x: x[1]))
+            for k in mats_sorted.keys():
+                me.materials.append(self.materials[k])
+        else:
+            MaxwellLog("WARNING OBJECT", obj.getName(), "HAS NO MATERIAL", level=WARNING, key="WARNING OBJECT ... HAS NO MATERIAL")
+
+        me.vertices.foreach_set("co", verts.astype(np.float32).ravel())
+        me.vertices.foreach_set("normal", normals.astype(np.float32).ravel())
+        me.tessfaces.foreach_set("vertices_raw", faces.ravel())
+        me.tessfaces.foreach_set("material_index", mat_index)
+        if num_tris > 0:
+            me.tessface_uv_textures.new()
+            me.tessface_uv_textures[0].data.foreach_set("uv_raw", uvs.astype(np.float32).ravel())
+
+        me.update(calc_edges=True)    # Update mesh with new data
+        me.validate()
+        if split:
+            self.set_split_normals(me, normal_table[corner_index].reshape(-1, 3).tolist())
+        stats.count(triangles=obj.getNumTriangles(), vertices=len(verts))
         return me, len(verts)
 
 
     def cleanup_name(self, name):
         '''
-            Create a better name
+            Create a better name, unique within this import (see NameAllocator)
         '''
-        # TODO FIXME should check to see if we insert a double
-        if name in self.name_mapping:
-            return self.name_mapping[name]
-        MaxwellLog('cleaning up {} -> '.format(name, re.match('<(.*)>', name)))
-        try: # strip of ' [0.0.0]' and alike
-            bettername = re.match('(.*) \[\d{1,3}\.\d{1,3}\.\d{1,3}\]', name).group(1)
-        except AttributeError as err:
-            bettername = name
-        try: # strip of '[0]' and alike
-            bettername = re.match('(.*)\[\d{1,3}\]', bettername).group(1)
-        except AttributeError as err:
-            pass
-        while bettername[0] == " ":
-            bettername = bettername[1:]
-        while name in self.name_mapping:
-            name += '_'
-        else: # we found a unique name, lets insert it
-            self.name_mapping[name] = bettername
-            return bettername
+        if name in self.names.mapping:
+            return self.names.mapping[name]
+        bettername = self.names.allocate(name)
+        MaxwellLog('cleaning up', name, '->', bettername, level=DEBUG)
+        return bettername
 
     def find_blender_group(self, name):
         if '#' in name:
@@ -230,7 +397,7 @@ class SceneImporter():
             #MaxwellLog("FOUND {} GROUP".format(bettername))
             return True, bettername
         else:
-            MaxwellLog("COULD NOT FIND GROUP FOR {}".format(bettername))
+            MaxwellLog("COULD NOT FIND GROUP FOR", bettername, level=WARNING, key="COULD NOT FIND GROUP ...")
             return False, name
 
     def write_mesh_object(self, obj, **options):
@@ -246,17 +413,29 @@ class SceneImporter():
                 name = 'corrupt' + str(n)
                 n += 1
 
+            mxs_name = name
             name = self.cleanup_name(name)
 
+            proxy_group = False
             if 'proxy' in name:
-                proxy_group, name = self.find_blender_group(name)
-            else:
-                proxy_group = False
+                # look the group up by the cleaned name without the .001 suffix that made it unique
+                proxy_group, group_name = self.find_blender_group(self.names.normalize(mxs_name))
+                if proxy_group:
+                    name = group_name
 
             base, pivot = obj.getBaseAndPivot()
 
-            if not proxy_group:
-                me, num_verts = self.write_mesh_data(obj, name)
+            if not proxy_group and options.get('deferred_meshes'):
+                mat = obj.getMaterial()
+                material = None if mat.isNull() else getattr(self, 'materials', {}).get(mat.name)
+                me = deferred.placeholder_mesh(name, obj, mxs_name, self.filepath, material)
+                ob = bpy.data.objects.new(name, me)
+                ob.draw_type = 'BOUNDS'
+            elif not proxy_group:
+                if options.get('batched_meshes') and np is not None:
+                    me, num_verts = self.write_mesh_data_batched(obj, name)
+                else:
+                    me, num_verts = self.write_mesh_data(obj, name)
                 ob = bpy.data.objects.new(name, me)
                 if num_verts > self.prefs.draw_bounds:
                     ob.draw_type = 'BOUNDS'
@@ -279,19 +458,19 @@ class SceneImporter():
             self.context.scene.objects.active = ob
 
 
-            if options['apply_scale']:
+            if options['apply_scale'] and not options.get('deferred_meshes'):
                 try:
                     inv_matrix = ob.matrix_basis
                     inv_matrix = inv_matrix.to_3x3().inverted().to_4x4()
                     #MaxwellLog("INV: {}".format(inv_matrix))
                 except ValueError:
-                    MaxwellLog("Cannot invert {}".format(ob.matrix_basis))
+                    MaxwellLog("Cannot invert", ob.matrix_basis, level=WARNING, key="Cannot invert")
                     inv_matrix = Matrix.Identity(4)
             else:
                 inv_matrix = Matrix.Identity(4)
 
 
-            if not proxy_group and options['apply_scale']:
+            if not proxy_group and options['apply_scale'] and not options.get('deferred_meshes'):
                 ob.select = True
                 bpy.ops.object.transform_apply(rotation=True,scale=True)
                 ob.select = False
@@ -301,29 +480,31 @@ class SceneImporter():
 
             return name, (ob, inv_matrix, proxy_group)
         else:
-            MaxwellLog('NOT DONE:', obj.getName(), ' NULL: ', obj.isNull(), '  ', obj.getNumVertexes(), '  ', obj.getNumTriangles())
+            MaxwellLog('NOT DONE:', obj.getName(), ' NULL: ', obj.isNull(), '  ', obj.getNumVertexes(), '  ', obj.getNumTriangles(), level=WARNING, key='NOT DONE')
             return None, None
 
 
-    def write_materials(self):
+    def write_materials(self, **options):
         '''
             Convert Maxwell material to a blender cycles material
         '''
         self.materials = {}
-        MaxwellLog("write_materials : iter")
+        self.images = ImageCache(reuse_existing=options.get('reuse_images', True))
+        index = MaterialIndex(self.context.blend_data.materials)
+        MaxwellLog("write_materials : iter", level=DEBUG)
         for mat in self.mxs_scene.getMaterialsIterator():
             if mat.isNull():
                 continue
             mat_name = mat.name
-            rmat_name = mat_name.rstrip('1234567890')
-            if mat_name in self.context.blend_data.materials:
-                self.materials[mat_name] = self.context.blend_data.materials[mat_name]
-            elif rmat_name in self.context.blend_data.materials:
-                self.materials[mat_name] = self.context.blend_data.materials[rmat_name]
-            elif rmat_name.lower() in self.context.blend_data.materials:
-                self.materials[mat_name] = self.context.blend_data.materials[rmat_name.lower()]
-            else:
-                self.materials[mat_name] = translate_material(mat, self.basepath)
+            bmat = index.resolve(mat_name)
+            if bmat is None:
+                bmat = translate_material(mat, self.basepath, self.images)
+                index.add(bmat) # later MXS materials may resolve to this one
+                index.created += 1
+            self.materials[mat_name] = bmat
+            stats.count(items=1)
+        MaxwellLog("materials: {} matched, {} created".format(index.matched, index.created))
+        MaxwellLog("images: {} loaded, {} reused, {} missing".format(self.images.loads, self.images.hits, len(self.images.missing)))
 
     def write_instances(self):
         '''
@@ -344,7 +525,10 @@ class SceneImporter():
                     mat = mat.name
                 else:
                     mat = 'None'
-                matrix = CbasePivot2Matrix(base,pivot)
+                if np is not None: # converted in one go below
+                    matrix = Cbase2Tuple(base) + Cbase2Tuple(pivot)
+                else:
+                    matrix = CbasePivot2Matrix(base,pivot)
                 key = (parent_name, mat)
                 if key in instances:
                     instances[key].append(matrix)
@@ -352,6 +536,9 @@ class SceneImporter():
                     instances[key] = [matrix]
             #obj = it.next()
         MaxwellLog("instances {}, object,color instanced {}".format(instance_count,len(instances)))
+        if np is not None:
+            for k in instances:
+                instances[k] = CbasePivots2Matrices(instances[k])
 
         imported_count = 0
         for k, v in instances.items():
@@ -359,15 +546,21 @@ class SceneImporter():
 
             max_instances = self.prefs.max_instance
             if not parent_name in self.ob_dict:
-                MaxwellLog('Cannot find object to instance: {}'.format(parent_name))
+                MaxwellLog('Cannot find object to instance:', parent_name, level=WARNING, key='Cannot find object to instance')
                 continue
             if len(v) < max_instances:
-                for w in v:
-                    try:
-                        ob, inv_matrix, proxy_group = self.ob_dict[parent_name]
-                        ob = ob.copy()
+                source_ob, inv_matrix, proxy_group = self.ob_dict[parent_name]
+                if np is not None:
+                    local_matrices = [Matrix(m) for m in ApplyInverseScale(v, inv_matrix).tolist()]
+                else:
+                    local_matrices = []
+                    for w in v:
                         ls = (w.to_3x3() * inv_matrix.to_3x3() ).to_4x4()
                         ls.col[3] = w.col[3]
+                        local_matrices.append(ls)
+                for ls in local_matrices:
+                    try:
+                        ob = source_ob.copy()
                         if not proxy_group:
                             ob.matrix_basis = ls
                             if len(ob.data.vertices) > 5000:
@@ -387,16 +580,19 @@ class SceneImporter():
                     except KeyError:
                         pass
             else:
-                locations = {}
-                for m in v:
-                    l = (m.col[3][0], m.col[3][1], m.col[3][2])
-                    key = (m[0][0], m[0][1], m[0][2], m[1][0], m[1][1], m[1][2], m[2][0], m[2][1], m[2][2])
-                    if key in locations:
-                        t = locations[key][1]
-                        locations[key][0].append((l[0] - t[0],l[1] - t[1],l[2] - t[2] ))
-                    else:
-                        locations[key] = ([(0,0,0)], l)
-                MaxwellLog("{} has more then {} instances ({}) creating {} duplivert groups".format(parent_name, max_instances,len(v),len(locations)))
+                if np is not None:
+                    locations = cluster_transforms(v, self.prefs.instance_tolerance)
+                else:
+                    locations = {}
+                    for m in v:
+                        l = (m.col[3][0], m.col[3][1], m.col[3][2])
+                        key = (m[0][0], m[0][1], m[0][2], m[1][0], m[1][1], m[1][2], m[2][0], m[2][1], m[2][2])
+                        if key in locations:
+                            t = locations[key][1]
+                            locations[key][0].append((l[0] - t[0],l[1] - t[1],l[2] - t[2] ))
+                        else:
+                            locations[key] = ([(0,0,0)], l)
+                MaxwellLog(parent_name, "has more then", max_instances, "instances (", len(v), ") creating", len(locations), "duplivert groups", level=DEBUG)
 
 
 
@@ -441,6 +637,7 @@ class SceneImporter():
 
 
         t2 = time.time()
+        stats.count(items=instance_count)
         MaxwellLog('imported %d of of %d instance in %.4f sec' % (imported_count,instance_count, (t2 - t1)))
         return
 
@@ -452,6 +649,8 @@ class SceneImporter():
             if (not obj.isNull()) and obj.isMesh():
                 name, ob = self.write_mesh_object(obj, **options)
                 self.ob_dict[name] = ob
+                stats.count(items=1)
+                stats.sample()
         t2 = time.time()
         MaxwellLog('imported %d objects in %.4f sec' % (len(self.ob_dict), (t2 - t1)))
 
@@ -460,41 +659,61 @@ class SceneImporter():
         """load a maxwell file"""
         self.context = context
 
+        set_verbosity_from_scene(context.scene)
         MaxwellLog('importing mxs %r' % self.filepath)
 
         addon_name = __name__.split('.')[0]
         self.prefs = addon_prefs = context.user_preferences.addons[addon_name].preferences
 
         time_main = time.time()
+        report = stats.begin('import', self.filepath, self.prefs.profile_stage)
         mxs_scene = maxwell.maxwell()
 
+        # closed in the finally below, whatever happens to the import
+        registered = False
         try:
-            mxs_scene.readMXS(self.filepath)
-        except Exception as e:
-            MaxwellLog('Error reading input file: %s' % self.filepath)
-            MaxwellLog(e)
-        self.mxs_scene = mxs_scene
-
-        time_new = time.time()
-        MaxwellLog('Done parsing mxs %r in %.4f sec.' % (self.filepath, (time_new - time_main)))
-
-        if options['import_camera']:
-            for cam in mxs_scene.getCamerasIterator():
-                self.write_camera(cam)
-            context.scene.camera = bpy.data.objects[mxs_scene.getActiveCamera().getName()]
-
-        if options['import_material']:
-            # READ MATERIALS
-            self.write_materials()
-
-        if options['import_meshes']:
-            self.write_objects(**options)
-        if options['import_instances']:
-            self.write_instances()
-
-
-        t2 = time.time()
-        MaxwellLog('finished importing: %r in %.4f sec.' %
-                (self.filepath, (t2 - time_main)))
-        self.mxs_scene.freeScene()
+            with report.stage('parse'):
+                try:
+                    mxs_scene.readMXS(self.filepath)
+                except Exception as e:
+                    MaxwellLog('Error reading input file: %s' % self.filepath)
+                    MaxwellLog(e)
+            self.mxs_scene = mxs_scene
+
+            time_new = time.time()
+            MaxwellLog('Done parsing mxs %r in %.4f sec.' % (self.filepath, (time_new - time_main)))
+
+            if options['import_camera']:
+                with report.stage('cameras'):
+                    for cam in mxs_scene.getCamerasIterator():
+                        self.write_camera(cam)
+                        stats.count(items=1)
+                    context.scene.camera = bpy.data.objects[mxs_scene.getActiveCamera().getName()]
+
+            if options['import_material']:
+                # READ MATERIALS
+                with report.stage('materials'):
+                    self.write_materials(**options)
+
+            if options['import_meshes']:
+                with report.stage('objects'):
+                    self.write_objects(**options)
+            if options['import_instances']:
+                with report.stage('instances'):
+                    self.write_instances()
+
+            t2 = time.time()
+            MaxwellLog('finished importing: %r in %.4f sec.' %
+                    (self.filepath, (t2 - time_main)))
+            if options.get('deferred_meshes') and options['import_meshes']:
+                # geometry is converted later, keep the scene around for it
+                deferred.register_source(self.filepath, self.mxs_scene, getattr(self, 'materials', None))
+                registered = True
+        finally:
+            if not registered:
+                mxs_scene.freeScene()
+            stats.end()
+            flush_suppressed()
+            if self.prefs.stats_report: # a partial report shows which stage failed
+                report.write_json(self.filepath + '.import.json')
         return {'FINISHED'}
@@ -21,6 +21,7 @@ from .. import MaxwellRenderAddon
 from ..maxwell import maxwell
 
 from .SceneImporter import SceneImporter
+from . import deferred
 
 @MaxwellRenderAddon.addon_register_class
 class ImportMXS(bpy.types.Operator, ImportHelper):
@@ -72,6 +73,24 @@ class ImportMXS(bpy.types.Operator, ImportHelper):
         default=True,
     )
 
+    reuse_images = BoolProperty(
+        name="Reuse Images",
+        description="Use images already loaded in the blend file instead of loading them again",
+        default=True,
+    )
+
+    batched_meshes = BoolProperty(
+        name="Batched Meshes",
+        description="Convert mesh data in bulk using numpy (much faster for large meshes)",
+        default=True,
+    )
+
+    deferred_meshes = BoolProperty(
+        name="Deferred Meshes",
+        description="Only create bounding boxes, convert the real mesh when the object is selected, rendered or exported",
+        default=False,
+    )
+
     def execute(self, context):
         keywords = self.as_keywords(ignore=("axis_forward",
                                             "axis_up",
@@ -92,9 +111,32 @@ class ImportMXS(bpy.types.Operator, ImportHelper):
         row = layout.row(align=True)
         row.prop(self, "handle_proxy_group")
         row.prop(self, "apply_scale")
+        row = layout.row(align=True)
+        row.prop(self, "batched_meshes")
+        row.prop(self, "reuse_images")
+        row = layout.row(align=True)
+        row.prop(self, "deferred_meshes")
+
+@MaxwellRenderAddon.addon_register_class
+class LoadDeferredMXS(bpy.types.Operator):
+    """convert the real geometry of deferred MXS objects"""
+    bl_idname = "object.mxs_load_deferred"
+    bl_label = "Load Deferred MXS Geometry"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    selected_only = BoolProperty(
+        name="Selected Only",
+        default=True,
+    )
+
+    def execute(self, context):
+        objects = context.selected_objects if self.selected_only else context.scene.objects
+        deferred.load_objects(list(objects))
+        return {'FINISHED'}
 
 menu_func = lambda self, context: self.layout.operator(ImportMXS.bl_idname, text="Import Maxwell Scene(.mxs)")
 bpy.types.INFO_MT_file_import.append(menu_func)
+bpy.app.handlers.scene_update_post.append(deferred.scene_update)
 
 
 
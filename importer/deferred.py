@@ -0,0 +1,194 @@
+__author__ = 'Martijn Berger'
+__license__ = "GPL"
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+# Deferred mesh import: objects are created with a bounding box placeholder mesh that
+# remembers where its geometry lives, the real mesh is converted when somebody needs it.
+
+import bpy
+import time
+
+from bpy.app.handlers import persistent
+from ..maxwell import maxwell
+from ..outputs import MaxwellLog
+from .util import MaterialIndex
+
+DEFERRED_KEY = 'mxs_deferred'   # placeholder mesh custom property: MXS object name
+SOURCE_KEY = 'mxs_source'       # placeholder mesh custom property: MXS file path
+
+_sources = {}   # MXS file path -> DeferredSource
+
+
+class DeferredSource():
+    '''
+        An MXS scene kept around so deferred objects can be converted later.
+        The scene is read again on first use when the blend file was reopened.
+    '''
+    def __init__(self, filepath, mxs_scene=None, materials=None):
+        self.filepath = filepath
+        self.mxs_scene = mxs_scene
+        self.materials = materials
+        self.objects = None
+
+    def scene(self):
+        if self.mxs_scene is None:
+            t1 = time.time()
+            self.mxs_scene = maxwell.maxwell()
+            self.mxs_scene.readMXS(self.filepath)
+            MaxwellLog('deferred: read %r in %.4f sec.' % (self.filepath, time.time() - t1))
+        return self.mxs_scene
+
+    def object(self, name):
+        if self.objects is None: # one pass over the scene instead of a search per object
+            self.objects = {}
+            for obj in self.scene().getObjectIterator():
+                if (not obj.isNull()) and obj.isMesh():
+                    try:
+                        self.objects[obj.getName()] = obj
+                    except UnicodeDecodeError:
+                        pass
+        return self.objects.get(name)
+
+    def material_map(self):
+        if self.materials is None:
+            index = MaterialIndex(bpy.data.materials)
+            self.materials = {}
+            for mat in self.scene().getMaterialsIterator():
+                if not mat.isNull():
+                    self.materials[mat.name] = index.resolve(mat.name)
+        return self.materials
+
+    def close(self):
+        if self.mxs_scene is not None:
+            self.mxs_scene.freeScene()
+            self.mxs_scene = None
+            self.objects = None
+
+
+def register_source(filepath, mxs_scene, materials):
+    ''' keep mxs_scene open for deferred objects imported from filepath '''
+    if filepath in _sources:
+        _sources[filepath].close()
+    _sources[filepath] = DeferredSource(filepath, mxs_scene, materials)
+
+def get_source(filepath):
+    if not filepath in _sources:
+        _sources[filepath] = DeferredSource(filepath)
+    return _sources[filepath]
+
+def close_sources():
+    for source in _sources.values():
+        source.close()
+    _sources.clear()
+
+
+def object_bounds(obj):
+    ''' (min, max) corners of a maxwell object in its local space '''
+    try:
+        bmin, bmax = obj.getBoundingBox()
+        return (bmin.x, bmin.y, bmin.z), (bmax.x, bmax.y, bmax.z)
+    except AttributeError: # older binding, scan the vertices
+        lo = [float('inf')] * 3
+        hi = [float('-inf')] * 3
+        for i in range(obj.getNumVertexes()):
+            v = obj.getVertex(i, 0)
+            for axis, c in enumerate((v.x, v.y, v.z)):
+                lo[axis] = min(lo[axis], c)
+                hi[axis] = max(hi[axis], c)
+        return tuple(lo), tuple(hi)
+
+def placeholder_mesh(name, obj, mxs_name, filepath, material=None):
+    '''
+        Box mesh spanning the bounds of obj, tagged with where the real geometry is
+    '''
+    (x0, y0, z0), (x1, y1, z1) = object_bounds(obj)
+    verts = [(x0, y0, z0), (x1, y0, z0), (x1, y1, z0), (x0, y1, z0),
+             (x0, y0, z1), (x1, y0, z1), (x1, y1, z1), (x0, y1, z1)]
+    faces = [(0, 1, 2, 3), (4, 7, 6, 5), (0, 4, 5, 1), (1, 5, 6, 2), (2, 6, 7, 3), (3, 7, 4, 0)]
+    me = bpy.data.meshes.new(name)
+    me.from_pydata(verts, [], faces)
+    me.update()
+    if material is not None: # so per object material overrides on instances have a slot
+        me.materials.append(material)
+    me[DEFERRED_KEY] = mxs_name
+    me[SOURCE_KEY] = filepath
+    return me
+
+
+def is_deferred(ob):
+    return ob.type == 'MESH' and ob.data is not None and DEFERRED_KEY in ob.data
+
+def placeholder_users():
+    ''' placeholder mesh pointer -> objects using it, one pass over bpy.data.objects '''
+    users = {}
+    for user in bpy.data.objects:
+        if is_deferred(user):
+            users.setdefault(user.data.as_pointer(), []).append(user)
+    return users
+
+def load(ob, users=None):
+    '''
+        Replace the placeholder mesh of ob, and of every object sharing it, with the real geometry
+        users -> placeholder_users() when loading several objects, computed here otherwise
+    '''
+    from .SceneImporter import SceneImporter, np
+
+    placeholder = ob.data
+    source = get_source(placeholder[SOURCE_KEY])
+    obj = source.object(placeholder[DEFERRED_KEY])
+    if obj is None:
+        MaxwellLog('deferred: {} not found in {}'.format(placeholder[DEFERRED_KEY], source.filepath))
+        del placeholder[DEFERRED_KEY]
+        return False
+
+    importer = SceneImporter()
+    importer.materials = source.material_map()
+    if np is not None:
+        me, num_verts = importer.write_mesh_data_batched(obj, placeholder.name)
+    else:
+        me, num_verts = importer.write_mesh_data(obj, placeholder.name)
+
+    addon_name = __name__.split('.')[0]
+    draw_bounds = bpy.context.user_preferences.addons[addon_name].preferences.draw_bounds
+    if users is None:
+        users = placeholder_users()
+    for user in users.pop(placeholder.as_pointer(), [ob]):
+        user.data = me
+        user.draw_type = 'BOUNDS' if num_verts > draw_bounds else 'TEXTURED'
+    bpy.data.meshes.remove(placeholder)
+    return True
+
+def load_objects(objects):
+    ''' load every deferred object in objects, returns how many meshes were converted '''
+    t1 = time.time()
+    count = 0
+    objects = [ob for ob in objects if is_deferred(ob)]
+    if not objects:
+        return 0
+    users = placeholder_users()
+    for ob in objects:
+        if is_deferred(ob) and load(ob, users): # an earlier load may have converted a shared mesh
+            count += 1
+    if count:
+        MaxwellLog('deferred: loaded %d meshes in %.4f sec.' % (count, time.time() - t1))
+    return count
+
+
+@persistent
+def scene_update(scene):
+    ''' load geometry as soon as a deferred object becomes the selected active object '''
+    ob = scene.objects.active
+    if ob is not None and ob.select and is_deferred(ob):
+        load_objects([ob])
@@ -14,9 +14,17 @@ __license__ = "GPL"
 # You should have received a copy of the GNU General Public License
 # along with this program; if not, see <http://www.gnu.org/licenses/>.
 
+import re
+
+from collections import OrderedDict
 from mathutils import Matrix, Vector
 from bpy_extras.io_utils import axis_conversion
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 AxisMatrix3  = axis_conversion(from_forward='-Z', from_up='Y', to_forward='Y', to_up='Z')
 
 AxisMatrix = AxisMatrix3.to_4x4()
@@ -45,4 +53,149 @@ def Cbase2Matrix4(b):
                    (0,   0,   0,   1)])
 
 def Cvector2Vector(v):
-    return Vector((v.x, v.y, v.z))
\ No newline at end of file
+    return Vector((v.x, v.y, v.z))
+
+def Cbase2Tuple(b):
+    ''' flat (x, y, z, origin) components of a Cbase, 12 floats '''
+    x = b.x
+    y = b.y
+    z = b.z
+    o = b.origin
+    return (x.x, x.y, x.z, y.x, y.y, y.z, z.x, z.y, z.z, o.x, o.y, o.z)
+
+def Cbases2Matrices(values):
+    ''' (N,12) Cbase2Tuple rows -> (N,4,4) array, same layout as Cbase2Matrix4 '''
+    v = np.asarray(values, dtype=np.float64).reshape(-1, 4, 3)
+    m = np.zeros((len(v), 4, 4))
+    m[:, :3, :] = v.transpose(0, 2, 1)
+    m[:, 3, 3] = 1.0
+    return m
+
+def CbasePivots2Matrices(values):
+    '''
+        batched CbasePivot2Matrix
+        values -> (N,24) rows of Cbase2Tuple(base) + Cbase2Tuple(pivot)
+        returns (N,4,4) array
+    '''
+    v = np.asarray(values, dtype=np.float64).reshape(-1, 24)
+    return np.matmul(np.matmul(np.array(AxisMatrix), Cbases2Matrices(v[:, :12])), Cbases2Matrices(v[:, 12:]))
+
+def ApplyInverseScale(matrices, inv_matrix):
+    '''
+        batched version of: ls = (w.to_3x3() * inv_matrix.to_3x3()).to_4x4(); ls.col[3] = w.col[3]
+        matrices -> (N,4,4) array, returns (N,4,4) array
+    '''
+    m = np.asarray(matrices, dtype=np.float64)
+    out = np.zeros_like(m)
+    out[:, :3, :3] = np.matmul(m[:, :3, :3], np.array(inv_matrix.to_3x3()))
+    out[:, :, 3] = m[:, :, 3]
+    return out
+
+class NameAllocator():
+    '''
+        Maps MXS names to cleaned up, unique blender names.
+         - ' [0.0.0]' and '[0]' style suffixes and leading spaces are stripped
+         - asking again for the same MXS name gives the same blender name
+         - clashing names get a .001, .002, ... suffix, the next free number is kept per base name
+           so allocation does not depend on how many names share a base
+    '''
+    version_suffix = re.compile(r'(.*) \[\d{1,3}\.\d{1,3}\.\d{1,3}\]')
+    index_suffix = re.compile(r'(.*)\[\d{1,3}\]')
+    max_length = 63 # blender ID name limit
+
+    def __init__(self):
+        self.mapping = {}   # MXS name -> blender name
+        self.used = set()   # blender names handed out
+        self.counters = {}  # base name -> next suffix to try
+
+    def normalize(self, name):
+        m = self.version_suffix.match(name)
+        if m:
+            name = m.group(1)
+        m = self.index_suffix.match(name)
+        if m:
+            name = m.group(1)
+        return name.lstrip(' ')[:self.max_length]
+
+    def allocate(self, name):
+        if name in self.mapping:
+            return self.mapping[name]
+        base = self.normalize(name)
+        unique = base
+        if unique in self.used:
+            n = self.counters.get(base, 1)
+            while True:
+                suffix = '.%03d' % n
+                unique = base[:self.max_length - len(suffix)] + suffix
+                n += 1
+                if not unique in self.used:
+                    break
+            self.counters[base] = n
+        self.used.add(unique)
+        self.mapping[name] = unique
+        return unique
+
+class MaterialIndex():
+    '''
+        Name index over existing blender materials, built once per import.
+        resolve() tries the MXS name as is, without trailing digits and lower cased
+        without trailing digits, in that order, each a dict lookup.
+    '''
+    def __init__(self, materials):
+        self.exact = {}
+        for m in materials:
+            self.add(m)
+        self.matched = 0
+        self.created = 0
+
+    def add(self, material):
+        self.exact[material.name] = material
+
+    def resolve(self, name):
+        stripped = name.rstrip('1234567890')
+        for key in (name, stripped, stripped.lower()):
+            if key in self.exact:
+                self.matched += 1
+                return self.exact[key]
+        return None
+
+def group_rows(keys):
+    '''
+        Give every distinct row of the (N,K) array keys a group id, returns (N,) ids.
+        Uses lexsort so it works without np.unique(axis=...)
+    '''
+    keys = np.asarray(keys)
+    if len(keys) == 0:
+        return np.zeros(0, dtype=np.int64)
+    order = np.lexsort(keys.T[::-1])
+    ordered = keys[order]
+    new_group = np.ones(len(keys), dtype=bool)
+    new_group[1:] = np.any(ordered[1:] != ordered[:-1], axis=1)
+    ids = np.empty(len(keys), dtype=np.int64)
+    ids[order] = np.cumsum(new_group) - 1
+    return ids
+
+def cluster_transforms(matrices, tolerance=0.0):
+    '''
+        Group 4x4 matrices whose 3x3 rotation/scale part matches within tolerance
+        (quantized to a grid of that size, 0 means exact match).
+        returns {rotation 9-tuple of the first member: (offsets to the first location, first location)}
+    '''
+    m = np.asarray(matrices, dtype=np.float64).reshape(-1, 4, 4)
+    rot = m[:, :3, :3].reshape(-1, 9)
+    loc = m[:, :3, 3]
+    if tolerance > 0:
+        keys = np.floor(rot / tolerance + 0.5).astype(np.int64)
+    else:
+        keys = rot
+    groups = group_rows(keys)
+    order = np.argsort(groups, kind='mergesort') # stable, first member stays in front
+    bounds = np.flatnonzero(np.diff(groups[order])) + 1
+    result = OrderedDict()
+    for members in np.split(order, bounds):
+        if len(members) == 0:
+            continue
+        first = members[0]
+        t = loc[first]
+        result[tuple(rot[first].tolist())] = ((loc[members] - t).tolist(), tuple(t.tolist()))
+    return result
@@ -16,12 +16,67 @@ __license__ = "GPL"
 
 # contains a lot of code inspired / shamelessly copied from luxblend25
 
+import time
+
+from collections import deque
 from extensions_framework import log
 
-def MaxwellLog(*args, popup=False):
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+# maxwell_engine.log_verbosity -> lowest level that is emitted
+VERBOSITY_LEVELS = {'verbose': DEBUG, 'default': INFO, 'quiet': WARNING}
+
+class LogState():
+    '''
+        level -> messages below this level are dropped before they are formatted
+        burst -> messages sharing a key are shown this many times, the rest is counted
+        recent -> ring buffer of the last emitted messages (time, level, text)
+    '''
+    def __init__(self, burst=5, history=1000):
+        self.level = INFO
+        self.burst = burst
+        self.counts = {}
+        self.recent = deque(maxlen=history)
+
+_state = LogState()
+
+def MaxwellLog(*args, popup=False, level=INFO, key=None):
     '''
     Send string to AF log, marked as belonging to Mitsuba module.
-    Accepts variable args
+    Accepts variable args, they are only formatted when the message is actually emitted.
+    level -> DEBUG, INFO, WARNING or ERROR, see set_verbosity
+    key -> rate limit messages sharing this key, see flush_suppressed
     '''
-    if len(args) > 0:
-        log(' '.join(['%s'%a for a in args]), module_name='Maxwell', popup=popup)
\ No newline at end of file
+    if len(args) == 0 or level < _state.level:
+        return
+    if key is not None:
+        n = _state.counts.get(key, 0) + 1
+        _state.counts[key] = n
+        if n > _state.burst:
+            return
+    message = ' '.join(['%s'%a for a in args])
+    _state.recent.append((time.time(), level, message))
+    log(message, module_name='Maxwell', popup=popup)
+
+def set_verbosity(verbosity):
+    ''' verbosity -> one of the maxwell_engine log_verbosity values '''
+    _state.level = VERBOSITY_LEVELS.get(verbosity, INFO)
+
+def set_verbosity_from_scene(scene):
+    engine = getattr(scene, 'maxwell_engine', None)
+    set_verbosity(getattr(engine, 'log_verbosity', 'default'))
+
+def flush_suppressed():
+    ''' log one summary line per rate limited key, e.g. "COULD NOT FIND GROUP (x4123)" '''
+    counts, _state.counts = _state.counts, {}
+    for key, n in counts.items():
+        if n > _state.burst:
+            MaxwellLog('{} (x{}, {} not shown)'.format(key, n, n - _state.burst), level=WARNING)
+
+def recent_messages(count=None):
+    ''' the last emitted messages for post-mortem inspection, oldest first '''
+    messages = ['%.3f %d %s' % m for m in _state.recent]
+    return messages if count is None else messages[-count:]
\ No newline at end of file
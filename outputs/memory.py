@@ -0,0 +1,81 @@
+__author__ = 'Martijn Berger'
+__license__ = "GPL"
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+
+try:
+    import resource
+except ImportError: # windows
+    resource = None
+
+_page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def current_rss():
+    '''
+        resident memory of this process in bytes, falls back to the lifetime peak
+        where the current value is not available and to 0 when neither is
+    '''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _page_size
+    except (IOError, OSError, IndexError, ValueError):
+        pass
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+    return 0
+
+
+def format_bytes(n):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(n) < 1024.0:
+            return '%.1f %s' % (n, unit)
+        n /= 1024.0
+    return '%.1f TB' % n
+
+
+class MemoryTracker():
+    '''
+        Keeps the highest resident memory seen between start() and the last sample(),
+        sample often (e.g. once per object, or tick() per instance) to get a useful peak
+    '''
+    def __init__(self, interval=256):
+        self.interval = interval
+        self.ticks = 0
+        self.start()
+
+    def start(self):
+        self.baseline = self.peak = current_rss()
+        return self
+
+    def sample(self):
+        rss = current_rss()
+        if rss > self.peak:
+            self.peak = rss
+        return rss
+
+    def tick(self, force=False):
+        ''' sample() every interval calls or when forced, for loops over millions of items '''
+        self.ticks += 1
+        if force or self.ticks >= self.interval:
+            self.ticks = 0
+            return self.sample()
+
+    def report(self):
+        return 'peak memory {} ({} above start)'.format(format_bytes(self.peak),
+                                                        format_bytes(self.peak - self.baseline))
@@ -0,0 +1,144 @@
+__author__ = 'Martijn Berger'
+__license__ = "GPL"
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+# Per stage timing and counters for import / export. Code doing the work calls
+# count() without knowing whether a report is being collected.
+
+import cProfile
+import json
+import threading
+import time
+
+from contextlib import contextmanager
+
+from .memory import MemoryTracker
+
+_active = None
+_last = None
+
+
+class Stage():
+    def __init__(self, name):
+        self.name = name
+        self.wall = 0.0
+        self.items = 0
+        self.triangles = 0
+        self.vertices = 0
+        self.peak_memory = 0
+        self.memory = MemoryTracker()
+
+    def as_dict(self):
+        def rate(n):
+            return n / self.wall if self.wall > 0 else 0.0
+        return {'name': self.name,
+                'wall': self.wall,
+                'items': self.items,
+                'triangles': self.triangles,
+                'vertices': self.vertices,
+                'items_per_sec': rate(self.items),
+                'triangles_per_sec': rate(self.triangles),
+                'vertices_per_sec': rate(self.vertices),
+                'peak_memory': self.peak_memory,
+                'memory_growth': self.peak_memory - self.memory.baseline}
+
+
+class Report():
+    '''
+        Timings of one import or export.
+        profile_stage -> name of a stage to run under cProfile, stats go to profile_path
+    '''
+    def __init__(self, kind, source, profile_stage='', profile_path=None):
+        self.kind = kind
+        self.source = source
+        self.profile_stage = profile_stage
+        self.profile_path = profile_path or source + '.' + kind + '.prof'
+        self.stages = []
+        self.current = None
+        self.started = time.time()
+        self.finished = None
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        stage = Stage(name)
+        previous, self.current = self.current, stage
+        profiler = cProfile.Profile() if name == self.profile_stage else None
+        t1 = time.time()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield stage
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(self.profile_path)
+            stage.wall = time.time() - t1
+            stage.memory.sample()
+            stage.peak_memory = stage.memory.peak
+            self.stages.append(stage)
+            self.current = previous
+
+    def count(self, items=0, triangles=0, vertices=0):
+        stage = self.current
+        if stage is None:
+            return
+        with self.lock: # the export pipeline counts from its writer thread
+            stage.items += items
+            stage.triangles += triangles
+            stage.vertices += vertices
+
+    def sample(self):
+        if self.current is not None:
+            self.current.memory.sample()
+
+    def as_dict(self):
+        return {'kind': self.kind,
+                'source': self.source,
+                'started': self.started,
+                'wall': (self.finished or time.time()) - self.started,
+                'profile_stage': self.profile_stage or None,
+                'stages': [s.as_dict() for s in self.stages]}
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2, sort_keys=True)
+
+
+def begin(kind, source, profile_stage=''):
+    ''' start collecting a report, count() / sample() go to it until end() '''
+    global _active
+    _active = Report(kind, source, profile_stage)
+    return _active
+
+def end():
+    global _active, _last
+    report, _active = _active, None
+    if report is not None:
+        report.finished = time.time()
+        _last = report
+    return report
+
+def last():
+    ''' the most recently finished report, e.g. for a batch job to pick up after save / load '''
+    return _last
+
+def count(items=0, triangles=0, vertices=0):
+    if _active is not None:
+        _active.count(items, triangles, vertices)
+
+def sample():
+    if _active is not None:
+        _active.sample()
@@ -11,21 +11,132 @@ class maxwell_engine(declarative_property_group):
 
     ef_attach_to = ['Scene']
 
-    controls = ['log_verbosity']
+    controls = [
+        'log_verbosity',
+        'maxwell_path',
+        ['sampling_level', 'render_time'],
+        'viewport_sampling_level',
+        ['threads_auto', 'threads'],
+        'refresh_interval',
+        'farm_nodes',
+        ['cooperative', 'farm_seeds'],
+        'farm_retries',
+    ]
 
-    visibility = {}
+    visibility = {
+        'threads': {'threads_auto': False},
+        'farm_seeds': {'cooperative': True},
+    }
 
     alert = {}
 
     properties = [
+        {
+            'type': 'enum',
+            'attr': 'log_verbosity',
+            'name': 'Log Verbosity',
+            'description': 'Logging verbosity of the Maxwell importer / exporter',
+            'default': 'default',
+            'items': [
+                ('verbose', 'Verbose', 'Log everything, including per object messages'),
+                ('default', 'Default', 'Log progress and warnings'),
+                ('quiet', 'Quiet', 'Only log warnings and errors'),
+            ]
+        },
         {
             'type': 'bool',
             'attr': 'threads_auto',
             'name': 'Auto Threads',
             'description': 'Let LuxRender decide how many threads to use',
             'default': True
-        }
-
+        },
+        {
+            'type': 'int',
+            'attr': 'threads',
+            'name': 'Threads',
+            'description': 'Number of render threads',
+            'default': 4,
+            'min': 1,
+            'max': 256,
+        },
+        {
+            'type': 'string',
+            'subtype': 'FILE_PATH',
+            'attr': 'maxwell_path',
+            'name': 'Maxwell Executable',
+            'description': 'Maxwell command line renderer (empty: maxwell on PATH, MAXWELL_EXECUTABLE overrides)',
+            'default': '',
+        },
+        {
+            'type': 'float',
+            'attr': 'sampling_level',
+            'name': 'Sampling Level',
+            'description': 'Stop rendering at this sampling level',
+            'default': 12.0,
+            'min': 1.0,
+            'max': 50.0,
+        },
+        {
+            'type': 'float',
+            'attr': 'render_time',
+            'name': 'Time (min)',
+            'description': 'Stop rendering after this many minutes',
+            'default': 10.0,
+            'min': 0.1,
+            'soft_max': 1440.0,
+        },
+        {
+            'type': 'float',
+            'attr': 'viewport_sampling_level',
+            'name': 'Viewport Sampling Level',
+            'description': 'Stop refining the interactive viewport render at this sampling level',
+            'default': 6.0,
+            'min': 1.0,
+            'max': 50.0,
+        },
+        {
+            'type': 'float',
+            'attr': 'refresh_interval',
+            'name': 'Refresh Interval (sec)',
+            'description': 'How often the render result is reloaded while Maxwell refines it',
+            'default': 2.0,
+            'min': 0.1,
+            'max': 600.0,
+        },
+        {
+            'type': 'int',
+            'attr': 'farm_nodes',
+            'name': 'Render Nodes',
+            'description': 'Renderer processes for cooperative and farm renders, started on this machine',
+            'default': 2,
+            'min': 1,
+            'max': 64,
+        },
+        {
+            'type': 'bool',
+            'attr': 'cooperative',
+            'name': 'Cooperative',
+            'description': 'Render the frame once per seed on the render nodes and merge the results',
+            'default': False
+        },
+        {
+            'type': 'int',
+            'attr': 'farm_seeds',
+            'name': 'Seeds',
+            'description': 'Number of cooperative renders merged into the frame',
+            'default': 4,
+            'min': 2,
+            'max': 256,
+        },
+        {
+            'type': 'int',
+            'attr': 'farm_retries',
+            'name': 'Retries',
+            'description': 'How often a failed farm job is rendered again before it is given up',
+            'default': 2,
+            'min': 0,
+            'max': 10,
+        },
     ]
 
 
@@ -29,3 +29,4 @@ class networking(render_panel):
 
     def draw(self, context):
         super().draw(context)
+        self.layout.operator('render.maxwell_farm')